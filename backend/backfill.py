@@ -0,0 +1,63 @@
+"""
+Shared driver for the one-off backfill scripts (migrate_*.py)
+
+Each script names the documents it still has to fix (a filter that only
+matches unmigrated documents) and how to compute the missing fields. Both
+debts and debts_archive are processed in _id order in bounded bulk writes,
+so a backfill can be interrupted and re-run.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from pymongo import UpdateOne
+
+import server
+
+
+async def backfill_collection(
+    collection, query: dict, projection: dict, fields: Callable[[dict], dict], batch_size: int, dry_run: bool
+) -> int:
+    """Set fields(document) on every document matching query; returns documents processed"""
+    processed = 0
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = await collection.find(
+            batch_query, {"_id": 1, **projection}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        if not dry_run:
+            await collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": fields(doc)}) for doc in batch
+            ], ordered=False)
+        processed += len(batch)
+        print(f"{collection.name}: {processed} documents {'checked' if dry_run else 'migrated'}")
+    return processed
+
+
+async def backfill(description: str, query: dict, projection: dict, fields: Callable[[dict], dict]):
+    """Command-line entry point shared by the migrate_*.py scripts"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Count documents without writing")
+    args = parser.parse_args()
+
+    client = server.create_mongo_client()
+    database = client[server.DB_NAME]
+    started = time.perf_counter()
+    total = 0
+    for collection in (database.debts, database.debts_archive):
+        total += await backfill_collection(collection, query, projection, fields, args.batch_size, args.dry_run)
+    client.close()
+    print(f"Done: {total} documents in {time.perf_counter() - started:.1f}s")
+
+
+def run(description: str, query: dict, projection: dict, fields: Callable[[dict], dict]):
+    asyncio.run(backfill(description, query, projection, fields))
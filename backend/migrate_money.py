@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Backfill integer minor-unit money fields on existing debts
+
+    python migrate_money.py [--batch-size 1000] [--dry-run]
+
+Adds amount_minor and amount_in_try_minor to documents in debts and
+debts_archive that were written before money was stored in minor units.
+Until then, aggregations round the float amounts per document instead.
+"""
+
+import server
+from backfill import run
+
+UNMIGRATED = {"$or": [{"amount_minor": {"$exists": False}}, {"amount_in_try_minor": {"$exists": False}}]}
+
+
+def money_fields(document: dict) -> dict:
+    return server.money_fields(document.get("amount") or 0.0, document.get("amount_in_try") or 0.0)
+
+
+if __name__ == "__main__":
+    run("Backfill integer minor-unit money fields", UNMIGRATED, {"amount": 1, "amount_in_try": 1}, money_fields)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Backfill folded person names used by debt search and autocomplete
+
+    python migrate_search.py [--batch-size 1000] [--dry-run]
+
+Adds person_name_folded to documents in debts and debts_archive that were
+written before search existed. Until this has run, such debts are missing
+from autocomplete.
+"""
+
+import server
+from backfill import run
+
+UNMIGRATED = {"person_name_folded": {"$exists": False}}
+
+
+def search_fields(document: dict) -> dict:
+    return {"person_name_folded": server.fold_text(document.get("person_name", ""))}
+
+
+if __name__ == "__main__":
+    run("Backfill folded person names for search", UNMIGRATED, {"person_name": 1}, search_fields)
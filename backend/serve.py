@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Multi-worker launcher for the backend
+
+    python serve.py --workers 4 --port 8001
+
+Runs uvicorn with several worker processes and switches shared state to
+MongoDB so the workers stay coherent:
+- SHARED_STATE_BACKEND=mongo: one worker refreshes the exchange-rate snapshot
+  under a lease and the others read it; user-cache invalidations are
+  broadcast through a capped collection
+- RATE_LIMIT_BACKEND=mongo: login/register limits are counted across workers
+- PROMETHEUS_MULTIPROC_DIR: /metrics aggregates every worker's metrics
+
+Any of these can be overridden by setting the variable explicitly.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import uvicorn
+
+ROOT_DIR = Path(__file__).parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the backend with multiple worker processes")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Worker processes (default: WEB_CONCURRENCY or the CPU count)"
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        os.environ.setdefault("SHARED_STATE_BACKEND", "mongo")
+        os.environ.setdefault("RATE_LIMIT_BACKEND", "mongo")
+        # Metric files from a previous run would be merged into this one
+        metrics_dir = os.environ.setdefault(
+            "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "debt-tracker-metrics")
+        )
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        app_dir=str(ROOT_DIR),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,199 +1,3845 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+from bson import ObjectId
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
 import os
 import logging
+import logging.handlers
+import queue
+import time
+import asyncio
+import hmac
+import json
+import math
+import platform
+import random
+import sys
+import threading
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from functools import partial
+from io import BytesIO
 from pathlib import Path
+from urllib.parse import quote
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter as StackCounter, OrderedDict, defaultdict
+from itertools import chain, islice, takewhile
+import calendar
+import copy
+import hashlib
+import heapq
 import uuid
-from datetime import datetime, timedelta
+import re
+import shutil
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
 import jwt
+import numpy as np
 from passlib.context import CryptContext
 import requests
 from enum import Enum
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+PROCESS_STARTED = time.perf_counter()
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Metrics
+#
+# Labels are restricted to route templates, HTTP methods, status codes and
+# known MongoDB command names so series cardinality stays bounded.
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"]
+)
+HTTP_REQUESTS_TOTAL = Counter(
+    "http_requests_total", "HTTP responses by route template and status code",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ["method"],
+    multiprocess_mode="livesum"
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ["collection", "command"]
+)
+FX_FETCH_DURATION = Histogram(
+    "exchange_rate_fetch_duration_seconds", "Latency of upstream exchange-rate fetches"
+)
+FX_FETCH_FAILURES = Counter(
+    "exchange_rate_fetch_failures_total", "Failed upstream exchange-rate fetches", ["reason"]
+)
+FX_FALLBACKS = Counter(
+    "exchange_rate_fallbacks_total", "Times the hard-coded fallback rates were served"
+)
+BCRYPT_QUEUE_TIME = Histogram(
+    "bcrypt_queue_seconds", "Time password hashing work waited for a bcrypt worker",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+BCRYPT_DURATION = Histogram(
+    "bcrypt_duration_seconds", "Time spent hashing or verifying a password", ["operation"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+AUDIT_EVENTS_WRITTEN = Counter(
+    "audit_events_written_total", "Audit events flushed to the store"
+)
+AUDIT_EVENTS_SPILLED = Counter(
+    "audit_events_spilled_total", "Audit events written to the local spill file instead of the store"
+)
+REVOCATION_FILTER_HITS = Counter(
+    "revocation_filter_hits_total", "Revocation filter hits checked against the store", ["revoked"]
+)
+
+_MONITORED_COMMANDS = {
+    "find", "getMore", "insert", "update", "delete", "findAndModify", "aggregate",
+    "count", "distinct", "createIndexes", "bulkWrite", "ping",
+}
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Record MongoDB command durations per collection and command
+
+    Motor runs pymongo on executor threads, so these callbacks must not touch
+    the event loop; prometheus_client metrics are thread-safe.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str) or len(collection) > 64:
+            collection = "none"
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _labels(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "none")
+        command = event.command_name if event.command_name in _MONITORED_COMMANDS else "other"
+        return collection, command
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.labels(*self._labels(event)).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._labels(event)
+        MONGO_COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware recording per-route latency, status and in-flight counts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label so arbitrary URLs cannot add series.
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(method, template).observe(time.perf_counter() - started)
+            HTTP_REQUESTS_TOTAL.labels(method, template, str(status_code)).inc()
+
+# Request profiling
+#
+# Opt-in per request with "X-Profile: <PROFILE_ADMIN_TOKEN>" or sampled at
+# PROFILE_SAMPLE_RATE. With no token and a zero rate the middleware is a
+# straight pass-through.
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_MS', '1')) / 1000.0
+PROFILE_MAX_CONCURRENT = int(os.environ.get('PROFILE_MAX_CONCURRENT', '2'))
+PROFILE_OUTPUT_DIR = Path(os.environ.get('PROFILE_OUTPUT_DIR', ROOT_DIR / 'profiles'))
+
+class StackSampler:
+    """Sample one thread's Python stack on a background thread
+
+    Profiling runs against the event loop thread, so samples include every
+    coroutine the loop runs while the profiled request is in flight.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = own_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+def _frame_label(frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ":")
+
+def write_profile(samples: StackCounter, interval: float, metadata: dict, output_dir: Path) -> str:
+    """Write <profile_id>.folded and <profile_id>.speedscope.json; returns the profile id"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profile_id = metadata["profile_id"]
+
+    with open(output_dir / f"{profile_id}.folded", "w") as folded:
+        for stack, count in samples.most_common():
+            folded.write(";".join(_frame_label(frame) for frame in stack) + f" {count}\n")
+
+    frame_index = {}
+    speedscope_samples, weights = [], []
+    for stack, count in samples.items():
+        speedscope_samples.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+        weights.append(count * interval)
+    speedscope = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{metadata['method']} {metadata['route']} ({metadata['duration_ms']:.1f} ms)",
+        "exporter": "debt-tracker-backend",
+        "metadata": metadata,
+        "shared": {"frames": [
+            {"name": name, "file": filename, "line": line} for name, filename, line in frame_index
+        ]},
+        "profiles": [{
+            "type": "sampled",
+            "name": metadata["route"],
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": speedscope_samples,
+            "weights": weights,
+        }],
+    }
+    with open(output_dir / f"{profile_id}.speedscope.json", "w") as handle:
+        json.dump(speedscope, handle, default=str)
+    return profile_id
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles selected requests with StackSampler"""
+
+    def __init__(self, app, admin_token: Optional[str] = None, sample_rate: float = 0.0,
+                 interval: float = PROFILE_INTERVAL_SECONDS, output_dir: Path = PROFILE_OUTPUT_DIR,
+                 max_concurrent: int = PROFILE_MAX_CONCURRENT):
+        self.app = app
+        self.admin_token = admin_token.encode() if admin_token else None
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.max_concurrent = max_concurrent
+        self.active = 0
+
+    def _should_profile(self, scope) -> Optional[str]:
+        if self.admin_token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    if hmac.compare_digest(value, self.admin_token):
+                        return "header"
+                    break
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (self.admin_token is None and not self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+        trigger = self._should_profile(scope)
+        if trigger is None or self.active >= self.max_concurrent:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = datetime.utcnow()
+        profile_id = f"{started_at:%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:12]}"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trigger == "header":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self.active += 1
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            sampler.stop()
+            self.active -= 1
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metadata = {
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "route": route,
+                "status": status_code,
+                "trigger": trigger,
+                "started_at": started_at.isoformat(),
+                "duration_ms": duration * 1000,
+                "interval_ms": self.interval * 1000,
+                "sample_count": sum(sampler.samples.values()),
+            }
+            # File I/O happens off the event loop
+            future = asyncio.get_running_loop().run_in_executor(
+                None, write_profile, sampler.samples, self.interval, metadata, self.output_dir
+            )
+            future.add_done_callback(partial(self._write_done, profile_id))
+
+    @staticmethod
+    def _write_done(profile_id: str, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to write profile {profile_id}: {future.exception()}")
+
+# Structured logging
+#
+# Records are serialized as JSON lines on a QueueListener thread. On the
+# event loop a log call only copies the record into a bounded queue; when
+# the sink falls behind and the queue fills up, records are dropped and
+# counted instead of blocking requests.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_ACCESS_SAMPLE_RATE = float(os.environ.get('LOG_ACCESS_SAMPLE_RATE', '1.0'))
+# Per-route overrides, e.g. "/api/debts=0.05,/api/dashboard/stats=0.1"
+LOG_ACCESS_SAMPLE_RATES = {
+    route.strip(): float(rate)
+    for route, rate in (item.rsplit("=", 1) for item in os.environ.get('LOG_ACCESS_SAMPLE_RATES', '').split(",") if item.strip())
+}
+LOG_SLOW_REQUEST_MS = float(os.environ.get('LOG_SLOW_REQUEST_MS', '1000'))
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+_LOG_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        # Fields passed with extra={...}
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with the current request id, dropping them if the queue is full"""
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread; only capture what is
+        # bound to this task (the request id) and resolve the message args.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Route the root logger (and uvicorn's) through a queue to a stdout listener thread
+
+    Called by the app's lifespan rather than on import, so scripts and tests
+    that import this module keep their own logging; stop the returned
+    listener to drain the queue.
+    """
+    sink = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        sink.setFormatter(JsonFormatter())
+    else:
+        sink.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, sink, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel(level)
+    # uvicorn installs its own stream handlers; send its records through the
+    # queue too, and replace its access log with RequestContextMiddleware's
+    for name in ("uvicorn", "uvicorn.error"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    logging.getLogger("uvicorn.access").handlers = []
+    logging.getLogger("uvicorn.access").propagate = False
+
+    listener.start()
+    return listener
+
+class RequestContextMiddleware:
+    """Pure ASGI middleware assigning each request an id and writing a sampled access log
+
+    An incoming X-Request-ID is reused if it looks sane, so ids can follow a
+    request across services; it is echoed on the response either way.
+    Errors and slow requests are always logged, others at the route's rate.
+    """
+
+    def __init__(self, app, sample_rate: float = LOG_ACCESS_SAMPLE_RATE,
+                 route_sample_rates: Optional[Dict[str, float]] = None, slow_ms: float = LOG_SLOW_REQUEST_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.route_sample_rates = LOG_ACCESS_SAMPLE_RATES if route_sample_rates is None else route_sample_rates
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID_RE.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            rate = self.route_sample_rates.get(route, self.sample_rate)
+            if status_code >= 500 or duration_ms >= self.slow_ms or (rate and random.random() < rate):
+                logger.info("request", extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 2),
+                    "sample_rate": rate,
+                })
+            request_id_var.reset(token)
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+DB_NAME = os.environ['DB_NAME']
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', '10')),
+    "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+    "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    "socketTimeoutMS": int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '30000')),
+    "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+}
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()], **MONGO_CLIENT_OPTIONS)
+
+# Storage backend: "mongo" (default) or "memory" for benchmarks and in-process tests
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+# Create a router with the /api prefix
+api_router = APIRouter(prefix="/api")
+
+# Security
+security = HTTPBearer()
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt is CPU-bound; run it on a dedicated pool so it never blocks the event loop
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', os.cpu_count() or 1))
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+SECRET_KEY = "debt-tracker-secret-key-change-in-production"
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+# Enums
+class DebtType(str, Enum):
+    I_OWE = "i_owe"
+    THEY_OWE = "they_owe"
+
+class Currency(str, Enum):
+    TRY = "TRY"
+    USD = "USD"
+    EUR = "EUR"
+
+class DebtCategory(str, Enum):
+    PERSONAL_LOAN = "personal_loan"
+    RENT = "rent"
+    SHARED_EXPENSE = "shared_expense"
+    BUSINESS_LOAN = "business_loan"
+    EDUCATION = "education"
+    OTHER = "other"
+
+class DebtStatus(str, Enum):
+    ACTIVE = "active"
+    PAID = "paid"
+    PARTIALLY_PAID = "partially_paid"
+
+class RecurrenceFrequency(str, Enum):
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+class AuditAction(str, Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    PAID = "paid"
+    UNPAID = "unpaid"
+    DELETED = "deleted"
+    ATTACHMENT_ADDED = "attachment_added"
+    ATTACHMENT_REMOVED = "attachment_removed"
+
+class ForecastGranularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+
+class SplitRule(str, Enum):
+    EQUAL = "equal"
+    SHARES = "shares"
+    EXACT = "exact"
+
+# Models
+class User(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    email: EmailStr
+    hashed_password: str
+    full_name: str
+    reporting_currency: Currency = Currency.TRY
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Set when account deletion is requested; the user can no longer authenticate
+    deleted_at: Optional[datetime] = None
+    # Bumped on every debt mutation; cached analytics are keyed by it
+    data_version: int = 0
+
+class UserProfile(BaseModel):
+    id: str
+    email: EmailStr
+    full_name: str
+    reporting_currency: Currency
+    created_at: datetime
+
+class UserPreferencesUpdate(BaseModel):
+    reporting_currency: Optional[Currency] = None
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+class UserCreate(BaseModel):
+    email: EmailStr
+    password: str
+    full_name: str
+
+class UserLogin(BaseModel):
+    email: EmailStr
+    password: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+
+class Attachment(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    content_type: str
+    size: int
+    storage_key: str
+    thumbnail_key: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AttachmentLink(BaseModel):
+    url: str
+    expires_in: int
+
+class Debt(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    debt_type: DebtType
+    person_name: str
+    amount: float
+    currency: Currency
+    amount_in_try: float = 0.0
+    description: str
+    category: DebtCategory
+    status: DebtStatus = DebtStatus.ACTIVE
+    due_date: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    paid_at: Optional[datetime] = None
+    # Set on debts generated from a recurring template; occurrence is 1-based
+    template_id: Optional[str] = None
+    occurrence: Optional[int] = None
+    attachments: List[Attachment] = Field(default_factory=list)
+
+class DebtCreate(BaseModel):
+    debt_type: DebtType
+    person_name: str
+    amount: float
+    currency: Currency
+    description: str
+    category: DebtCategory
+    due_date: Optional[datetime] = None
+
+class DebtUpdate(BaseModel):
+    person_name: Optional[str] = None
+    amount: Optional[float] = None
+    currency: Optional[Currency] = None
+    description: Optional[str] = None
+    category: Optional[DebtCategory] = None
+    due_date: Optional[datetime] = None
+
+class DebtTemplate(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    debt_type: DebtType
+    person_name: str
+    amount: float
+    currency: Currency
+    description: str
+    category: DebtCategory
+    frequency: RecurrenceFrequency
+    interval: int = 1
+    start_date: datetime
+    installments: Optional[int] = None
+    generated_count: int = 0
+    # Due date of the next occurrence not yet generated, and when the
+    # materializer should generate it (next_due_date minus the horizon)
+    next_due_date: Optional[datetime] = None
+    next_run_at: Optional[datetime] = None
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DebtTemplateCreate(BaseModel):
+    debt_type: DebtType
+    person_name: str
+    amount: float
+    currency: Currency
+    description: str
+    category: DebtCategory
+    frequency: RecurrenceFrequency
+    interval: int = Field(1, ge=1, le=52)
+    start_date: datetime
+    installments: Optional[int] = Field(None, ge=1, le=600)
+
+class AuditEvent(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    debt_id: str
+    action: AuditAction
+    # field -> [old, new] for audited fields that changed
+    changes: Dict[str, list] = Field(default_factory=dict)
+    at: datetime = Field(default_factory=datetime.utcnow)
+
+class DebtSearchResult(BaseModel):
+    items: List[Debt]
+    total: int
+    page: int
+    page_size: int
+
+class PersonSuggestion(BaseModel):
+    person_name: str
+    debt_count: int
+
+class DashboardStats(BaseModel):
+    total_owed: float
+    total_to_collect: float
+    net_balance: float
+    person_owe_most: Optional[str] = None
+    person_owe_most_amount: float = 0.0
+    most_overdue_debt: Optional[str] = None
+    most_overdue_days: int = 0
+    active_debts_count: int
+    overdue_debts_count: int
+    # Open balances revalued at current rates in the reporting currency
+    reporting_currency: Currency = Currency.TRY
+    revalued_total_owed: float = 0.0
+    revalued_total_to_collect: float = 0.0
+    revalued_net_balance: float = 0.0
+
+class ForecastBucket(BaseModel):
+    start: datetime
+    inflow: float
+    outflow: float
+    net: float
+    # Includes overdue balances, which are due immediately
+    cumulative_net: float
+
+class CashFlowForecast(BaseModel):
+    days: int
+    granularity: ForecastGranularity
+    currency: Currency = Currency.TRY
+    overdue_inflow: float
+    overdue_outflow: float
+    total_inflow: float
+    total_outflow: float
+    buckets: List[ForecastBucket]
+
+class BreakdownBucket(BaseModel):
+    key: str
+    count: int
+    i_owe: float
+    they_owe: float
+
+class AnalyticsBreakdown(BaseModel):
+    """Distribution of active debts; amounts are in TRY except by_currency, which uses each row's currency"""
+    by_category: List[BreakdownBucket]
+    by_currency: List[BreakdownBucket]
+    amount_histogram: List[BreakdownBucket]
+    aging: List[BreakdownBucket]
+    data_version: int
+    generated_at: datetime
+
+class GroupMember(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    name: str
+
+class ExpenseGroup(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    name: str
+    currency: Currency
+    members: List[GroupMember]
+    # Net balance per member id in minor units: positive is owed to the member
+    balances: Dict[str, int] = Field(default_factory=dict)
+    expense_count: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ExpenseGroupCreate(BaseModel):
+    name: str
+    currency: Currency
+    members: List[str] = Field(..., min_length=2)
+
+class GroupMemberCreate(BaseModel):
+    name: str
+
+class GroupExpense(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    group_id: str
+    user_id: str
+    description: str
+    amount: float
+    paid_by: str
+    split_rule: SplitRule
+    # Share of the expense per member id in minor units
+    splits: Dict[str, int]
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class GroupExpenseCreate(BaseModel):
+    description: str
+    amount: float = Field(..., gt=0)
+    paid_by: str
+    split_rule: SplitRule = SplitRule.EQUAL
+    # Member ids taking part in an equal split; defaults to every member
+    participants: Optional[List[str]] = None
+    # Member id -> weight, for SHARES
+    shares: Optional[Dict[str, int]] = None
+    # Member id -> amount, for EXACT; must add up to the expense amount
+    exact_amounts: Optional[Dict[str, float]] = None
+
+class Transfer(BaseModel):
+    from_member: str
+    to_member: str
+    amount: float
+
+class GroupSettlement(BaseModel):
+    group_id: str
+    currency: Currency
+    balances: Dict[str, float]
+    transfers: List[Transfer]
+
+# Utility functions
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+async def run_password_hashing(operation: str, func, *args):
+    """Run a bcrypt function on the bcrypt pool, recording queue wait and run time"""
+    submitted = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        BCRYPT_QUEUE_TIME.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            BCRYPT_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    return await asyncio.get_running_loop().run_in_executor(bcrypt_executor, timed)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    # jti identifies the token so it can be revoked before it expires
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+# Turkish dotted/dotless i must be mapped before lowercasing, otherwise
+# "I".lower() gives "i" and "İ".lower() gives "i" + combining dot.
+_TURKISH_FOLD_TABLE = str.maketrans({"İ": "i", "I": "i", "ı": "i"})
+
+def fold_text(value: str) -> str:
+    """Case- and diacritic-fold text for prefix matching (Turkish-aware)"""
+    value = value.translate(_TURKISH_FOLD_TABLE).lower()
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).strip()
+
+# Autocomplete reads at most this many matching index keys per keystroke;
+# a prefix shared by more debts than this gets partial suggestions
+AUTOCOMPLETE_SCAN_LIMIT = int(os.environ.get('AUTOCOMPLETE_SCAN_LIMIT', '1000'))
+
+# Money is summed and split in integer minor units (cents/kuruş) so totals
+# add up exactly; the float fields remain the API representation.
+MINOR_UNITS = 100
+
+def to_minor(amount) -> int:
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(amount_minor: int) -> float:
+    return amount_minor / MINOR_UNITS
+
+def money_fields(amount: float, amount_in_try: float) -> dict:
+    """Exact integer minor-unit copies of a debt's amounts, used by aggregations"""
+    return {"amount_minor": to_minor(amount), "amount_in_try_minor": to_minor(amount_in_try)}
+
+def debt_document(debt: Debt) -> dict:
+    """Serialize a debt for storage, including derived search and money fields"""
+    document = debt.dict()
+    document["person_name_folded"] = fold_text(debt.person_name)
+    document.update(money_fields(debt.amount, debt.amount_in_try))
+    return document
+
+# Recurring debts get deterministic ids, so materializing the same
+# occurrence twice hits the unique (user_id, id) index instead of duplicating.
+RECURRING_ID_NAMESPACE = uuid.UUID("5b0f3c52-8f0e-4d59-9a53-6a3f4c1d2e7b")
+
+def recurring_debt_id(template_id: str, index: int) -> str:
+    return str(uuid.uuid5(RECURRING_ID_NAMESPACE, f"{template_id}:{index}"))
+
+def to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def occurrence_due_date(start: datetime, frequency: str, interval: int, index: int) -> datetime:
+    """Due date of the index-th (0-based) occurrence
+
+    Monthly occurrences keep the start day, clamped to the end of shorter
+    months (Jan 31 -> Feb 28 -> Mar 31), rather than drifting.
+    """
+    if frequency == RecurrenceFrequency.WEEKLY:
+        return start + timedelta(weeks=interval * index)
+    months = start.month - 1 + interval * index
+    year, month = start.year + months // 12, months % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+def _distribute(total: int, weights: Dict[str, int]) -> Dict[str, int]:
+    """Split total proportionally to weights; leftover units go to the largest remainders"""
+    weight_sum = sum(weights.values())
+    shares, remainders = {}, []
+    for member_id, weight in weights.items():
+        share, remainder = divmod(total * weight, weight_sum)
+        shares[member_id] = share
+        remainders.append((remainder, member_id))
+    leftover = total - sum(shares.values())
+    for _, member_id in sorted(remainders, reverse=True)[:leftover]:
+        shares[member_id] += 1
+    return shares
+
+def split_expense(expense: GroupExpenseCreate, member_ids: List[str]) -> Dict[str, int]:
+    """Compute each member's share of an expense in minor units"""
+    known = set(member_ids)
+    amount_minor = to_minor(expense.amount)
+
+    if expense.split_rule == SplitRule.EQUAL:
+        participants = expense.participants or member_ids
+        weights = {member_id: 1 for member_id in participants}
+    elif expense.split_rule == SplitRule.SHARES:
+        if not expense.shares or any(weight < 0 for weight in expense.shares.values()) or not sum(expense.shares.values()):
+            raise HTTPException(status_code=400, detail="Shares must be non-negative and not all zero")
+        weights = {member_id: weight for member_id, weight in expense.shares.items() if weight}
+    else:
+        if not expense.exact_amounts:
+            raise HTTPException(status_code=400, detail="Exact amounts are required for an exact split")
+        if any(value < 0 for value in expense.exact_amounts.values()):
+            raise HTTPException(status_code=400, detail="Exact amounts must be non-negative")
+        splits = {member_id: to_minor(value) for member_id, value in expense.exact_amounts.items()}
+        if not known.issuperset(splits):
+            raise HTTPException(status_code=400, detail="Split references an unknown member")
+        if sum(splits.values()) != amount_minor:
+            raise HTTPException(status_code=400, detail="Exact amounts must add up to the expense amount")
+        return splits
+
+    if not weights or not known.issuperset(weights):
+        raise HTTPException(status_code=400, detail="Split references an unknown member")
+    return _distribute(amount_minor, weights)
+
+def expense_balance_deltas(paid_by: str, splits: Dict[str, int]) -> Dict[str, int]:
+    """Balance changes an expense causes: the payer is credited, participants debited"""
+    deltas = {member_id: -share for member_id, share in splits.items()}
+    deltas[paid_by] = deltas.get(paid_by, 0) + sum(splits.values())
+    return {member_id: delta for member_id, delta in deltas.items() if delta}
+
+def settle_balances(balances: Dict[str, int]) -> List[Tuple[str, str, int]]:
+    """Greedy netting: repeatedly pay the largest creditor from the largest debtor
+
+    Runs in O(n log n) over members and yields at most n - 1 transfers.
+    """
+    creditors = [(-amount, member_id) for member_id, amount in balances.items() if amount > 0]
+    debtors = [(amount, member_id) for member_id, amount in balances.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+# Interrupted expense changes are settled once they are this old, well past
+# how long a live request takes between its writes
+GROUP_PENDING_GRACE = timedelta(minutes=5)
+
+# Storage repositories
+#
+# Route handlers only talk to these interfaces. Documents go in and come out
+# as plain dicts shaped like the MongoDB documents, so the in-memory backend
+# can stand in for MongoDB in benchmarks and in-process test runs.
+class UserDataRepository(ABC):
+    """A store holding documents owned by a user, erased on account deletion"""
+
+    @abstractmethod
+    async def delete_for_user(self, user_id: str, batch_size: int) -> int:
+        """Delete up to batch_size of the user's documents
+
+        Returns the number deleted, 0 once none are left; callers repeat
+        until then, checkpointing in between, so no single call runs long.
+        """
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_id(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, user: dict) -> None: ...
+
+    @abstractmethod
+    async def update(self, user_id: str, fields: dict) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def delete(self, user_id: str) -> bool: ...
+
+    @abstractmethod
+    async def increment_data_version(self, user_id: str) -> None: ...
+
+    @abstractmethod
+    async def pending_deletion(self, limit: int) -> List[dict]:
+        """Users whose account deletion was requested but not finished"""
+
+class DebtRepository(UserDataRepository):
+    @abstractmethod
+    async def create(self, debt: dict) -> None: ...
+
+    @abstractmethod
+    async def create_many(self, debts: List[dict]) -> int:
+        """Insert debts in one batch, skipping ids that already exist; returns the number inserted"""
+
+    @abstractmethod
+    async def get(self, user_id: str, debt_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str, limit: int = 1000, include_archived: bool = False) -> List[dict]:
+        """Live debts first, then archived ones if requested, up to limit"""
+
+    @abstractmethod
+    async def get_archived(self, user_id: str, debt_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def update(self, user_id: str, debt_id: str, fields: dict) -> Optional[dict]:
+        """Apply a $set-style update and return the updated document"""
+
+    @abstractmethod
+    async def delete(self, user_id: str, debt_id: str) -> Optional[dict]:
+        """Delete a live or archived debt and return it, so its attachments can be removed"""
+
+    @abstractmethod
+    async def archive_batch(self, paid_before: datetime, batch_size: int, after_id: Optional[str]) -> Tuple[int, Optional[str]]:
+        """Move the next batch of debts paid before the cutoff into the archive
+
+        Batches are taken in id order after after_id; returns the number moved
+        and the last id examined (None once there is nothing left).
+        """
+
+    @abstractmethod
+    async def restore_archived(self, user_id: str, debt_id: str) -> bool:
+        """Move an archived debt back into the live collection"""
+
+    @abstractmethod
+    async def search(self, user_id: str, text: str, skip: int, limit: int) -> Tuple[int, List[dict]]:
+        """Ranked full-text search over person_name/description"""
+
+    @abstractmethod
+    async def autocomplete(self, user_id: str, folded_prefix: str, limit: int) -> List[dict]:
+        """Distinct person names whose folded form starts with the prefix
+
+        Stores may stop after AUTOCOMPLETE_SCAN_LIMIT matching debts, so
+        debt_count is a lower bound for very common prefixes.
+        """
+
+    @abstractmethod
+    async def add_attachment(self, user_id: str, debt_id: str, attachment: dict) -> bool: ...
+
+    @abstractmethod
+    async def remove_attachment(self, user_id: str, debt_id: str, attachment_id: str) -> Optional[dict]:
+        """Remove attachment metadata from a debt and return it"""
+
+    @abstractmethod
+    async def set_attachment_thumbnail(self, user_id: str, debt_id: str, attachment_id: str, thumbnail_key: str) -> None: ...
+
+class SummaryRepository(ABC):
+    @abstractmethod
+    async def dashboard_summary(self, user_id: str, now: datetime) -> dict:
+        """Aggregate a user's active debts in the store
+
+        Returns {"totals_minor": {debt_type: int}, "counts": {debt_type: int},
+        "top_creditor": {"person_name", "total_minor"} or None,
+        "overdue_count": int, "most_overdue": {"description", "person_name",
+        "due_date"} or None}, with amounts in TRY minor units.
+        """
+
+    @abstractmethod
+    async def open_balances_by_currency(self, user_id: str) -> List[dict]:
+        """Active debt amounts summed per (debt_type, currency) as total_minor, in the original currency"""
+
+    @abstractmethod
+    async def due_totals_by_day(self, user_id: str, start: datetime, until: datetime) -> List[dict]:
+        """Active debts due before until, summed per (debt_type, UTC day)
+
+        Rows are {"debt_type", "day": "YYYY-MM-DD", "total_minor"} in TRY
+        minor units. Debts due before start are reported on the day before
+        start, so overdue balances come back as one row per debt type.
+        """
+
+    @abstractmethod
+    async def breakdown(self, user_id: str, as_of: datetime) -> dict:
+        """Active debts grouped four ways in one pass
+
+        Returns {"by_category", "by_currency", "histogram", "aging"}, each a
+        list of {"key", "count", "i_owe_minor", "they_owe_minor"}. Amounts
+        are TRY minor units, except by_currency which sums each currency's
+        own amounts. Histogram keys are the lower bound of the TRY amount
+        bucket (ANALYTICS_HISTOGRAM_BOUNDARIES) and aging keys the lower
+        bound in whole days overdue at as_of (ANALYTICS_AGING_BOUNDARIES);
+        the last bucket of each is keyed "over". Empty buckets are omitted.
+        """
+
+class JobRepository(ABC):
+    """Checkpoints for resumable background jobs"""
+
+    @abstractmethod
+    async def get(self, name: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def save(self, name: str, state: dict) -> None: ...
+
+class GroupRepository(UserDataRepository):
+    """Expense groups keep per-member balances that every expense updates incrementally"""
+
+    @abstractmethod
+    async def create(self, group: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, user_id: str, group_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str, limit: int = 1000) -> List[dict]: ...
+
+    @abstractmethod
+    async def add_member(self, user_id: str, group_id: str, member: dict) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def add_expense(self, expense: dict, deltas: Dict[str, int]) -> bool:
+        """Store an expense and apply its balance deltas to the group
+
+        Returns False if the group does not exist.
+        """
+
+    @abstractmethod
+    async def delete_expense(self, user_id: str, group_id: str, expense_id: str) -> bool:
+        """Remove an expense and reverse its balance deltas"""
+
+    @abstractmethod
+    async def list_expenses(self, user_id: str, group_id: str, skip: int, limit: int) -> List[dict]: ...
+
+class TemplateRepository(UserDataRepository):
+    """Recurring debt templates, scheduled by next_run_at"""
+
+    @abstractmethod
+    async def create(self, template: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, user_id: str, template_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str, limit: int = 1000) -> List[dict]: ...
+
+    @abstractmethod
+    async def deactivate(self, user_id: str, template_id: str) -> bool: ...
+
+    @abstractmethod
+    async def due(self, now: datetime, limit: int) -> List[dict]:
+        """Active templates whose next_run_at has passed, earliest first"""
+
+    @abstractmethod
+    async def advance(self, template_id: str, generated_count: int, fields: dict) -> bool:
+        """Update the schedule if generated_count is unchanged since the template was read"""
+
+class IdempotencyRepository(UserDataRepository):
+    """Stored responses for Idempotency-Key requests, expiring at expires_at"""
+
+    @abstractmethod
+    async def acquire(self, record: dict, now: datetime) -> Optional[dict]:
+        """Lock a key by inserting a pending record
+
+        Returns None if the caller now owns the key, otherwise the record
+        already stored for it. Expired records and pending records whose
+        lock has lapsed are taken over.
+        """
+
+    @abstractmethod
+    async def complete(self, record_id: str, response: dict) -> None: ...
+
+    @abstractmethod
+    async def release(self, record_id: str) -> None: ...
+
+class AuditRepository(UserDataRepository):
+    """Append-only debt history"""
+
+    @abstractmethod
+    async def insert_many(self, events: List[dict]) -> None:
+        """Append events; ids that were already written are skipped"""
+
+    @abstractmethod
+    async def history(self, user_id: str, debt_id: str, skip: int, limit: int) -> List[dict]:
+        """A debt's events, newest first"""
+
+class RevocationRepository(ABC):
+    """Revoked token ids, kept until the token would have expired anyway"""
+
+    @abstractmethod
+    async def revoke(self, jti: str, user_id: str, expires_at: datetime) -> None: ...
+
+    @abstractmethod
+    async def is_revoked(self, jti: str) -> bool: ...
+
+    @abstractmethod
+    async def revoked_since(self, since: Optional[datetime], now: datetime) -> List[str]:
+        """Ids of unexpired tokens revoked at or after since (all of them if since is None)"""
+
+class Repositories:
+    def __init__(self, users: UserRepository, debts: DebtRepository, summaries: SummaryRepository,
+                 jobs: JobRepository, groups: GroupRepository, templates: TemplateRepository,
+                 idempotency: IdempotencyRepository, audit: AuditRepository,
+                 revocations: RevocationRepository):
+        self.users = users
+        self.debts = debts
+        self.summaries = summaries
+        self.jobs = jobs
+        self.groups = groups
+        self.templates = templates
+        self.idempotency = idempotency
+        self.audit = audit
+        self.revocations = revocations
+
+    async def initialize(self):
+        """Prepare the backing store (indexes) before serving"""
+
+# Amount histogram bucket bounds in TRY, and overdue-age bucket bounds in days
+# (0-30, 31-60, 61-90, then everything older)
+ANALYTICS_HISTOGRAM_BOUNDARIES = [0, 100, 500, 1000, 5000, 10000, 50000]
+ANALYTICS_AGING_BOUNDARIES = [0, 31, 61, 91]
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+
+# Documents written before money was stored in minor units fall back to
+# rounding the float field, so sums are right before and after migration.
+def _minor_units_expr(field: str) -> dict:
+    return {"$ifNull": [
+        f"${field}_minor",
+        {"$toLong": {"$round": [{"$multiply": [f"${field}", MINOR_UNITS]}, 0]}}
+    ]}
+
+def _minor_units(document: dict, field: str) -> int:
+    value = document.get(f"{field}_minor")
+    return value if value is not None else to_minor(document.get(field) or 0.0)
+
+async def _delete_batch(collection, query: dict, batch_size: int) -> int:
+    """delete_many bounded to batch_size documents, so no single delete runs long"""
+    batch = await collection.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)
+    if not batch:
+        return 0
+    result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+    return result.deleted_count
+
+# MongoDB (Motor) implementation
+class MotorUserRepository(UserRepository):
+    def __init__(self, database):
+        self.collection = database.users
+
+    async def get_by_email(self, email):
+        return await self.collection.find_one({"email": email})
+
+    async def get_by_id(self, user_id):
+        return await self.collection.find_one({"id": user_id})
+
+    async def create(self, user):
+        await self.collection.insert_one(dict(user))
+
+    async def update(self, user_id, fields):
+        return await self.collection.find_one_and_update(
+            {"id": user_id}, {"$set": fields}, return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, user_id):
+        result = await self.collection.delete_one({"id": user_id})
+        return result.deleted_count > 0
+
+    async def increment_data_version(self, user_id):
+        await self.collection.update_one({"id": user_id}, {"$inc": {"data_version": 1}})
+
+    async def pending_deletion(self, limit):
+        # Matches the partial deleted_at index, which only holds deleted users
+        return await self.collection.find({"deleted_at": {"$type": "date"}}).to_list(limit)
+
+class MotorDebtRepository(DebtRepository):
+    def __init__(self, database):
+        self.collection = database.debts
+        self.archive = database.debts_archive
+
+    async def create(self, debt):
+        # insert_one mutates its argument by adding _id
+        await self.collection.insert_one(dict(debt))
+
+    async def create_many(self, debts):
+        if not debts:
+            return 0
+        try:
+            result = await self.collection.insert_many([dict(debt) for debt in debts], ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details["nInserted"]
+        return len(result.inserted_ids)
+
+    async def get(self, user_id, debt_id):
+        return await self.collection.find_one({"id": debt_id, "user_id": user_id})
+
+    async def list_for_user(self, user_id, limit=1000, include_archived=False):
+        debts = await self.collection.find({"user_id": user_id}).to_list(limit)
+        if include_archived and len(debts) < limit:
+            debts += await self.archive.find({"user_id": user_id}).to_list(limit - len(debts))
+        return debts
+
+    async def get_archived(self, user_id, debt_id):
+        return await self.archive.find_one({"id": debt_id, "user_id": user_id})
+
+    async def update(self, user_id, debt_id, fields):
+        return await self.collection.find_one_and_update(
+            {"id": debt_id, "user_id": user_id},
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, user_id, debt_id):
+        debt = await self.collection.find_one_and_delete({"id": debt_id, "user_id": user_id})
+        if debt is None:
+            debt = await self.archive.find_one_and_delete({"id": debt_id, "user_id": user_id})
+        return debt
+
+    async def archive_batch(self, paid_before, batch_size, after_id):
+        query = {"status": DebtStatus.PAID.value, "paid_at": {"$lt": paid_before}}
+        if after_id is not None:
+            query["id"] = {"$gt": after_id}
+        # Served by the (status, id) index; paid_at is checked on each key
+        # in id order, so a batch costs O(batch) plus the skipped recent ones
+        batch = await self.collection.find(query).sort("id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return 0, None
+
+        # Copy first, then delete: a crash in between leaves duplicates that
+        # the next run skips (unique index), never lost debts.
+        try:
+            await self.archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        ids = [debt["id"] for debt in batch]
+        result = await self.collection.delete_many({"id": {"$in": ids}, "status": DebtStatus.PAID.value})
+        if result.deleted_count != len(ids):
+            # Some debts were marked unpaid meanwhile; drop their archive copies
+            still_live = await self.collection.distinct("id", {"id": {"$in": ids}})
+            await self.archive.delete_many({"id": {"$in": still_live}})
+        return result.deleted_count, ids[-1]
+
+    async def restore_archived(self, user_id, debt_id):
+        debt = await self.archive.find_one({"id": debt_id, "user_id": user_id})
+        if debt is None:
+            return False
+        try:
+            await self.collection.insert_one(debt)
+        except DuplicateKeyError:
+            pass
+        await self.archive.delete_one({"_id": debt["_id"]})
+        return True
+
+    async def search(self, user_id, text, skip, limit):
+        query = {"user_id": user_id, "$text": {"$search": text}}
+        total = await self.collection.count_documents(query)
+        cursor = self.collection.find(query, {"_id": 0, "score": {"$meta": "textScore"}})
+        cursor = cursor.sort([("score", {"$meta": "textScore"})])
+        return total, await cursor.skip(skip).limit(limit).to_list(limit)
+
+    async def autocomplete(self, user_id, folded_prefix, limit):
+        # The anchored regex is a range scan of the (user_id, person_name_folded)
+        # index, and the $limit right after the index-backed $sort stops it
+        # early, so a keystroke never groups every matching debt.
+        pipeline = [
+            {"$match": {"user_id": user_id, "person_name_folded": {"$regex": f"^{re.escape(folded_prefix)}"}}},
+            {"$sort": {"person_name_folded": 1}},
+            {"$limit": AUTOCOMPLETE_SCAN_LIMIT},
+            {"$group": {"_id": "$person_name_folded", "person_name": {"$first": "$person_name"}, "debt_count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+            {"$limit": limit},
+        ]
+        return await self.collection.aggregate(pipeline).to_list(limit)
+
+    async def add_attachment(self, user_id, debt_id, attachment):
+        result = await self.collection.update_one(
+            {"id": debt_id, "user_id": user_id}, {"$push": {"attachments": attachment}}
+        )
+        return result.matched_count > 0
+
+    async def remove_attachment(self, user_id, debt_id, attachment_id):
+        # The projection returns just the pulled element from the pre-update document
+        debt = await self.collection.find_one_and_update(
+            {"id": debt_id, "user_id": user_id, "attachments.id": attachment_id},
+            {"$pull": {"attachments": {"id": attachment_id}}},
+            projection={"attachments": {"$elemMatch": {"id": attachment_id}}},
+        )
+        return debt["attachments"][0] if debt else None
+
+    async def set_attachment_thumbnail(self, user_id, debt_id, attachment_id, thumbnail_key):
+        await self.collection.update_one(
+            {"id": debt_id, "user_id": user_id, "attachments.id": attachment_id},
+            {"$set": {"attachments.$.thumbnail_key": thumbnail_key}}
+        )
+
+    async def delete_for_user(self, user_id, batch_size):
+        deleted = await _delete_batch(self.collection, {"user_id": user_id}, batch_size)
+        if deleted == 0:
+            deleted = await _delete_batch(self.archive, {"user_id": user_id}, batch_size)
+        return deleted
+
+class MotorSummaryRepository(SummaryRepository):
+    def __init__(self, database):
+        self.collection = database.debts
+
+    async def dashboard_summary(self, user_id, now):
+        amount_in_try = _minor_units_expr("amount_in_try")
+        pipeline = [
+            {"$match": {"user_id": user_id, "status": DebtStatus.ACTIVE.value}},
+            {"$facet": {
+                "totals": [
+                    {"$group": {"_id": "$debt_type", "total": {"$sum": amount_in_try}, "count": {"$sum": 1}}},
+                ],
+                "top_creditor": [
+                    {"$match": {"debt_type": DebtType.I_OWE.value}},
+                    {"$group": {"_id": "$person_name", "total": {"$sum": amount_in_try}}},
+                    {"$sort": {"total": -1, "_id": 1}},
+                    {"$limit": 1},
+                ],
+                "overdue": [
+                    {"$match": {"due_date": {"$ne": None, "$lt": now}}},
+                    {"$sort": {"due_date": 1}},
+                    {"$group": {"_id": None, "count": {"$sum": 1}, "oldest": {"$first": {
+                        "description": "$description", "person_name": "$person_name", "due_date": "$due_date"
+                    }}}},
+                ],
+            }},
+        ]
+        result = (await self.collection.aggregate(pipeline).to_list(1))[0]
+        top = result["top_creditor"][0] if result["top_creditor"] else None
+        overdue = result["overdue"][0] if result["overdue"] else None
+        return {
+            "totals_minor": {row["_id"]: row["total"] for row in result["totals"]},
+            "counts": {row["_id"]: row["count"] for row in result["totals"]},
+            "top_creditor": {"person_name": top["_id"], "total_minor": top["total"]} if top else None,
+            "overdue_count": overdue["count"] if overdue else 0,
+            "most_overdue": overdue["oldest"] if overdue else None,
+        }
+
+    async def open_balances_by_currency(self, user_id):
+        # At most len(DebtType) * len(Currency) rows come back, whatever the debt count
+        pipeline = [
+            {"$match": {"user_id": user_id, "status": DebtStatus.ACTIVE.value}},
+            {"$group": {
+                "_id": {"debt_type": "$debt_type", "currency": "$currency"},
+                "total": {"$sum": _minor_units_expr("amount")}
+            }},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(None)
+        return [
+            {"debt_type": row["_id"]["debt_type"], "currency": row["_id"]["currency"], "total_minor": row["total"]}
+            for row in rows
+        ]
+
+    async def due_totals_by_day(self, user_id, start, until):
+        # At most 2 * (days + 1) rows come back; the debts themselves stay in MongoDB
+        overdue_day = start - timedelta(days=1)
+        pipeline = [
+            {"$match": {"user_id": user_id, "status": DebtStatus.ACTIVE.value, "due_date": {"$lt": until}}},
+            {"$group": {
+                "_id": {
+                    "debt_type": "$debt_type",
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$max": ["$due_date", overdue_day]}}},
+                },
+                "total": {"$sum": _minor_units_expr("amount_in_try")}
+            }},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(None)
+        return [
+            {"debt_type": row["_id"]["debt_type"], "day": row["_id"]["day"], "total_minor": row["total"]}
+            for row in rows
+        ]
+
+    async def breakdown(self, user_id, as_of):
+        amount_in_try = _minor_units_expr("amount_in_try")
+
+        def split_by_type(amount):
+            return {
+                "count": {"$sum": 1},
+                "i_owe_minor": {"$sum": {"$cond": [{"$eq": ["$debt_type", DebtType.I_OWE.value]}, amount, 0]}},
+                "they_owe_minor": {"$sum": {"$cond": [{"$eq": ["$debt_type", DebtType.THEY_OWE.value]}, amount, 0]}},
+            }
+
+        pipeline = [
+            {"$match": {"user_id": user_id, "status": DebtStatus.ACTIVE.value}},
+            {"$facet": {
+                "by_category": [{"$group": {"_id": "$category", **split_by_type(amount_in_try)}}],
+                "by_currency": [{"$group": {"_id": "$currency", **split_by_type(_minor_units_expr("amount"))}}],
+                "histogram": [{"$bucket": {
+                    "groupBy": amount_in_try,
+                    "boundaries": [bound * MINOR_UNITS for bound in ANALYTICS_HISTOGRAM_BOUNDARIES],
+                    "default": "over",
+                    "output": split_by_type(amount_in_try),
+                }}],
+                "aging": [
+                    {"$match": {"due_date": {"$lt": as_of}}},
+                    {"$bucket": {
+                        "groupBy": {"$floor": {"$divide": [{"$subtract": [as_of, "$due_date"]}, MILLISECONDS_PER_DAY]}},
+                        "boundaries": ANALYTICS_AGING_BOUNDARIES,
+                        "default": "over",
+                        "output": split_by_type(amount_in_try),
+                    }},
+                ],
+            }},
+        ]
+        result = (await self.collection.aggregate(pipeline).to_list(1))[0]
+        return {
+            facet: [{"key": row.pop("_id"), **row} for row in rows]
+            for facet, rows in result.items()
+        }
+
+class MotorJobRepository(JobRepository):
+    def __init__(self, database):
+        self.collection = database.jobs
+
+    async def get(self, name):
+        return await self.collection.find_one({"_id": name})
+
+    async def save(self, name, state):
+        await self.collection.update_one({"_id": name}, {"$set": state}, upsert=True)
+
+class MotorGroupRepository(GroupRepository):
+    def __init__(self, database):
+        self.collection = database.expense_groups
+        self.expenses = database.group_expenses
+
+    async def create(self, group):
+        await self.collection.insert_one(dict(group))
+
+    async def get(self, user_id, group_id):
+        group = await self.collection.find_one({"id": group_id, "user_id": user_id})
+        return await self._settle_pending(group) if group else None
+
+    async def list_for_user(self, user_id, limit=1000):
+        groups = await self.collection.find({"user_id": user_id}).to_list(limit)
+        return [await self._settle_pending(group) for group in groups]
+
+    async def add_member(self, user_id, group_id, member):
+        return await self.collection.find_one_and_update(
+            {"id": group_id, "user_id": user_id},
+            {"$push": {"members": member}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    # Expenses and balances live in different collections, so an expense
+    # write and its balance update cannot be one atomic write (and
+    # transactions need a replica set). Each change is first announced in
+    # the group's "pending" list; the balance update then pulls that entry
+    # in the same atomic write. A pending entry left behind by a crash is
+    # settled from whether the expense exists, so balances never drift.
+    async def _announce(self, user_id, group_id, expense_id, op, deltas):
+        result = await self.collection.update_one(
+            {"id": group_id, "user_id": user_id, "pending.expense_id": {"$ne": expense_id}},
+            {"$push": {"pending": {
+                "expense_id": expense_id, "op": op, "deltas": deltas, "at": datetime.utcnow()
+            }}}
+        )
+        return result.matched_count > 0
+
+    async def _apply(self, user_id, group_id, expense_id, deltas, count):
+        update = {
+            "$inc": {f"balances.{member_id}": delta for member_id, delta in deltas.items()},
+            "$pull": {"pending": {"expense_id": expense_id}},
+        }
+        update["$inc"]["expense_count"] = count
+        await self.collection.update_one(
+            {"id": group_id, "user_id": user_id, "pending.expense_id": expense_id}, update
+        )
+
+    async def _discard(self, user_id, group_id, expense_id):
+        await self.collection.update_one(
+            {"id": group_id, "user_id": user_id}, {"$pull": {"pending": {"expense_id": expense_id}}}
+        )
+
+    async def _settle_pending(self, group):
+        """Finish or drop changes whose writer stopped before applying them"""
+        cutoff = datetime.utcnow() - GROUP_PENDING_GRACE
+        stale = [entry for entry in group.get("pending", []) if entry["at"] < cutoff]
+        if not stale:
+            return group
+        for entry in stale:
+            exists = await self.expenses.count_documents({"id": entry["expense_id"]}, limit=1) > 0
+            # An add took effect if the expense was stored, a delete if it is gone
+            if exists == (entry["op"] == "add"):
+                await self._apply(group["user_id"], group["id"], entry["expense_id"], entry["deltas"],
+                                  1 if entry["op"] == "add" else -1)
+            else:
+                await self._discard(group["user_id"], group["id"], entry["expense_id"])
+        logger.warning(f"Settled {len(stale)} interrupted expense changes in group {group['id']}")
+        return await self.collection.find_one({"id": group["id"], "user_id": group["user_id"]})
+
+    async def add_expense(self, expense, deltas):
+        if not await self._announce(expense["user_id"], expense["group_id"], expense["id"], "add", deltas):
+            return False
+        await self.expenses.insert_one(dict(expense))
+        await self._apply(expense["user_id"], expense["group_id"], expense["id"], deltas, 1)
+        return True
+
+    async def delete_expense(self, user_id, group_id, expense_id):
+        expense = await self.expenses.find_one({"id": expense_id, "group_id": group_id, "user_id": user_id})
+        if expense is None:
+            return False
+        deltas = expense_balance_deltas(expense["paid_by"], expense["splits"])
+        reversal = {member_id: -delta for member_id, delta in deltas.items()}
+        if not await self._announce(user_id, group_id, expense_id, "delete", reversal):
+            return False
+        result = await self.expenses.delete_one({"id": expense_id, "group_id": group_id, "user_id": user_id})
+        if result.deleted_count == 0:
+            # Deleted concurrently; that request applies the reversal
+            await self._discard(user_id, group_id, expense_id)
+            return False
+        await self._apply(user_id, group_id, expense_id, reversal, -1)
+        return True
+
+    async def list_expenses(self, user_id, group_id, skip, limit):
+        cursor = self.expenses.find({"group_id": group_id, "user_id": user_id}).sort("created_at", -1)
+        return await cursor.skip(skip).limit(limit).to_list(limit)
+
+    async def delete_for_user(self, user_id, batch_size):
+        deleted = await _delete_batch(self.expenses, {"user_id": user_id}, batch_size)
+        if deleted == 0:
+            deleted = await _delete_batch(self.collection, {"user_id": user_id}, batch_size)
+        return deleted
+
+class MotorTemplateRepository(TemplateRepository):
+    def __init__(self, database):
+        self.collection = database.debt_templates
+
+    async def create(self, template):
+        await self.collection.insert_one(dict(template))
+
+    async def get(self, user_id, template_id):
+        return await self.collection.find_one({"id": template_id, "user_id": user_id})
+
+    async def list_for_user(self, user_id, limit=1000):
+        return await self.collection.find({"user_id": user_id}).sort("created_at", 1).to_list(limit)
+
+    async def deactivate(self, user_id, template_id):
+        result = await self.collection.update_one(
+            {"id": template_id, "user_id": user_id},
+            {"$set": {"active": False, "next_run_at": None}}
+        )
+        return result.matched_count > 0
+
+    async def due(self, now, limit):
+        # "active": True matches the partial next_run_at index
+        cursor = self.collection.find({"active": True, "next_run_at": {"$lte": now}}).sort("next_run_at", 1)
+        return await cursor.limit(limit).to_list(limit)
+
+    async def advance(self, template_id, generated_count, fields):
+        result = await self.collection.update_one(
+            {"id": template_id, "generated_count": generated_count}, {"$set": fields}
+        )
+        return result.modified_count > 0
+
+    async def delete_for_user(self, user_id, batch_size):
+        return await _delete_batch(self.collection, {"user_id": user_id}, batch_size)
+
+class MotorIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, database):
+        self.collection = database.idempotency_keys
+
+    async def acquire(self, record, now):
+        # The unique _id is the lock: the first request inserts, duplicates
+        # fail and read the stored record back with one _id lookup.
+        try:
+            await self.collection.insert_one(dict(record))
+            return None
+        except DuplicateKeyError:
+            pass
+        existing = await self.collection.find_one({"_id": record["_id"]})
+        if existing is not None and existing["expires_at"] > now and (
+            existing["state"] != "pending" or existing["locked_until"] > now
+        ):
+            return existing
+        # The TTL monitor only runs once a minute, and a crashed request
+        # leaves its lock behind; take either over atomically.
+        taken = await self.collection.find_one_and_replace(
+            {"_id": record["_id"], "$or": [
+                {"expires_at": {"$lte": now}},
+                {"state": "pending", "locked_until": {"$lte": now}},
+            ]},
+            record
+        )
+        if taken is not None:
+            return None
+        return await self.collection.find_one({"_id": record["_id"]})
+
+    async def complete(self, record_id, response):
+        await self.collection.update_one({"_id": record_id}, {"$set": {"state": "completed", "response": response}})
+
+    async def release(self, record_id):
+        await self.collection.delete_one({"_id": record_id, "state": "pending"})
+
+    async def delete_for_user(self, user_id, batch_size):
+        # Record ids are "<user_id>:<key>", so an anchored prefix is an _id range scan
+        return await _delete_batch(self.collection, {"_id": {"$regex": f"^{re.escape(user_id)}:"}}, batch_size)
+
+class MotorAuditRepository(AuditRepository):
+    def __init__(self, database):
+        self.collection = database.audit_events
+
+    async def insert_many(self, events):
+        try:
+            await self.collection.insert_many([dict(event) for event in events], ordered=False)
+        except BulkWriteError as e:
+            # Replayed spill files may contain events that already made it
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    async def history(self, user_id, debt_id, skip, limit):
+        # _id breaks ties between events recorded in the same millisecond
+        cursor = self.collection.find({"user_id": user_id, "debt_id": debt_id}).sort([("at", -1), ("_id", -1)])
+        return await cursor.skip(skip).limit(limit).to_list(limit)
+
+    async def delete_for_user(self, user_id, batch_size):
+        return await _delete_batch(self.collection, {"user_id": user_id}, batch_size)
+
+class MotorRevocationRepository(RevocationRepository):
+    def __init__(self, database):
+        self.collection = database.revoked_tokens
+
+    async def revoke(self, jti, user_id, expires_at):
+        with suppress(DuplicateKeyError):
+            await self.collection.insert_one({
+                "_id": jti, "user_id": user_id, "revoked_at": datetime.utcnow(), "expires_at": expires_at
+            })
+
+    async def is_revoked(self, jti):
+        return await self.collection.find_one({"_id": jti}, {"_id": 1}) is not None
+
+    async def revoked_since(self, since, now):
+        query = {"expires_at": {"$gt": now}}
+        if since is not None:
+            query["revoked_at"] = {"$gte": since}
+        return [doc["_id"] async for doc in self.collection.find(query, {"_id": 1})]
+
+class MotorRepositories(Repositories):
+    def __init__(self, database):
+        super().__init__(
+            users=MotorUserRepository(database),
+            debts=MotorDebtRepository(database),
+            summaries=MotorSummaryRepository(database),
+            jobs=MotorJobRepository(database),
+            groups=MotorGroupRepository(database),
+            templates=MotorTemplateRepository(database),
+            idempotency=MotorIdempotencyRepository(database),
+            audit=MotorAuditRepository(database),
+            revocations=MotorRevocationRepository(database)
+        )
+        self.database = database
+
+    async def initialize(self):
+        # Data backfills live in the migrate_*.py scripts so startup never scans a collection
+        await self.ensure_indexes()
+
+    async def ensure_indexes(self):
+        """Create the indexes used by the debt routes"""
+        await self.database.users.create_index("email", unique=True)
+        await self.database.users.create_index("id", unique=True)
+        await self.database.users.create_index(
+            "deleted_at", partialFilterExpression={"deleted_at": {"$type": "date"}}
+        )
+        await self.database.debts.create_index([("user_id", 1), ("id", 1)], unique=True)
+        await self.database.debts.create_index([("user_id", 1), ("status", 1)])
+        await self.database.debts.create_index([("user_id", 1), ("person_name_folded", 1)])
+        # Forecasts read a user's open debts by due date
+        await self.database.debts.create_index([("user_id", 1), ("status", 1), ("due_date", 1)])
+        # Archival walks paid debts in id order across all users. The sort
+        # must come straight from the index, so paid_at stays a residual
+        # filter: with a (status, paid_at, id) index every batch would
+        # re-sort all eligible debts.
+        await self.database.debts.create_index([("status", 1), ("id", 1)])
+        # Archival moves and deletes batches by id alone
+        await self.database.debts.create_index("id")
+        await self.database.debts_archive.create_index([("user_id", 1), ("id", 1)], unique=True)
+        await self.database.debts_archive.create_index("id")
+        await self.database.expense_groups.create_index([("user_id", 1), ("id", 1)], unique=True)
+        await self.database.group_expenses.create_index([("group_id", 1), ("created_at", -1)])
+        await self.database.group_expenses.create_index("id", unique=True)
+        await self.database.group_expenses.create_index("user_id")
+        await self.database.debt_templates.create_index("id", unique=True)
+        await self.database.debt_templates.create_index([("user_id", 1), ("created_at", 1)])
+        # The materializer only ever reads active templates that are due
+        await self.database.debt_templates.create_index(
+            [("next_run_at", 1)], partialFilterExpression={"active": True}
+        )
+        await self.database.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+        await self.database.audit_events.create_index("id", unique=True)
+        await self.database.audit_events.create_index([("user_id", 1), ("debt_id", 1), ("at", -1)])
+        # Entries are only needed until the revoked token would have expired
+        await self.database.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+        await self.database.revoked_tokens.create_index("revoked_at")
+        # Text indexes are case- and diacritic-insensitive (version 3); the
+        # user_id prefix keeps every search scoped to a single user's keys.
+        await self.database.debts.create_index(
+            [("user_id", 1), ("person_name", "text"), ("description", "text")],
+            name="debts_text_search",
+            default_language="turkish",
+            weights={"person_name": 3, "description": 1},
+        )
+
+# In-memory implementation
+#
+# Keeps the same lookup paths as the MongoDB indexes: users by email and id,
+# debts by (user_id, id), and a per-user sorted index of folded person names.
+_TEXT_TOKEN_RE = re.compile(r"\w+")
+
+def _text_tokens(value: str) -> List[str]:
+    return _TEXT_TOKEN_RE.findall(fold_text(value))
+
+def _as_stored(document: dict) -> dict:
+    """Copy a document the way a BSON round trip would store it
+
+    BSON datetimes are naive UTC with millisecond precision, and str enums
+    are stored as their plain values.
+    """
+    stored = copy.deepcopy(document)
+    for key, value in stored.items():
+        if isinstance(value, Enum):
+            stored[key] = value.value
+        elif isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            stored[key] = value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return stored
+
+class MemoryStore:
+    def __init__(self):
+        self.users_by_email = {}
+        self.users_by_id = {}
+        self.debts_by_user = defaultdict(dict)
+        self.archive_by_user = defaultdict(dict)
+        self.jobs = {}
+        self.groups_by_user = defaultdict(dict)
+        self.expenses_by_group = defaultdict(dict)
+        self.templates_by_id = {}
+        # Sorted (next_run_at, template_id) for active templates
+        self.template_schedule = []
+        self.idempotency = {}
+        # (user_id, debt_id) -> [event, ...] in insertion order
+        self.audit_by_debt = defaultdict(list)
+        self.audit_ids = set()
+        self.revoked_tokens = {}
+        # user_id -> {folded person name -> {debt_id, ...}}
+        self.person_index = defaultdict(lambda: defaultdict(set))
+        self.sorted_person_keys = {}
+
+    def index_person(self, debt: dict):
+        self.person_index[debt["user_id"]][debt["person_name_folded"]].add(debt["id"])
+        self.sorted_person_keys.pop(debt["user_id"], None)
+
+    def unindex_person(self, debt: dict):
+        names = self.person_index[debt["user_id"]]
+        ids = names.get(debt["person_name_folded"])
+        if ids is not None:
+            ids.discard(debt["id"])
+            if not ids:
+                del names[debt["person_name_folded"]]
+        self.sorted_person_keys.pop(debt["user_id"], None)
+
+    def person_keys(self, user_id: str) -> List[str]:
+        keys = self.sorted_person_keys.get(user_id)
+        if keys is None:
+            keys = sorted(self.person_index[user_id])
+            self.sorted_person_keys[user_id] = keys
+        return keys
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get_by_email(self, email):
+        user = self.store.users_by_email.get(email)
+        return copy.deepcopy(user) if user else None
+
+    async def get_by_id(self, user_id):
+        user = self.store.users_by_id.get(user_id)
+        return copy.deepcopy(user) if user else None
+
+    async def create(self, user):
+        if user["email"] in self.store.users_by_email:
+            raise DuplicateKeyError(f"duplicate email: {user['email']}")
+        user = _as_stored(user)
+        self.store.users_by_email[user["email"]] = user
+        self.store.users_by_id[user["id"]] = user
+
+    async def update(self, user_id, fields):
+        user = self.store.users_by_id.get(user_id)
+        if user is None:
+            return None
+        user.update(_as_stored(fields))
+        return copy.deepcopy(user)
+
+    async def increment_data_version(self, user_id):
+        user = self.store.users_by_id.get(user_id)
+        if user is not None:
+            user["data_version"] = user.get("data_version", 0) + 1
+
+    async def delete(self, user_id):
+        user = self.store.users_by_id.pop(user_id, None)
+        if user is None:
+            return False
+        self.store.users_by_email.pop(user["email"], None)
+        return True
+
+    async def pending_deletion(self, limit):
+        users = (user for user in self.store.users_by_id.values() if user.get("deleted_at") is not None)
+        return [copy.deepcopy(user) for user in islice(users, limit)]
+
+class MemoryDebtRepository(DebtRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def create(self, debt):
+        debts = self.store.debts_by_user[debt["user_id"]]
+        if debt["id"] in debts:
+            raise DuplicateKeyError(f"duplicate debt id: {debt['id']}")
+        debt = _as_stored(debt)
+        debt.setdefault("person_name_folded", fold_text(debt["person_name"]))
+        debts[debt["id"]] = debt
+        self.store.index_person(debt)
+
+    async def create_many(self, debts):
+        inserted = 0
+        for debt in debts:
+            if debt["id"] not in self.store.debts_by_user[debt["user_id"]]:
+                await self.create(debt)
+                inserted += 1
+        return inserted
+
+    async def get(self, user_id, debt_id):
+        debt = self.store.debts_by_user[user_id].get(debt_id)
+        return copy.deepcopy(debt) if debt else None
+
+    async def list_for_user(self, user_id, limit=1000, include_archived=False):
+        debts = self.store.debts_by_user[user_id].values()
+        if include_archived:
+            debts = chain(debts, self.store.archive_by_user[user_id].values())
+        return [copy.deepcopy(debt) for debt in islice(debts, limit)]
+
+    async def get_archived(self, user_id, debt_id):
+        debt = self.store.archive_by_user[user_id].get(debt_id)
+        return copy.deepcopy(debt) if debt else None
+
+    async def update(self, user_id, debt_id, fields):
+        debt = self.store.debts_by_user[user_id].get(debt_id)
+        if debt is None:
+            return None
+        self.store.unindex_person(debt)
+        debt.update(_as_stored(fields))
+        self.store.index_person(debt)
+        return copy.deepcopy(debt)
+
+    async def delete(self, user_id, debt_id):
+        debt = self.store.debts_by_user[user_id].pop(debt_id, None)
+        if debt is None:
+            return self.store.archive_by_user[user_id].pop(debt_id, None)
+        self.store.unindex_person(debt)
+        return debt
+
+    async def archive_batch(self, paid_before, batch_size, after_id):
+        candidates = sorted(
+            (debt for debts in self.store.debts_by_user.values() for debt in debts.values()
+             if debt["status"] == DebtStatus.PAID and debt.get("paid_at") and debt["paid_at"] < paid_before
+             and (after_id is None or debt["id"] > after_id)),
+            key=lambda debt: debt["id"]
+        )[:batch_size]
+        for debt in candidates:
+            del self.store.debts_by_user[debt["user_id"]][debt["id"]]
+            self.store.unindex_person(debt)
+            self.store.archive_by_user[debt["user_id"]][debt["id"]] = debt
+        return len(candidates), (candidates[-1]["id"] if candidates else None)
+
+    async def restore_archived(self, user_id, debt_id):
+        debt = self.store.archive_by_user[user_id].pop(debt_id, None)
+        if debt is None:
+            return False
+        self.store.debts_by_user[user_id][debt_id] = debt
+        self.store.index_person(debt)
+        return True
+
+    async def search(self, user_id, text, skip, limit):
+        # Mirrors $text semantics: any term matches, scored by field weight
+        terms = set(_text_tokens(text))
+        scored = []
+        for debt in self.store.debts_by_user[user_id].values():
+            score = 3 * len(terms.intersection(_text_tokens(debt["person_name"])))
+            score += len(terms.intersection(_text_tokens(debt["description"])))
+            if score:
+                scored.append((score, debt))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return len(scored), [copy.deepcopy(debt) for _, debt in scored[skip:skip + limit]]
+
+    async def autocomplete(self, user_id, folded_prefix, limit):
+        keys = self.store.person_keys(user_id)
+        names = self.store.person_index[user_id]
+        debts = self.store.debts_by_user[user_id]
+        suggestions = []
+        for key in islice(keys, bisect_left(keys, folded_prefix), None):
+            if not key.startswith(folded_prefix) or len(suggestions) >= limit:
+                break
+            ids = names[key]
+            suggestions.append({
+                "_id": key,
+                "person_name": debts[min(ids)]["person_name"],
+                "debt_count": len(ids),
+            })
+        return suggestions
+
+    async def add_attachment(self, user_id, debt_id, attachment):
+        debt = self.store.debts_by_user[user_id].get(debt_id)
+        if debt is None:
+            return False
+        debt.setdefault("attachments", []).append(_as_stored(attachment))
+        return True
+
+    async def remove_attachment(self, user_id, debt_id, attachment_id):
+        debt = self.store.debts_by_user[user_id].get(debt_id)
+        for index, attachment in enumerate(debt.get("attachments", []) if debt else []):
+            if attachment["id"] == attachment_id:
+                return debt["attachments"].pop(index)
+        return None
+
+    async def set_attachment_thumbnail(self, user_id, debt_id, attachment_id, thumbnail_key):
+        debt = self.store.debts_by_user[user_id].get(debt_id)
+        for attachment in debt.get("attachments", []) if debt else []:
+            if attachment["id"] == attachment_id:
+                attachment["thumbnail_key"] = thumbnail_key
+
+    async def delete_for_user(self, user_id, batch_size):
+        debts = self.store.debts_by_user[user_id]
+        batch = list(islice(debts, batch_size))
+        for debt_id in batch:
+            self.store.unindex_person(debts.pop(debt_id))
+        if batch:
+            return len(batch)
+        archive = self.store.archive_by_user[user_id]
+        batch = list(islice(archive, batch_size))
+        for debt_id in batch:
+            del archive[debt_id]
+        return len(batch)
+
+class MemorySummaryRepository(SummaryRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _active(self, user_id):
+        return (debt for debt in self.store.debts_by_user[user_id].values() if debt["status"] == DebtStatus.ACTIVE)
+
+    async def dashboard_summary(self, user_id, now):
+        totals, counts, creditors = defaultdict(int), defaultdict(int), defaultdict(int)
+        overdue_count, most_overdue = 0, None
+        for debt in self._active(user_id):
+            amount = _minor_units(debt, "amount_in_try")
+            totals[debt["debt_type"]] += amount
+            counts[debt["debt_type"]] += 1
+            if debt["debt_type"] == DebtType.I_OWE:
+                creditors[debt["person_name"]] += amount
+            due_date = debt.get("due_date")
+            if due_date and due_date < now:
+                overdue_count += 1
+                if most_overdue is None or due_date < most_overdue["due_date"]:
+                    most_overdue = {"description": debt["description"], "person_name": debt["person_name"], "due_date": due_date}
+        top = min(creditors.items(), key=lambda item: (-item[1], item[0])) if creditors else None
+        return {
+            "totals_minor": dict(totals),
+            "counts": dict(counts),
+            "top_creditor": {"person_name": top[0], "total_minor": top[1]} if top else None,
+            "overdue_count": overdue_count,
+            "most_overdue": most_overdue,
+        }
+
+    async def open_balances_by_currency(self, user_id):
+        totals = defaultdict(int)
+        for debt in self._active(user_id):
+            totals[(debt["debt_type"], debt["currency"])] += _minor_units(debt, "amount")
+        return [{"debt_type": debt_type, "currency": currency, "total_minor": total}
+                for (debt_type, currency), total in totals.items()]
+
+    async def due_totals_by_day(self, user_id, start, until):
+        overdue_day = start - timedelta(days=1)
+        totals = defaultdict(int)
+        for debt in self._active(user_id):
+            due_date = debt.get("due_date")
+            if due_date and due_date < until:
+                totals[(debt["debt_type"], max(due_date, overdue_day).date())] += _minor_units(debt, "amount_in_try")
+        return [{"debt_type": debt_type, "day": day.isoformat(), "total_minor": total}
+                for (debt_type, day), total in totals.items()]
+
+    async def breakdown(self, user_id, as_of):
+        facets = {facet: {} for facet in ("by_category", "by_currency", "histogram", "aging")}
+        histogram_bounds = [bound * MINOR_UNITS for bound in ANALYTICS_HISTOGRAM_BOUNDARIES]
+
+        def add(facet, key, debt_type, amount):
+            row = facets[facet].setdefault(key, {"key": key, "count": 0, "i_owe_minor": 0, "they_owe_minor": 0})
+            row["count"] += 1
+            row["i_owe_minor" if debt_type == DebtType.I_OWE else "they_owe_minor"] += amount
+
+        def bucket(bounds, value):
+            position = bisect_right(bounds, value) - 1
+            return bounds[position] if position < len(bounds) - 1 else "over"
+
+        for debt in self._active(user_id):
+            amount_in_try = _minor_units(debt, "amount_in_try")
+            add("by_category", debt["category"], debt["debt_type"], amount_in_try)
+            add("by_currency", debt["currency"], debt["debt_type"], _minor_units(debt, "amount"))
+            add("histogram", bucket(histogram_bounds, amount_in_try), debt["debt_type"], amount_in_try)
+            due_date = debt.get("due_date")
+            if due_date and due_date < as_of:
+                days = (as_of - due_date) // timedelta(days=1)
+                add("aging", bucket(ANALYTICS_AGING_BOUNDARIES, days), debt["debt_type"], amount_in_try)
+        return {facet: list(rows.values()) for facet, rows in facets.items()}
+
+class MemoryJobRepository(JobRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get(self, name):
+        job = self.store.jobs.get(name)
+        return copy.deepcopy(job) if job else None
+
+    async def save(self, name, state):
+        self.store.jobs.setdefault(name, {"_id": name}).update(_as_stored(state))
+
+class MemoryGroupRepository(GroupRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def create(self, group):
+        self.store.groups_by_user[group["user_id"]][group["id"]] = _as_stored(group)
+
+    async def get(self, user_id, group_id):
+        group = self.store.groups_by_user[user_id].get(group_id)
+        return copy.deepcopy(group) if group else None
+
+    async def list_for_user(self, user_id, limit=1000):
+        return [copy.deepcopy(group) for group in islice(self.store.groups_by_user[user_id].values(), limit)]
+
+    async def add_member(self, user_id, group_id, member):
+        group = self.store.groups_by_user[user_id].get(group_id)
+        if group is None:
+            return None
+        group["members"].append(copy.deepcopy(member))
+        return copy.deepcopy(group)
+
+    def _apply(self, group, deltas, count):
+        for member_id, delta in deltas.items():
+            group["balances"][member_id] = group["balances"].get(member_id, 0) + delta
+        group["expense_count"] += count
+
+    async def add_expense(self, expense, deltas):
+        group = self.store.groups_by_user[expense["user_id"]].get(expense["group_id"])
+        if group is None:
+            return False
+        self.store.expenses_by_group[expense["group_id"]][expense["id"]] = _as_stored(expense)
+        self._apply(group, deltas, 1)
+        return True
+
+    async def delete_expense(self, user_id, group_id, expense_id):
+        group = self.store.groups_by_user[user_id].get(group_id)
+        if group is None or expense_id not in self.store.expenses_by_group[group_id]:
+            return False
+        expense = self.store.expenses_by_group[group_id].pop(expense_id)
+        deltas = expense_balance_deltas(expense["paid_by"], expense["splits"])
+        self._apply(group, {member_id: -delta for member_id, delta in deltas.items()}, -1)
+        return True
+
+    async def list_expenses(self, user_id, group_id, skip, limit):
+        if group_id not in self.store.groups_by_user[user_id]:
+            return []
+        expenses = sorted(self.store.expenses_by_group[group_id].values(), key=lambda e: e["created_at"], reverse=True)
+        return [copy.deepcopy(expense) for expense in expenses[skip:skip + limit]]
+
+    async def delete_for_user(self, user_id, batch_size):
+        groups = self.store.groups_by_user[user_id]
+        deleted = 0
+        for group_id in list(groups):
+            expenses = self.store.expenses_by_group[group_id]
+            for expense_id in list(islice(expenses, batch_size - deleted)):
+                del expenses[expense_id]
+                deleted += 1
+            if deleted >= batch_size:
+                return deleted
+        if deleted:
+            return deleted
+        batch = list(islice(groups, batch_size))
+        for group_id in batch:
+            del groups[group_id]
+            self.store.expenses_by_group.pop(group_id, None)
+        return len(batch)
+
+class MemoryTemplateRepository(TemplateRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _schedule(self, template):
+        if template["active"] and template.get("next_run_at") is not None:
+            insort(self.store.template_schedule, (template["next_run_at"], template["id"]))
+
+    def _unschedule(self, template):
+        key = (template.get("next_run_at"), template["id"])
+        schedule = self.store.template_schedule
+        if key[0] is not None:
+            position = bisect_left(schedule, key)
+            if position < len(schedule) and schedule[position] == key:
+                del schedule[position]
+
+    async def create(self, template):
+        template = _as_stored(template)
+        self.store.templates_by_id[template["id"]] = template
+        self._schedule(template)
+
+    async def get(self, user_id, template_id):
+        template = self.store.templates_by_id.get(template_id)
+        return copy.deepcopy(template) if template and template["user_id"] == user_id else None
+
+    async def list_for_user(self, user_id, limit=1000):
+        templates = (t for t in self.store.templates_by_id.values() if t["user_id"] == user_id)
+        return [copy.deepcopy(template) for template in islice(templates, limit)]
+
+    async def deactivate(self, user_id, template_id):
+        template = self.store.templates_by_id.get(template_id)
+        if template is None or template["user_id"] != user_id:
+            return False
+        self._unschedule(template)
+        template.update(active=False, next_run_at=None)
+        return True
+
+    async def due(self, now, limit):
+        schedule = self.store.template_schedule
+        due = islice(takewhile(lambda entry: entry[0] <= now, schedule), limit)
+        return [copy.deepcopy(self.store.templates_by_id[template_id]) for _, template_id in due]
+
+    async def advance(self, template_id, generated_count, fields):
+        template = self.store.templates_by_id.get(template_id)
+        if template is None or template["generated_count"] != generated_count:
+            return False
+        self._unschedule(template)
+        template.update(_as_stored(fields))
+        self._schedule(template)
+        return True
+
+    async def delete_for_user(self, user_id, batch_size):
+        templates = self.store.templates_by_id
+        batch = list(islice((t for t in templates.values() if t["user_id"] == user_id), batch_size))
+        for template in batch:
+            self._unschedule(template)
+            del templates[template["id"]]
+        return len(batch)
+
+class MemoryIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def acquire(self, record, now):
+        existing = self.store.idempotency.get(record["_id"])
+        if existing is not None and existing["expires_at"] > now and (
+            existing["state"] != "pending" or existing["locked_until"] > now
+        ):
+            return copy.deepcopy(existing)
+        self.store.idempotency[record["_id"]] = _as_stored(record)
+        return None
+
+    async def complete(self, record_id, response):
+        record = self.store.idempotency.get(record_id)
+        if record is not None:
+            record.update(state="completed", response=copy.deepcopy(response))
+
+    async def release(self, record_id):
+        record = self.store.idempotency.get(record_id)
+        if record is not None and record["state"] == "pending":
+            del self.store.idempotency[record_id]
+
+    async def delete_for_user(self, user_id, batch_size):
+        prefix = f"{user_id}:"
+        batch = list(islice((key for key in self.store.idempotency if key.startswith(prefix)), batch_size))
+        for key in batch:
+            del self.store.idempotency[key]
+        return len(batch)
+
+class MemoryAuditRepository(AuditRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def insert_many(self, events):
+        for event in events:
+            if event["id"] not in self.store.audit_ids:
+                self.store.audit_ids.add(event["id"])
+                self.store.audit_by_debt[(event["user_id"], event["debt_id"])].append(_as_stored(event))
+
+    async def history(self, user_id, debt_id, skip, limit):
+        events = reversed(self.store.audit_by_debt[(user_id, debt_id)])
+        events = sorted(events, key=lambda event: event["at"], reverse=True)
+        return [copy.deepcopy(event) for event in events[skip:skip + limit]]
+
+    async def delete_for_user(self, user_id, batch_size):
+        deleted = 0
+        for key in [key for key in self.store.audit_by_debt if key[0] == user_id]:
+            events = self.store.audit_by_debt[key]
+            batch, self.store.audit_by_debt[key] = events[:batch_size - deleted], events[batch_size - deleted:]
+            self.store.audit_ids.difference_update(event["id"] for event in batch)
+            deleted += len(batch)
+            if not self.store.audit_by_debt[key]:
+                del self.store.audit_by_debt[key]
+            if deleted >= batch_size:
+                break
+        return deleted
+
+class MemoryRevocationRepository(RevocationRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def revoke(self, jti, user_id, expires_at):
+        self.store.revoked_tokens.setdefault(jti, _as_stored({
+            "_id": jti, "user_id": user_id, "revoked_at": datetime.utcnow(), "expires_at": expires_at
+        }))
+
+    async def is_revoked(self, jti):
+        return jti in self.store.revoked_tokens
+
+    async def revoked_since(self, since, now):
+        return [
+            jti for jti, doc in self.store.revoked_tokens.items()
+            if doc["expires_at"] > now and (since is None or doc["revoked_at"] >= since)
+        ]
+
+class MemoryRepositories(Repositories):
+    def __init__(self, store: Optional[MemoryStore] = None):
+        self.store = store or MemoryStore()
+        super().__init__(
+            users=MemoryUserRepository(self.store),
+            debts=MemoryDebtRepository(self.store),
+            summaries=MemorySummaryRepository(self.store),
+            jobs=MemoryJobRepository(self.store),
+            groups=MemoryGroupRepository(self.store),
+            templates=MemoryTemplateRepository(self.store),
+            idempotency=MemoryIdempotencyRepository(self.store),
+            audit=MemoryAuditRepository(self.store),
+            revocations=MemoryRevocationRepository(self.store)
+        )
+
+def build_repositories(backend: str = STORAGE_BACKEND, database=None) -> Repositories:
+    if backend == "memory":
+        return MemoryRepositories()
+    if backend == "mongo":
+        return MotorRepositories(database)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+def get_repositories(request: Request) -> Repositories:
+    return request.app.state.repositories
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    repos: Repositories = Depends(get_repositories)
+):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        email: str = payload.get("sub")
+        if email is None:
+            raise credentials_exception
+    except jwt.PyJWTError:
+        raise credentials_exception
+
+    # Tokens issued before revocation existed carry no jti and simply expire
+    jti = payload.get("jti")
+    if jti is not None and request.app.state.revocation_filter.might_be_revoked(jti):
+        revoked = await repos.revocations.is_revoked(jti)
+        REVOCATION_FILTER_HITS.labels(str(revoked).lower()).inc()
+        if revoked:
+            raise credentials_exception
+    
+    user_cache: TTLCache = request.app.state.user_cache
+    user = user_cache.get(email)
+    if user is None:
+        user_document = await repos.users.get_by_email(email)
+        if user_document is None:
+            raise credentials_exception
+        user = User(**user_document)
+        user_cache.set(email, user)
+    if user.deleted_at is not None:
+        raise credentials_exception
+    return user
+
+# Fallback rates
+FALLBACK_RATES = {
+    "TRY": 1.0,
+    "USD": 34.0,  # Approximate fallback
+    "EUR": 37.0   # Approximate fallback
+}
+FX_API_URL = os.environ.get('FX_API_URL', 'https://api.exchangerate-api.com/v4/latest/TRY')
+FX_CACHE_TTL_SECONDS = float(os.environ.get('FX_CACHE_TTL_SECONDS', '3600'))
+FX_FALLBACK_TTL_SECONDS = float(os.environ.get('FX_FALLBACK_TTL_SECONDS', '60'))
+FX_FETCH_TIMEOUT_SECONDS = float(os.environ.get('FX_FETCH_TIMEOUT_SECONDS', '5'))
+
+def fetch_exchange_rates() -> Optional[dict]:
+    """Get exchange rates from external API (blocking; returns None on failure)"""
+    try:
+        with FX_FETCH_DURATION.time():
+            response = requests.get(FX_API_URL, timeout=FX_FETCH_TIMEOUT_SECONDS)
+        if response.status_code == 200:
+            rates = response.json()["rates"]
+            return {
+                "TRY": 1.0,
+                "USD": 1.0 / rates["USD"],
+                "EUR": 1.0 / rates["EUR"]
+            }
+        FX_FETCH_FAILURES.labels("http_status").inc()
+    except Exception as e:
+        FX_FETCH_FAILURES.labels(type(e).__name__ if isinstance(e, requests.RequestException) else "error").inc()
+        logger.error(f"Error fetching exchange rates: {e}")
+    return None
+
+class ExchangeRateCache:
+    """Process-wide exchange-rate snapshot with single-flight refresh
+
+    Fallback rates are served for a short FX_FALLBACK_TTL_SECONDS so an
+    upstream outage does not turn every conversion into a fetch attempt.
+    """
+
+    def __init__(self, ttl: float = FX_CACHE_TTL_SECONDS, fallback_ttl: float = FX_FALLBACK_TTL_SECONDS):
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.rates = None
+        self.expires_at = 0.0
+        self._lock = None
+        # Set in multi-worker mode so only one process fetches upstream
+        self.shared: Optional["SharedStateStore"] = None
+
+    async def get(self) -> dict:
+        if self.rates is not None and time.monotonic() < self.expires_at:
+            return self.rates
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.rates is not None and time.monotonic() < self.expires_at:
+                return self.rates
+            if self.shared is not None and not await self._refresh_from_shared():
+                return self.rates
+            rates = await asyncio.to_thread(fetch_exchange_rates)
+            if rates is None:
+                FX_FALLBACKS.inc()
+                self.rates = self.rates or dict(FALLBACK_RATES)
+                self.expires_at = time.monotonic() + self.fallback_ttl
+            else:
+                self.rates = rates
+                self.expires_at = time.monotonic() + self.ttl
+                if self.shared is not None:
+                    await self.shared.put("fx_rates", rates, self.ttl)
+                    # On failure the lease is kept until it expires, which
+                    # backs every worker off the failing upstream.
+                    await self.shared.release_lease("fx_rates")
+            return self.rates
+
+    async def _refresh_from_shared(self) -> bool:
+        """Adopt the shared snapshot; returns True if this worker should fetch"""
+        snapshot = await self.shared.get("fx_rates")
+        if snapshot is not None and snapshot["expires_at"] > datetime.utcnow():
+            self.rates = snapshot["value"]
+            remaining = (snapshot["expires_at"] - datetime.utcnow()).total_seconds()
+            self.expires_at = time.monotonic() + remaining
+            return False
+        if await self.shared.acquire_lease("fx_rates", FX_REFRESH_LEASE_SECONDS):
+            return True
+        # Another worker is refreshing; serve the stale snapshot briefly
+        self.rates = (snapshot or {}).get("value") or self.rates or dict(FALLBACK_RATES)
+        self.expires_at = time.monotonic() + FX_SHARED_RETRY_SECONDS
+        return False
+
+fx_cache = ExchangeRateCache()
+
+# Multi-worker coordination
+#
+# With several worker processes (see serve.py), state that must agree across
+# processes goes through MongoDB: a snapshot/lease collection for the FX
+# rates and a capped collection that broadcasts cache invalidations.
+SHARED_STATE_BACKEND = os.environ.get('SHARED_STATE_BACKEND', 'local')
+FX_REFRESH_LEASE_SECONDS = 30.0
+FX_SHARED_RETRY_SECONDS = 2.0
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+WORKER_ID = f"{platform.node()}:{os.getpid()}"
+# Analytics are keyed by the user's data_version, so entries never go stale;
+# the TTL only bounds how long an idle user's breakdown stays resident
+ANALYTICS_CACHE_TTL_SECONDS = float(os.environ.get('ANALYTICS_CACHE_TTL_SECONDS', '600'))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', '10000'))
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+class SharedStateStore:
+    """Named snapshots and refresh leases in the shared_state collection"""
+
+    def __init__(self, database):
+        self.collection = database.shared_state
+
+    async def get(self, name: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": name})
+
+    async def put(self, name: str, value, ttl: float):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": name},
+            {"$set": {"value": value, "updated_at": now, "expires_at": now + timedelta(seconds=ttl), "owner": WORKER_ID}},
+            upsert=True
+        )
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Matches only an expired lease or our own; otherwise the upsert
+            # collides with the holder's _id and raises DuplicateKeyError.
+            await self.collection.update_one(
+                {"_id": f"lease:{name}", "$or": [{"lease_until": {"$lt": now}}, {"owner": WORKER_ID}]},
+                {"$set": {"owner": WORKER_ID, "lease_until": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release_lease(self, name: str):
+        await self.collection.delete_one({"_id": f"lease:{name}", "owner": WORKER_ID})
+
+class InvalidationBus:
+    """In-process cache invalidation: handlers run as soon as a key is published"""
+
+    def __init__(self):
+        self.handlers = defaultdict(list)
+
+    def subscribe(self, topic: str, handler):
+        self.handlers[topic].append(handler)
+
+    def _dispatch(self, topic: str, key):
+        for handler in self.handlers[topic]:
+            handler(key)
+
+    def _dispatch_all(self):
+        for topic in list(self.handlers):
+            self._dispatch(topic, None)
+
+    async def publish(self, topic: str, key: str):
+        self._dispatch(topic, key)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class MongoInvalidationBus(InvalidationBus):
+    """Broadcasts invalidations to every worker through a tailable capped collection"""
+
+    def __init__(self, database, size_bytes: int = 4 * 1024 * 1024):
+        super().__init__()
+        self.database = database
+        self.size_bytes = size_bytes
+        self.collection = database.cache_invalidations
+        self._task = None
+
+    async def start(self):
+        try:
+            await self.database.create_collection("cache_invalidations", capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def publish(self, topic, key):
+        self._dispatch(topic, key)
+        await self.collection.insert_one({"topic": topic, "key": key, "origin": WORKER_ID})
+
+    async def _tail(self):
+        last_id = ObjectId.from_datetime(datetime.now(timezone.utc))
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {"_id": {"$gt": last_id}}, cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for event in cursor:
+                        last_id = event["_id"]
+                        if event.get("origin") != WORKER_ID:
+                            self._dispatch(event["topic"], event["key"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events may have been missed while disconnected, so drop
+                # everything rather than risk serving stale auth data.
+                logger.error(f"Invalidation bus error, clearing caches: {e}")
+                self._dispatch_all()
+                await asyncio.sleep(1.0)
+
+def build_invalidation_bus(backend: str = SHARED_STATE_BACKEND, database=None) -> InvalidationBus:
+    if backend == "mongo" and database is not None:
+        return MongoInvalidationBus(database)
+    return InvalidationBus()
+
+async def get_exchange_rates():
+    """Get exchange rates, refreshing the cached snapshot when it is stale"""
+    return await fx_cache.get()
+
+def revalue_balances(subtotals: List[dict], rates: dict, target: str) -> Dict[str, Decimal]:
+    """Convert per-currency subtotals into the target currency
+
+    Works on the handful of (debt_type, currency) subtotals, so the cost is
+    O(currencies) per request. Decimal arithmetic keeps the cross-rate
+    conversion from adding binary rounding error; results are rounded to
+    cents once, at the end.
+    """
+    target_rate = Decimal(str(rates[target]))
+    totals = {DebtType.I_OWE.value: Decimal(0), DebtType.THEY_OWE.value: Decimal(0)}
+    for row in subtotals:
+        rate = Decimal(str(rates.get(row["currency"], 1.0)))
+        totals[row["debt_type"]] += Decimal(row["total_minor"]) / MINOR_UNITS * rate / target_rate
+    cent = Decimal("0.01")
+    return {debt_type: total.quantize(cent, rounding=ROUND_HALF_UP) for debt_type, total in totals.items()}
+
+async def convert_to_try(amount: float, currency: str) -> float:
+    """Convert amount to TRY, rounded to whole kuruş"""
+    if currency == "TRY":
+        return amount
+    
+    rates = await get_exchange_rates()
+    converted = Decimal(str(amount)) * Decimal(str(rates.get(currency, 1.0)))
+    return from_minor(to_minor(converted))
+
+# Rate limiting
+#
+# Limits are "<requests>/<seconds>" and apply per client IP and per email on
+# the authentication routes, which are dominated by bcrypt CPU time.
+class RateLimit(BaseModel):
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        limit, period = value.split("/")
+        return cls(limit=int(limit), period=float(period))
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_PER_IP = RateLimit.parse(os.environ.get('RATE_LIMIT_PER_IP', '20/60'))
+RATE_LIMIT_PER_EMAIL = RateLimit.parse(os.environ.get('RATE_LIMIT_PER_EMAIL', '5/60'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+# Reverse proxies in front of the app that append to X-Forwarded-For; 0
+# ignores the header. RATE_LIMIT_TRUST_FORWARDED_FOR=true means one proxy.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get(
+    'RATE_LIMIT_TRUSTED_PROXIES',
+    '1' if os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() == 'true' else '0'
+))
+
+RATE_LIMITED_TOTAL = Counter(
+    "rate_limited_requests_total", "Requests rejected by the rate limiter", ["route", "scope"]
+)
+
+class RateLimiter(ABC):
+    @abstractmethod
+    async def hit(self, key: str, rate: RateLimit) -> Optional[float]:
+        """Consume one request for key; returns seconds to wait if over the limit"""
+
+    async def initialize(self):
+        """Prepare the backing store before serving"""
+
+class MemoryRateLimiter(RateLimiter):
+    """Token buckets kept in LRU order so idle keys are evicted from the front
+
+    A bucket that has been idle for a full period is back at capacity, so
+    dropping it loses nothing; max_keys bounds memory under key floods.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets = OrderedDict()  # key -> (tokens, updated_at, period)
+
+    def _evict(self, now: float):
+        while self.buckets:
+            key, (_, updated_at, period) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_keys and now - updated_at < period:
+                break
+            del self.buckets[key]
+
+    async def hit(self, key, rate):
+        now = self.clock()
+        refill_per_second = rate.limit / rate.period
+        tokens, updated_at, _ = self.buckets.pop(key, (float(rate.limit), now, rate.period))
+        tokens = min(float(rate.limit), tokens + (now - updated_at) * refill_per_second)
+
+        retry_after = None
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            retry_after = (1.0 - tokens) / refill_per_second
+        self.buckets[key] = (tokens, now, rate.period)
+        self._evict(now)
+        return retry_after
+
+class MongoRateLimiter(RateLimiter):
+    """Sliding-window counters shared by every worker through MongoDB
+
+    Each key has one document per fixed window; the estimate weights the
+    previous window by how much of it still overlaps the sliding window.
+    Documents expire through a TTL index two windows after they close.
+    """
+
+    def __init__(self, database):
+        self.collection = database.rate_limits
+
+    async def initialize(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, key, rate):
+        now = time.time()
+        window = int(now // rate.period)
+        window_start = window * rate.period
+        current = await self.collection.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {
+                "expires_at": datetime.utcfromtimestamp(window_start + 2 * rate.period)
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = await self.collection.find_one({"_id": f"{key}:{window - 1}"}, {"count": 1})
+        overlap = 1.0 - (now - window_start) / rate.period
+        estimate = current["count"] + (previous["count"] if previous else 0) * overlap
+        if estimate <= rate.limit:
+            return None
+        return max(window_start + rate.period - now, 1.0)
+
+def build_rate_limiter(backend: str = RATE_LIMIT_BACKEND, database=None) -> RateLimiter:
+    if backend == "memory" or database is None:
+        return MemoryRateLimiter()
+    if backend == "mongo":
+        return MongoRateLimiter(database)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+def client_ip(request: Request, trusted_proxies: int = RATE_LIMIT_TRUSTED_PROXIES) -> str:
+    """The address the outermost trusted proxy saw
+
+    Entries left of that one are whatever the client chose to send, so
+    only the hop appended by our own proxies can be used as a limit key.
+    """
+    if trusted_proxies > 0:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            return hops[max(len(hops) - trusted_proxies, 0)]
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limit(request: Request, route: str, email: str):
+    limiter: RateLimiter = request.app.state.rate_limiter
+    checks = [
+        ("ip", f"{route}:ip:{client_ip(request)}", RATE_LIMIT_PER_IP),
+        ("email", f"{route}:email:{email.lower()}", RATE_LIMIT_PER_EMAIL),
+    ]
+    for scope, key, rate in checks:
+        retry_after = await limiter.hit(key, rate)
+        if retry_after is not None:
+            RATE_LIMITED_TOTAL.labels(route, scope).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, please try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+# Idempotency keys
+#
+# Mutations that a retrying client could repeat accept an Idempotency-Key
+# header. The first response is stored for IDEMPOTENCY_TTL_SECONDS and
+# replayed on retries; a retry that arrives while the first request is still
+# running gets 409 instead of executing twice.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+async def run_idempotent(request: Request, user: User, repos: Repositories, handler):
+    """Run handler at most once per (user, Idempotency-Key)
+
+    Without the header this is a plain call. Only successful responses are
+    stored; if the handler raises, the key is released so the client can
+    retry. Reusing a key with a different request body is rejected.
+    """
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        return await handler()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key header")
+
+    body = await request.body()
+    fingerprint = hashlib.sha256(f"{request.method} {request.url.path}\n".encode() + body).hexdigest()
+    record_id = f"{user.id}:{key}"
+    now = datetime.utcnow()
+    existing = await repos.idempotency.acquire({
+        "_id": record_id,
+        "state": "pending",
+        "fingerprint": fingerprint,
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    }, now)
+
+    if existing is not None:
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if existing["state"] == "pending":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is already in progress",
+                headers={"Retry-After": "1"},
+            )
+        response = existing["response"]
+        return JSONResponse(response["body"], status_code=response["status_code"], headers={"Idempotent-Replayed": "true"})
+
+    try:
+        result = await handler()
+    except BaseException:
+        await repos.idempotency.release(record_id)
+        raise
+    await repos.idempotency.complete(record_id, {"status_code": 200, "body": jsonable_encoder(result)})
+    return result
+
+# Audit log
+#
+# Debt mutations are recorded as events without an extra write on the request
+# path: routes append to an in-process buffer and a background task flushes
+# it with insert_many every AUDIT_BATCH_SIZE events or AUDIT_FLUSH_INTERVAL_SECONDS.
+# Events that cannot reach the store (buffer full, or still pending at
+# shutdown) are appended to a JSON-lines spill file and replayed on startup.
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', '1.0'))
+AUDIT_MAX_BUFFERED = int(os.environ.get('AUDIT_MAX_BUFFERED', '10000'))
+AUDIT_SHUTDOWN_TIMEOUT_SECONDS = float(os.environ.get('AUDIT_SHUTDOWN_TIMEOUT_SECONDS', '5.0'))
+AUDIT_SPILL_DIR = Path(os.environ.get('AUDIT_SPILL_DIR', ROOT_DIR / 'audit_spill'))
+AUDITED_FIELDS = (
+    "debt_type", "person_name", "amount", "currency", "description", "category", "status", "due_date", "paid_at"
+)
+
+def debt_changes(before: dict, after: dict) -> Dict[str, list]:
+    """[old, new] for every audited field that differs"""
+    return jsonable_encoder({
+        field: [before.get(field), after.get(field)]
+        for field in AUDITED_FIELDS
+        if jsonable_encoder(before.get(field)) != jsonable_encoder(after.get(field))
+    })
+
+class AuditLog:
+    def __init__(self, repos: Repositories, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS,
+                 max_buffered: int = AUDIT_MAX_BUFFERED, spill_dir: Path = AUDIT_SPILL_DIR):
+        self.repos = repos
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.spill_dir = spill_dir
+        self.buffer: List[dict] = []
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: str, debt_id: str, action: AuditAction, changes: Optional[dict] = None):
+        """Queue an event; never blocks the request on the store"""
+        event = AuditEvent(user_id=user_id, debt_id=debt_id, action=action, changes=changes or {}).dict()
+        if len(self.buffer) >= self.max_buffered:
+            # The store is not keeping up; keep the event on disk rather than drop it
+            self._spill_in_background([event])
+            return
+        self.buffer.append(event)
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def has_pending(self, user_id: str, debt_id: str) -> bool:
+        return any(event["debt_id"] == debt_id and event["user_id"] == user_id for event in self.buffer)
+
+    async def discard_user(self, user_id: str):
+        """Drop a deleted account's buffered events"""
+        # Under the flush lock, so a running flush never sees the buffer shift
+        async with self.flush_lock:
+            self.buffer[:] = [event for event in self.buffer if event["user_id"] != user_id]
+
+    async def flush(self):
+        async with self.flush_lock:
+            while self.buffer:
+                batch = self.buffer[:self.batch_size]
+                try:
+                    await self.repos.audit.insert_many(batch)
+                except Exception as e:
+                    logger.error(f"Audit flush failed, keeping {len(self.buffer)} events buffered: {e}")
+                    return
+                # Only drop the batch once it is written; a cancelled insert
+                # is retried or spilled, and duplicate ids are skipped.
+                del self.buffer[:len(batch)]
+                AUDIT_EVENTS_WRITTEN.inc(len(batch))
+
+    async def _run(self):
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            self.wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        await self.replay_spilled()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        with suppress(Exception):
+            await asyncio.wait_for(self.flush(), timeout=AUDIT_SHUTDOWN_TIMEOUT_SECONDS)
+        if self.buffer:
+            events, self.buffer = self.buffer, []
+            # Queued behind any background spills on the same single thread
+            await asyncio.get_running_loop().run_in_executor(audit_spill_executor, self._spill, events)
+
+    def _spill_in_background(self, events: List[dict]):
+        future = asyncio.get_running_loop().run_in_executor(audit_spill_executor, self._spill, events)
+        future.add_done_callback(self._spill_done)
+
+    @staticmethod
+    def _spill_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Audit spill failed, events lost: {future.exception()}")
+
+    def _spill(self, events: List[dict]):
+        """Append events to this process's spill file (blocking; runs on audit_spill_executor)"""
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(jsonable_encoder(event)) + "\n" for event in events)
+        with open(self.spill_dir / f"audit-{_process_token(os.getpid())}.jsonl", "a", encoding="utf-8") as spill:
+            spill.write(lines)
+        AUDIT_EVENTS_SPILLED.inc(len(events))
+        logger.warning(f"Spilled {len(events)} audit events to {self.spill_dir}")
+
+    def _claimable_spill_files(self) -> List[Path]:
+        """Spill files nobody is replaying, including claims left by dead processes
+
+        A claim made under this process's own pid is left over from an
+        earlier incarnation (containers restart with the same pid), since
+        replaying never leaves a claim behind in the process that made it.
+        """
+        own_pid = str(os.getpid())
+        paths = list(self.spill_dir.glob("audit-*.jsonl"))
+        for path in self.spill_dir.glob("audit-*.replaying"):
+            owner = path.suffixes[-2].lstrip(".") if len(path.suffixes) >= 2 else ""
+            pid = owner.split("-", 1)[0]
+            if not pid.isdigit() or pid == own_pid or _process_token(int(pid)) != owner:
+                paths.append(path)
+        return sorted(paths)
+
+    async def _without_deleted_accounts(self, events: List[dict]) -> List[dict]:
+        """Events of accounts deleted (or being deleted) since they were spilled are not restored"""
+        live = set()
+        for user_id in {event["user_id"] for event in events}:
+            user = await self.repos.users.get_by_id(user_id)
+            if user and not user.get("deleted_at"):
+                live.add(user_id)
+        return [event for event in events if event["user_id"] in live]
+
+    async def replay_spilled(self):
+        """Write events spilled by earlier processes, then remove their files
+
+        A file is only removed once every event in it is stored; on failure
+        it is kept for the next start, and duplicate ids are skipped then.
+        """
+        if not self.spill_dir.is_dir():
+            return
+        for path in self._claimable_spill_files():
+            # Renaming claims the file, so concurrently starting workers
+            # never replay the same one
+            claimed = path.with_name(f"{path.name.split('.', 1)[0]}.jsonl.{_process_token(os.getpid())}.replaying")
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                events = await asyncio.get_running_loop().run_in_executor(
+                    audit_spill_executor, _read_spill_file, claimed
+                )
+                events = await self._without_deleted_accounts(events)
+                for start in range(0, len(events), self.batch_size):
+                    await self.repos.audit.insert_many(events[start:start + self.batch_size])
+            except Exception as e:
+                logger.error(f"Replaying {path.name} failed, keeping it for the next start: {e}")
+                with suppress(OSError):
+                    claimed.rename(claimed.with_name(f"audit-retry-{uuid.uuid4().hex}.jsonl"))
+                continue
+            claimed.unlink()
+            logger.info(f"Replayed {len(events)} spilled audit events from {path.name}")
+
+# One thread keeps appends to a spill file in order
+audit_spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-spill")
+
+def _read_boot_id() -> str:
+    with suppress(OSError):
+        return Path("/proc/sys/kernel/random/boot_id").read_text().strip()[:8]
+    return ""
+
+_BOOT_ID = _read_boot_id()
+
+def _process_token(pid: int) -> Optional[str]:
+    """pid-bootid-starttime for a running process, or None once it has exited
+
+    The pid alone cannot tell a live claim from a stale one when a
+    restarted container reuses it, so Linux adds the boot id and the
+    process start time; elsewhere only the pid's liveness is checked.
+    """
+    if not _BOOT_ID:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return str(pid)
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as stat:
+            # Fields are counted after the command name, which may contain spaces
+            started = stat.read().rsplit(b")", 1)[1].split()[19].decode()
+    except (OSError, IndexError):
+        return None
+    return f"{pid}-{_BOOT_ID}-{started}"
+
+def _read_spill_file(path: Path) -> List[dict]:
+    events = []
+    with open(path, encoding="utf-8") as spill:
+        for line in spill:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash mid-write
+                logger.warning(f"Skipping a truncated audit event in {path.name}")
+                continue
+            event["at"] = datetime.fromisoformat(event["at"])
+            events.append(event)
+    return events
+
+def get_audit_log(request: Request) -> AuditLog:
+    return request.app.state.audit_log
+
+# Token revocation
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '5'))
+REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', '100000'))
+REVOCATION_FILTER_ERROR_RATE = float(os.environ.get('REVOCATION_FILTER_ERROR_RATE', '0.001'))
+# Incremental reads overlap by this much, so revocations stamped by a worker
+# whose clock runs slightly behind are not missed
+REVOCATION_CLOCK_SKEW = timedelta(seconds=30)
+
+class BloomFilter:
+    """Set membership in a fixed bit array: false positives at error_rate, never false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class TokenRevocationFilter:
+    """Per-worker Bloom filter over revoked token ids
+
+    A miss proves the token is not revoked, so authenticating the common
+    case costs a few hashes and no store round trip; only hits are checked
+    against the store. Revocations arrive through the invalidation bus and
+    every refresh_interval the revocations written since the last refresh
+    are read, in case a bus event was missed. Bloom filters cannot remove
+    entries, so once per token lifetime the filter is rebuilt from the
+    revocations that have not yet expired.
+    """
+
+    def __init__(self, repos: Repositories, capacity: int = REVOCATION_FILTER_CAPACITY,
+                 error_rate: float = REVOCATION_FILTER_ERROR_RATE,
+                 refresh_interval: float = REVOCATION_REFRESH_SECONDS,
+                 rebuild_interval: timedelta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)):
+        self.repos = repos
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.filter = BloomFilter(capacity, error_rate)
+        self.built_at: Optional[datetime] = None
+        self.refreshed_at: Optional[datetime] = None
+        # Ids added while a rebuild is reading the store
+        self.added_during_rebuild: Optional[List[str]] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, jti: Optional[str]):
+        """Invalidation bus handler; None (bus reconnect) is covered by the next refresh"""
+        if jti is None:
+            return
+        self.filter.add(jti)
+        if self.added_during_rebuild is not None:
+            self.added_during_rebuild.append(jti)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        return jti in self.filter
+
+    async def refresh(self):
+        now = datetime.utcnow()
+        if self.built_at is None or now - self.built_at >= self.rebuild_interval:
+            self.added_during_rebuild = []
+            try:
+                revoked = await self.repos.revocations.revoked_since(None, now)
+                rebuilt = BloomFilter(max(self.capacity, 2 * len(revoked)), self.error_rate)
+                for jti in chain(revoked, self.added_during_rebuild):
+                    rebuilt.add(jti)
+            finally:
+                self.added_during_rebuild = None
+            self.filter = rebuilt
+            self.built_at = now
+        else:
+            for jti in await self.repos.revocations.revoked_since(self.refreshed_at - REVOCATION_CLOCK_SKEW, now):
+                self.filter.add(jti)
+        self.refreshed_at = now
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Revocation filter refresh failed: {e}")
+
+    async def start(self):
+        await self.refresh()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+
+# Attachment storage
+#
+# Receipts and contracts are streamed straight from the request body into an
+# object store: S3 (or any S3-compatible service via ATTACHMENT_S3_ENDPOINT_URL)
+# using multipart uploads, or a directory for local development. At most one
+# upload part is held in memory per request. Metadata lives on the debt.
+ATTACHMENT_BACKEND = os.environ.get('ATTACHMENT_BACKEND', 'filesystem')
+ATTACHMENT_DIR = Path(os.environ.get('ATTACHMENT_DIR', ROOT_DIR / 'attachments'))
+ATTACHMENT_S3_BUCKET = os.environ.get('ATTACHMENT_S3_BUCKET', '')
+ATTACHMENT_S3_ENDPOINT_URL = os.environ.get('ATTACHMENT_S3_ENDPOINT_URL') or None
+ATTACHMENT_S3_PREFIX = os.environ.get('ATTACHMENT_S3_PREFIX', 'attachments/')
+ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', str(25 * 1024 * 1024)))
+# S3 requires every part but the last to be at least 5 MiB
+ATTACHMENT_PART_BYTES = max(int(os.environ.get('ATTACHMENT_PART_BYTES', str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+ATTACHMENT_CHUNK_BYTES = 256 * 1024
+ATTACHMENT_URL_TTL_SECONDS = int(os.environ.get('ATTACHMENT_URL_TTL_SECONDS', '300'))
+ATTACHMENT_IO_WORKERS = int(os.environ.get('ATTACHMENT_IO_WORKERS', '8'))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '256'))
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.environ.get('THUMBNAIL_MAX_SOURCE_BYTES', str(15 * 1024 * 1024)))
+
+# Blocking object-store calls and image resizing each get their own pool
+attachment_executor = ThreadPoolExecutor(max_workers=ATTACHMENT_IO_WORKERS, thread_name_prefix="attachment-io")
+thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+async def run_blocking(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+class ObjectStore(ABC):
+    @abstractmethod
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes], content_type: str) -> int:
+        """Store an object from an async byte stream and return its size
+
+        If the stream raises, nothing is left behind and the error propagates.
+        """
+
+    @abstractmethod
+    async def put_bytes(self, key: str, data: bytes, content_type: str) -> None: ...
+
+    @abstractmethod
+    async def read_bytes(self, key: str) -> bytes: ...
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Stream bytes start..end (inclusive) of an object"""
+
+    @abstractmethod
+    def presigned_url(self, key: str, filename: str, expires_in: int) -> Optional[str]:
+        """A time-limited direct download URL, or None if the store cannot issue one"""
+
+    @abstractmethod
+    async def delete(self, keys: List[str]) -> None: ...
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str, limit: int) -> int:
+        """Delete up to limit objects under prefix; returns the number deleted"""
+
+class FilesystemObjectStore(ObjectStore):
+    """Objects as files under a root directory; downloads are streamed by the API"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put_stream(self, key, chunks, content_type):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        partial_path = path.with_name(path.name + ".part")
+        handle = await run_blocking(attachment_executor, open, partial_path, "wb")
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                await run_blocking(attachment_executor, handle.write, chunk)
+            handle.close()
+            os.replace(partial_path, path)
+        except BaseException:
+            handle.close()
+            partial_path.unlink(missing_ok=True)
+            raise
+        return size
+
+    async def put_bytes(self, key, data, content_type):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await run_blocking(attachment_executor, path.write_bytes, data)
+
+    async def read_bytes(self, key):
+        return await run_blocking(attachment_executor, self._path(key).read_bytes)
+
+    async def read_range(self, key, start, end):
+        handle = await run_blocking(attachment_executor, open, self._path(key), "rb")
+        try:
+            handle.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await run_blocking(attachment_executor, handle.read, min(ATTACHMENT_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            handle.close()
+
+    def presigned_url(self, key, filename, expires_in):
+        return None
+
+    async def delete(self, keys):
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+    async def delete_prefix(self, prefix, limit):
+        def delete_files():
+            directory = self._path(prefix)
+            if not directory.is_dir():
+                return 0
+            files = list(islice((path for path in directory.rglob("*") if path.is_file()), limit))
+            for path in files:
+                path.unlink(missing_ok=True)
+            if not files:
+                shutil.rmtree(directory, ignore_errors=True)
+            return len(files)
+
+        return await run_blocking(attachment_executor, delete_files)
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        # boto3 is only needed when attachments are stored in S3
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    async def _call(self, method: str, **kwargs):
+        return await run_blocking(attachment_executor, getattr(self.client, method), Bucket=self.bucket, **kwargs)
+
+    async def put_stream(self, key, chunks, content_type):
+        key = self.prefix + key
+        upload_id, parts, buffer, size = None, [], bytearray(), 0
+
+        async def upload_part(body: bytes):
+            part_number = len(parts) + 1
+            response = await self._call(
+                "upload_part", Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) >= ATTACHMENT_PART_BYTES:
+                    if upload_id is None:
+                        response = await self._call("create_multipart_upload", Key=key, ContentType=content_type)
+                        upload_id = response["UploadId"]
+                    await upload_part(bytes(buffer))
+                    buffer = bytearray()
+            if upload_id is None:
+                # Small objects fit in one part; a single PUT is cheaper
+                await self._call("put_object", Key=key, Body=bytes(buffer), ContentType=content_type)
+            else:
+                if buffer:
+                    await upload_part(bytes(buffer))
+                await self._call(
+                    "complete_multipart_upload", Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+        except BaseException:
+            if upload_id is not None:
+                with suppress(Exception):
+                    await self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+            raise
+        return size
+
+    async def put_bytes(self, key, data, content_type):
+        await self._call("put_object", Key=self.prefix + key, Body=data, ContentType=content_type)
+
+    async def read_bytes(self, key):
+        response = await self._call("get_object", Key=self.prefix + key)
+        return await run_blocking(attachment_executor, response["Body"].read)
+
+    async def read_range(self, key, start, end):
+        response = await self._call("get_object", Key=self.prefix + key, Range=f"bytes={start}-{end}")
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await run_blocking(attachment_executor, body.read, ATTACHMENT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def presigned_url(self, key, filename, expires_in):
+        # Signing is local; no request is made to S3
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.prefix + key,
+                "ResponseContentDisposition": content_disposition(filename),
+            },
+            ExpiresIn=expires_in,
+        )
+
+    async def delete(self, keys):
+        if keys:
+            await self._call("delete_objects", Delete={"Objects": [{"Key": self.prefix + key} for key in keys]})
+
+    async def delete_prefix(self, prefix, limit):
+        # delete_objects accepts at most 1000 keys per call
+        response = await self._call("list_objects_v2", Prefix=self.prefix + prefix, MaxKeys=min(limit, 1000))
+        objects = [{"Key": item["Key"]} for item in response.get("Contents", [])]
+        if objects:
+            await self._call("delete_objects", Delete={"Objects": objects})
+        return len(objects)
+
+def build_object_store(backend: str = ATTACHMENT_BACKEND) -> ObjectStore:
+    if backend == "filesystem":
+        return FilesystemObjectStore(ATTACHMENT_DIR)
+    if backend == "s3":
+        if not ATTACHMENT_S3_BUCKET:
+            raise ValueError("ATTACHMENT_S3_BUCKET is required for ATTACHMENT_BACKEND=s3")
+        return S3ObjectStore(ATTACHMENT_S3_BUCKET, ATTACHMENT_S3_ENDPOINT_URL, ATTACHMENT_S3_PREFIX)
+    raise ValueError(f"Unknown ATTACHMENT_BACKEND: {backend}")
+
+def content_disposition(filename: str) -> str:
+    # RFC 6266 filename* so non-ASCII (e.g. Turkish) names survive latin-1 headers
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+def get_object_store(request: Request) -> ObjectStore:
+    return request.app.state.object_store
+
+def make_thumbnail(data: bytes) -> Optional[bytes]:
+    """JPEG thumbnail of an image, or None if Pillow is missing or the data is not an image"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = BytesIO()
+            image.convert("RGB").save(output, "JPEG", quality=80)
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+# Thumbnail tasks run after the upload response; keep references so they are not collected
+_thumbnail_tasks = set()
+
+async def generate_thumbnail(store: ObjectStore, repos: Repositories, user_id: str, debt_id: str, attachment: dict):
+    try:
+        data = await store.read_bytes(attachment["storage_key"])
+        thumbnail = await run_blocking(thumbnail_executor, make_thumbnail, data)
+        if thumbnail is None:
+            return
+        thumbnail_key = attachment["storage_key"] + ".thumb.jpg"
+        await store.put_bytes(thumbnail_key, thumbnail, "image/jpeg")
+        await repos.debts.set_attachment_thumbnail(user_id, debt_id, attachment["id"], thumbnail_key)
+    except Exception as e:
+        logger.error(f"Thumbnail generation failed for attachment {attachment['id']}: {e}")
+
+async def delete_attachment_objects(store: ObjectStore, attachments: List[dict]):
+    """Remove stored files and thumbnails of a deleted debt's attachments
+
+    The debt is already gone, so a storage failure is logged rather than
+    failing the request; delete_prefix on account deletion sweeps leftovers.
+    """
+    keys = [key for attachment in attachments
+            for key in (attachment["storage_key"], attachment.get("thumbnail_key")) if key]
+    if not keys:
+        return
+    try:
+        await store.delete(keys)
+    except Exception as e:
+        logger.error(f"Failed to delete {len(keys)} attachment objects: {e}")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+def schedule_thumbnail(store: ObjectStore, repos: Repositories, user_id: str, debt_id: str, attachment: dict):
+    if not attachment["content_type"].startswith("image/") or attachment["size"] > THUMBNAIL_MAX_SOURCE_BYTES:
+        return
+    task = asyncio.create_task(generate_thumbnail(store, repos, user_id, debt_id, attachment))
+    _thumbnail_tasks.add(task)
+    task.add_done_callback(_thumbnail_tasks.discard)
 
-# Create the main app without a prefix
-app = FastAPI()
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single-range Range header, or None for the whole object
 
-# Security
-security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = "debt-tracker-secret-key-change-in-production"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+    Raises 416 for ranges outside the object; multi-range requests are
+    served in full, which RFC 9110 allows.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
 
-# Enums
-class DebtType(str, Enum):
-    I_OWE = "i_owe"
-    THEY_OWE = "they_owe"
+# Cash-flow forecast
+#
+# Due amounts arrive as per-day rows (stored debts plus recurring occurrences
+# not generated yet) and are binned into day or week buckets with NumPy.
+FORECAST_GRANULARITY_DAYS = {ForecastGranularity.DAY: 1, ForecastGranularity.WEEK: 7}
 
-class Currency(str, Enum):
-    TRY = "TRY"
-    USD = "USD"
-    EUR = "EUR"
+async def recurring_due_rows(repos: Repositories, user_id: str, start: datetime, until: datetime) -> List[dict]:
+    """Per-occurrence rows for template occurrences due before until that are not materialized yet"""
+    overdue_day = start - timedelta(days=1)
+    rows = []
+    for template in await repos.templates.list_for_user(user_id):
+        if not template["active"]:
+            continue
+        amount_minor = to_minor(await convert_to_try(template["amount"], template["currency"]))
+        installments = template.get("installments")
+        index = template["generated_count"]
+        while installments is None or index < installments:
+            due_date = occurrence_due_date(template["start_date"], template["frequency"], template["interval"], index)
+            if due_date >= until:
+                break
+            rows.append({
+                "debt_type": template["debt_type"],
+                "day": max(due_date, overdue_day).strftime("%Y-%m-%d"),
+                "total_minor": amount_minor,
+            })
+            index += 1
+    return rows
 
-class DebtCategory(str, Enum):
-    PERSONAL_LOAN = "personal_loan"
-    RENT = "rent"
-    SHARED_EXPENSE = "shared_expense"
-    BUSINESS_LOAN = "business_loan"
-    EDUCATION = "education"
-    OTHER = "other"
+def bin_cash_flow(rows: List[dict], start: datetime, days: int, bin_days: int) -> dict:
+    """Sum due rows into bins of bin_days starting at start
 
-class DebtStatus(str, Enum):
-    ACTIVE = "active"
-    PAID = "paid"
-    PARTIALLY_PAID = "partially_paid"
+    Returns integer minor-unit arrays "inflow", "outflow" and
+    "cumulative_net" (one entry per bin) plus overdue totals.
+    """
+    bins = -(-days // bin_days)
+    due = np.array([row["day"] for row in rows], dtype="datetime64[D]")
+    offsets = (due - np.datetime64(start.date(), "D")).astype(np.int64)
+    amounts = np.array([row["total_minor"] for row in rows], dtype=np.int64)
+    incoming = np.array([row["debt_type"] == DebtType.THEY_OWE.value for row in rows], dtype=bool)
 
-# Models
-class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    email: EmailStr
-    hashed_password: str
-    full_name: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    overdue = offsets < 0
+    upcoming = ~overdue & (offsets < days)
+    bin_index = offsets[upcoming] // bin_days
+    # bincount sums in float64, which is exact for minor-unit totals below 2**53
+    inflow = np.bincount(bin_index, weights=np.where(incoming, amounts, 0)[upcoming], minlength=bins)
+    outflow = np.bincount(bin_index, weights=np.where(incoming, 0, amounts)[upcoming], minlength=bins)
+    inflow, outflow = np.rint(inflow).astype(np.int64), np.rint(outflow).astype(np.int64)
+    overdue_inflow = int(amounts[overdue & incoming].sum())
+    overdue_outflow = int(amounts[overdue & ~incoming].sum())
+    return {
+        "inflow": inflow,
+        "outflow": outflow,
+        "cumulative_net": np.cumsum(inflow - outflow) + (overdue_inflow - overdue_outflow),
+        "overdue_inflow": overdue_inflow,
+        "overdue_outflow": overdue_outflow,
+    }
 
-class UserCreate(BaseModel):
-    email: EmailStr
-    password: str
-    full_name: str
+# Background jobs
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.environ.get('ARCHIVE_BATCH_PAUSE_SECONDS', '0.05'))
+ARCHIVE_JOB = "archive_paid_debts"
 
-class UserLogin(BaseModel):
-    email: EmailStr
-    password: str
+async def archive_settled_debts(
+    repos: Repositories,
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause: float = ARCHIVE_BATCH_PAUSE_SECONDS
+) -> int:
+    """Move paid debts older than the cutoff to the archive in resumable batches
 
-class Token(BaseModel):
-    access_token: str
-    token_type: str
+    Progress is checkpointed after every batch; an interrupted run resumes
+    from its last id with its original cutoff. Returns debts moved this run.
+    """
+    checkpoint = await repos.jobs.get(ARCHIVE_JOB) or {}
+    if checkpoint.get("state") == "running":
+        cutoff = checkpoint["cutoff"]
+        after_id = checkpoint.get("last_id")
+    else:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        after_id = None
+    await repos.jobs.save(ARCHIVE_JOB, {
+        "state": "running", "cutoff": cutoff, "last_id": after_id, "started_at": datetime.utcnow()
+    })
 
-class Debt(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    user_id: str
-    debt_type: DebtType
-    person_name: str
-    amount: float
-    currency: Currency
-    amount_in_try: float = 0.0
-    description: str
-    category: DebtCategory
-    status: DebtStatus = DebtStatus.ACTIVE
-    due_date: Optional[datetime] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-    paid_at: Optional[datetime] = None
+    moved_total = 0
+    while True:
+        moved, last_id = await repos.debts.archive_batch(cutoff, batch_size, after_id)
+        if last_id is None:
+            break
+        moved_total += moved
+        after_id = last_id
+        await repos.jobs.save(ARCHIVE_JOB, {"last_id": after_id})
+        # Spread the work out so other tenants' queries are not starved
+        await asyncio.sleep(pause)
 
-class DebtCreate(BaseModel):
-    debt_type: DebtType
-    person_name: str
-    amount: float
-    currency: Currency
-    description: str
-    category: DebtCategory
-    due_date: Optional[datetime] = None
+    await repos.jobs.save(ARCHIVE_JOB, {
+        "state": "completed", "last_id": None, "finished_at": datetime.utcnow(), "moved": moved_total
+    })
+    logger.info(f"Archived {moved_total} paid debts settled before {cutoff:%Y-%m-%d}")
+    return moved_total
 
-class DebtUpdate(BaseModel):
-    person_name: Optional[str] = None
-    amount: Optional[float] = None
-    currency: Optional[Currency] = None
-    description: Optional[str] = None
-    category: Optional[DebtCategory] = None
-    due_date: Optional[datetime] = None
+RECURRING_HORIZON_DAYS = int(os.environ.get('RECURRING_HORIZON_DAYS', '31'))
+RECURRING_INTERVAL_SECONDS = float(os.environ.get('RECURRING_INTERVAL_SECONDS', '900'))
+RECURRING_BATCH_SIZE = int(os.environ.get('RECURRING_BATCH_SIZE', '200'))
+RECURRING_JOB = "materialize_recurring_debts"
 
-class DashboardStats(BaseModel):
-    total_owed: float
-    total_to_collect: float
-    net_balance: float
-    person_owe_most: Optional[str] = None
-    person_owe_most_amount: float = 0.0
-    most_overdue_debt: Optional[str] = None
-    most_overdue_days: int = 0
-    active_debts_count: int
-    overdue_debts_count: int
+async def plan_occurrences(template: dict, now: datetime, horizon: timedelta, limit: int) -> Tuple[List[dict], dict]:
+    """Debts for a template's occurrences due within the horizon, and its advanced schedule
 
-# Utility functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    At most limit occurrences are planned; a template that is further behind
+    stays due and is picked up again by the next batch.
+    """
+    amount_in_try = await convert_to_try(template["amount"], template["currency"])
+    start, frequency, interval = template["start_date"], template["frequency"], template["interval"]
+    installments = template.get("installments")
+    index = template["generated_count"]
+    until = now + horizon
+    documents = []
+    while len(documents) < limit and (installments is None or index < installments):
+        due_date = occurrence_due_date(start, frequency, interval, index)
+        if due_date > until:
+            break
+        documents.append(debt_document(Debt(
+            id=recurring_debt_id(template["id"], index),
+            user_id=template["user_id"],
+            debt_type=template["debt_type"],
+            person_name=template["person_name"],
+            amount=template["amount"],
+            currency=template["currency"],
+            amount_in_try=amount_in_try,
+            description=template["description"],
+            category=template["category"],
+            due_date=due_date,
+            template_id=template["id"],
+            occurrence=index + 1
+        )))
+        index += 1
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+    if installments is not None and index >= installments:
+        return documents, {"generated_count": index, "next_due_date": None, "next_run_at": None, "active": False}
+    next_due_date = occurrence_due_date(start, frequency, interval, index)
+    return documents, {
+        "generated_count": index,
+        "next_due_date": next_due_date,
+        "next_run_at": next_due_date - horizon,
+    }
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+async def materialize_templates(
+    repos: Repositories, templates: List[dict], now: datetime, horizon: timedelta, limit: int
+) -> int:
+    """Generate pending occurrences for a batch of templates with a single insert"""
+    documents, advances = [], []
+    for template in templates:
+        planned, fields = await plan_occurrences(template, now, horizon, limit)
+        documents += planned
+        advances.append((template, fields))
+    # Insert before advancing: a crash in between re-plans the same
+    # occurrences, whose deterministic ids are then skipped as duplicates.
+    created = await repos.debts.create_many(documents)
+    for user_id in {document["user_id"] for document in documents}:
+        await repos.users.increment_data_version(user_id)
+    for template, fields in advances:
+        await repos.templates.advance(template["id"], template["generated_count"], fields)
+    return created
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    user = await db.users.find_one({"email": email})
-    if user is None:
-        raise credentials_exception
-    return User(**user)
+async def materialize_recurring_debts(
+    repos: Repositories,
+    horizon_days: int = RECURRING_HORIZON_DAYS,
+    batch_size: int = RECURRING_BATCH_SIZE
+) -> int:
+    """Generate debts from recurring templates up to horizon_days ahead
 
-async def get_exchange_rates():
-    """Get exchange rates from external API"""
-    try:
-        response = requests.get("https://api.exchangerate-api.com/v4/latest/TRY")
-        if response.status_code == 200:
-            rates = response.json()["rates"]
-            return {
-                "TRY": 1.0,
-                "USD": 1.0 / rates["USD"],
-                "EUR": 1.0 / rates["EUR"]
-            }
-    except Exception as e:
-        logging.error(f"Error fetching exchange rates: {e}")
-    
-    # Fallback rates
-    return {
-        "TRY": 1.0,
-        "USD": 34.0,  # Approximate fallback
-        "EUR": 37.0   # Approximate fallback
+    Only templates whose next_run_at has passed are read, through the
+    next-run index, so a tick costs O(due templates) rather than a scan.
+    Returns debts created this run.
+    """
+    now = datetime.utcnow()
+    horizon = timedelta(days=horizon_days)
+    created = 0
+    while True:
+        templates = await repos.templates.due(now, batch_size)
+        if not templates:
+            break
+        created += await materialize_templates(repos, templates, now, horizon, batch_size)
+        if len(templates) < batch_size:
+            break
+    if created:
+        logger.info(f"Generated {created} recurring debts due before {now + horizon:%Y-%m-%d}")
+    return created
+
+ACCOUNT_DELETION_BATCH_SIZE = int(os.environ.get('ACCOUNT_DELETION_BATCH_SIZE', '500'))
+ACCOUNT_DELETION_BATCH_PAUSE_SECONDS = float(os.environ.get('ACCOUNT_DELETION_BATCH_PAUSE_SECONDS', '0.05'))
+ACCOUNT_DELETION_INTERVAL_SECONDS = float(os.environ.get('ACCOUNT_DELETION_INTERVAL_SECONDS', '300'))
+ACCOUNT_DELETION_JOB = "delete_accounts"
+
+async def delete_account_data(
+    repos: Repositories,
+    store: ObjectStore,
+    audit: AuditLog,
+    user_id: str,
+    batch_size: int = ACCOUNT_DELETION_BATCH_SIZE,
+    pause: float = ACCOUNT_DELETION_BATCH_PAUSE_SECONDS
+) -> dict:
+    """Delete everything a user owns in bounded batches, then the user itself
+
+    Every step deletes until nothing is left, so an interrupted run simply
+    starts over from its checkpointed step. Progress (documents deleted per
+    step) is saved under jobs/delete_account:<user_id>.
+    """
+    name = f"delete_account:{user_id}"
+
+    async def delete_audit_events():
+        # Buffered events would otherwise be flushed back after this step
+        await audit.discard_user(user_id)
+        return await repos.audit.delete_for_user(user_id, batch_size)
+
+    # Templates go first so the materializer cannot add debts behind the job
+    steps = {
+        "recurring": lambda: repos.templates.delete_for_user(user_id, batch_size),
+        "debts": lambda: repos.debts.delete_for_user(user_id, batch_size),
+        "groups": lambda: repos.groups.delete_for_user(user_id, batch_size),
+        "audit_events": delete_audit_events,
+        "idempotency_keys": lambda: repos.idempotency.delete_for_user(user_id, batch_size),
+        "attachments": lambda: store.delete_prefix(f"{user_id}/", batch_size),
     }
+    checkpoint = await repos.jobs.get(name) or {}
+    if checkpoint.get("state") == "completed":
+        return checkpoint
+    deleted = checkpoint.get("deleted", {})
+    order = list(steps)
+    resume_from = order.index(checkpoint["step"]) if checkpoint.get("step") in steps else 0
+    await repos.jobs.save(name, {"state": "running", "user_id": user_id, "started_at": datetime.utcnow()})
 
-async def convert_to_try(amount: float, currency: str) -> float:
-    """Convert amount to TRY"""
-    if currency == "TRY":
-        return amount
-    
-    rates = await get_exchange_rates()
-    return amount * rates.get(currency, 1.0)
+    for step in order[resume_from:]:
+        await repos.jobs.save(name, {"step": step})
+        while True:
+            count = await steps[step]()
+            if count == 0:
+                break
+            deleted[step] = deleted.get(step, 0) + count
+            await repos.jobs.save(name, {"deleted": deleted})
+            # Yield to other tenants between batches
+            await asyncio.sleep(pause)
+
+    await repos.users.delete(user_id)
+    state = {"state": "completed", "step": None, "deleted": deleted, "finished_at": datetime.utcnow()}
+    await repos.jobs.save(name, state)
+    logger.info(f"Deleted account {user_id}: {deleted}")
+    return state
+
+# Deletions started by requests run in the background; keep references so
+# they are not collected, and never run two for the same user in one process
+_account_deletions = {}
+
+def start_account_deletion(repos: Repositories, store: ObjectStore, audit: AuditLog, user_id: str):
+    if user_id in _account_deletions:
+        return
+    task = asyncio.create_task(delete_account_data(repos, store, audit, user_id))
+    _account_deletions[user_id] = task
+    task.add_done_callback(lambda _: _account_deletions.pop(user_id, None))
+
+async def resume_account_deletions(repos: Repositories, store: ObjectStore, audit: AuditLog, limit: int = 100) -> int:
+    """Finish deletions interrupted by a restart; returns the number of accounts processed"""
+    users = await repos.users.pending_deletion(limit)
+    for user in users:
+        if user["id"] not in _account_deletions:
+            await delete_account_data(repos, store, audit, user["id"])
+    return len(users)
+
+# How long a job's lease outlives a worker that stops renewing it
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+
+async def run_leased(shared: SharedStateStore, name: str, interval: float, job):
+    """Run job while renewing its lease; a run that loses the lease is cancelled
+
+    The lease is held for JOB_LEASE_SECONDS at a time and renewed until the
+    job finishes, so a run longer than the interval never overlaps another
+    worker's. Afterwards it is kept until interval has passed since the
+    start, so across workers the job still runs once per interval.
+    """
+    started = time.monotonic()
+    task = asyncio.create_task(job())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=JOB_LEASE_SECONDS / 3)
+            if done:
+                break
+            if not await shared.acquire_lease(name, JOB_LEASE_SECONDS):
+                logger.error(f"Background job {name} lost its lease, stopping this run")
+                task.cancel()
+                break
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    await shared.acquire_lease(name, max(interval - (time.monotonic() - started), 0.0))
+
+async def run_periodically(name: str, interval: float, job, shared: Optional[SharedStateStore] = None):
+    """Run job every interval seconds; with shared state only the lease holder runs it"""
+    while True:
+        try:
+            if shared is None:
+                await job()
+            elif await shared.acquire_lease(name, JOB_LEASE_SECONDS):
+                await run_leased(shared, name, interval, job)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # Only the job run was cancelled (lease lost); keep scheduling
+        except Exception as e:
+            logger.error(f"Background job {name} failed: {e}")
+        await asyncio.sleep(interval)
 
 # Authentication Routes
 @api_router.post("/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request, repos: Repositories = Depends(get_repositories)):
+    await enforce_rate_limit(request, "register", user_data.email)
+    
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await repos.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=400,
@@ -201,14 +3847,14 @@ async def register(user_data: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_password_hashing("hash", get_password_hash, user_data.password)
     user = User(
         email=user_data.email,
         hashed_password=hashed_password,
         full_name=user_data.full_name
     )
     
-    await db.users.insert_one(user.dict())
+    await repos.users.create(user.dict())
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -219,9 +3865,11 @@ async def register(user_data: UserCreate):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.post("/login", response_model=Token)
-async def login(user_data: UserLogin):
-    user = await db.users.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user["hashed_password"]):
+async def login(user_data: UserLogin, request: Request, repos: Repositories = Depends(get_repositories)):
+    await enforce_rate_limit(request, "login", user_data.email)
+    user = await repos.users.get_by_email(user_data.email)
+    if (not user or not await run_password_hashing("verify", verify_password, user_data.password, user["hashed_password"])
+            or user.get("deleted_at") is not None):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -235,9 +3883,34 @@ async def login(user_data: UserLogin):
     
     return {"access_token": access_token, "token_type": "bearer"}
 
+@api_router.post("/logout")
+async def logout(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Revoke the presented token; it is rejected from now until it would have expired"""
+    payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    jti = payload.get("jti")
+    if jti is None:
+        raise HTTPException(status_code=400, detail="Token cannot be revoked")
+    await repos.revocations.revoke(jti, current_user.id, datetime.utcfromtimestamp(payload["exp"]))
+    await request.app.state.invalidation_bus.publish("token", jti)
+    return {"message": "Logged out"}
+
 # Debt Routes
 @api_router.post("/debts", response_model=Debt)
-async def create_debt(debt_data: DebtCreate, current_user: User = Depends(get_current_user)):
+async def create_debt(
+    debt_data: DebtCreate,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    return await run_idempotent(request, current_user, repos, lambda: insert_debt(debt_data, current_user, repos, audit))
+
+async def insert_debt(debt_data: DebtCreate, current_user: User, repos: Repositories, audit: AuditLog) -> Debt:
     # Convert amount to TRY
     amount_in_try = await convert_to_try(debt_data.amount, debt_data.currency.value)
     
@@ -253,161 +3926,824 @@ async def create_debt(debt_data: DebtCreate, current_user: User = Depends(get_cu
         due_date=debt_data.due_date
     )
     
-    await db.debts.insert_one(debt.dict())
+    document = debt_document(debt)
+    await repos.debts.create(document)
+    await repos.users.increment_data_version(current_user.id)
+    audit.record(current_user.id, debt.id, AuditAction.CREATED, debt_changes({}, document))
     return debt
 
 @api_router.get("/debts", response_model=List[Debt])
-async def get_debts(current_user: User = Depends(get_current_user)):
-    debts = await db.debts.find({"user_id": current_user.id}).to_list(1000)
+async def get_debts(
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    debts = await repos.debts.list_for_user(current_user.id, include_archived=include_archived)
     return [Debt(**debt) for debt in debts]
 
+@api_router.get("/debts/search", response_model=DebtSearchResult)
+async def search_debts(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    total, debts = await repos.debts.search(current_user.id, q, (page - 1) * page_size, page_size)
+    return DebtSearchResult(
+        items=[Debt(**debt) for debt in debts],
+        total=total,
+        page=page,
+        page_size=page_size
+    )
+
+@api_router.get("/debts/autocomplete", response_model=List[PersonSuggestion])
+async def autocomplete_person_names(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    folded = fold_text(prefix)
+    if not folded:
+        return []
+    suggestions = await repos.debts.autocomplete(current_user.id, folded, limit)
+    return [
+        PersonSuggestion(person_name=item["person_name"], debt_count=item["debt_count"])
+        for item in suggestions
+    ]
+
 @api_router.get("/debts/{debt_id}", response_model=Debt)
-async def get_debt(debt_id: str, current_user: User = Depends(get_current_user)):
-    debt = await db.debts.find_one({"id": debt_id, "user_id": current_user.id})
+async def get_debt(
+    debt_id: str,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    debt = await repos.debts.get(current_user.id, debt_id)
+    if not debt and include_archived:
+        debt = await repos.debts.get_archived(current_user.id, debt_id)
     if not debt:
         raise HTTPException(status_code=404, detail="Debt not found")
     return Debt(**debt)
 
 @api_router.put("/debts/{debt_id}", response_model=Debt)
-async def update_debt(debt_id: str, debt_data: DebtUpdate, current_user: User = Depends(get_current_user)):
-    debt = await db.debts.find_one({"id": debt_id, "user_id": current_user.id})
+async def update_debt(
+    debt_id: str,
+    debt_data: DebtUpdate,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    debt = await repos.debts.get(current_user.id, debt_id)
     if not debt:
         raise HTTPException(status_code=404, detail="Debt not found")
     
     update_data = debt_data.dict(exclude_unset=True)
     update_data["updated_at"] = datetime.utcnow()
+    if "person_name" in update_data:
+        update_data["person_name_folded"] = fold_text(update_data["person_name"])
     
     # If amount or currency changed, recalculate TRY amount
     if "amount" in update_data or "currency" in update_data:
         amount = update_data.get("amount", debt["amount"])
         currency = update_data.get("currency", debt["currency"])
         update_data["amount_in_try"] = await convert_to_try(amount, currency)
+        update_data.update(money_fields(amount, update_data["amount_in_try"]))
     
-    await db.debts.update_one(
-        {"id": debt_id, "user_id": current_user.id},
-        {"$set": update_data}
-    )
-    
-    updated_debt = await db.debts.find_one({"id": debt_id, "user_id": current_user.id})
+    updated_debt = await repos.debts.update(current_user.id, debt_id, update_data)
+    if not updated_debt:
+        raise HTTPException(status_code=404, detail="Debt not found")
+    await repos.users.increment_data_version(current_user.id)
+    changes = debt_changes(debt, updated_debt)
+    if changes:
+        audit.record(current_user.id, debt_id, AuditAction.UPDATED, changes)
     return Debt(**updated_debt)
 
 @api_router.delete("/debts/{debt_id}")
-async def delete_debt(debt_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.debts.delete_one({"id": debt_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+async def delete_debt(
+    debt_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    debt = await repos.debts.delete(current_user.id, debt_id)
+    if debt is None:
         raise HTTPException(status_code=404, detail="Debt not found")
+    await delete_attachment_objects(store, debt.get("attachments", []))
+    await repos.users.increment_data_version(current_user.id)
+    audit.record(current_user.id, debt_id, AuditAction.DELETED)
     return {"message": "Debt deleted successfully"}
 
 @api_router.post("/debts/{debt_id}/mark-paid")
-async def mark_debt_paid(debt_id: str, current_user: User = Depends(get_current_user)):
-    debt = await db.debts.find_one({"id": debt_id, "user_id": current_user.id})
+async def mark_debt_paid(
+    debt_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    return await run_idempotent(request, current_user, repos, lambda: set_debt_paid(debt_id, current_user, repos, audit))
+
+async def set_debt_paid(debt_id: str, current_user: User, repos: Repositories, audit: AuditLog) -> dict:
+    now = datetime.utcnow()
+    debt = await repos.debts.update(
+        current_user.id, debt_id,
+        {"status": DebtStatus.PAID, "paid_at": now, "updated_at": now}
+    )
     if not debt:
         raise HTTPException(status_code=404, detail="Debt not found")
-    
-    await db.debts.update_one(
-        {"id": debt_id, "user_id": current_user.id},
-        {"$set": {"status": DebtStatus.PAID, "paid_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
-    )
-    
+    await repos.users.increment_data_version(current_user.id)
+    audit.record(current_user.id, debt_id, AuditAction.PAID)
     return {"message": "Debt marked as paid"}
 
 @api_router.post("/debts/{debt_id}/mark-unpaid")
-async def mark_debt_unpaid(debt_id: str, current_user: User = Depends(get_current_user)):
-    debt = await db.debts.find_one({"id": debt_id, "user_id": current_user.id})
+async def mark_debt_unpaid(
+    debt_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    return await run_idempotent(request, current_user, repos, lambda: set_debt_unpaid(debt_id, current_user, repos, audit))
+
+async def set_debt_unpaid(debt_id: str, current_user: User, repos: Repositories, audit: AuditLog) -> dict:
+    fields = {"status": DebtStatus.ACTIVE, "paid_at": None, "updated_at": datetime.utcnow()}
+    debt = await repos.debts.update(current_user.id, debt_id, fields)
+    if not debt and await repos.debts.restore_archived(current_user.id, debt_id):
+        # Reopening a settled debt brings it back into the live collection
+        debt = await repos.debts.update(current_user.id, debt_id, fields)
     if not debt:
         raise HTTPException(status_code=404, detail="Debt not found")
-    
-    await db.debts.update_one(
-        {"id": debt_id, "user_id": current_user.id},
-        {"$set": {"status": DebtStatus.ACTIVE, "paid_at": None, "updated_at": datetime.utcnow()}}
-    )
-    
+    await repos.users.increment_data_version(current_user.id)
+    audit.record(current_user.id, debt_id, AuditAction.UNPAID)
     return {"message": "Debt marked as unpaid"}
 
+@api_router.get("/debts/{debt_id}/history", response_model=List[AuditEvent])
+async def get_debt_history(
+    debt_id: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    """Audit events for a debt, newest first; still available after deletion"""
+    if audit.has_pending(current_user.id, debt_id):
+        # Read-your-writes for the debt's own recent changes
+        await audit.flush()
+    events = await repos.audit.history(current_user.id, debt_id, (page - 1) * page_size, page_size)
+    return [AuditEvent(**event) for event in events]
+
+# Attachment Routes
+async def get_attachment_or_404(repos: Repositories, user_id: str, debt_id: str, attachment_id: str) -> Attachment:
+    # Settled debts keep their receipts readable after archiving
+    debt = await repos.debts.get(user_id, debt_id) or await repos.debts.get_archived(user_id, debt_id)
+    for attachment in (debt or {}).get("attachments", []):
+        if attachment["id"] == attachment_id:
+            return Attachment(**attachment)
+    raise HTTPException(status_code=404, detail="Attachment not found")
+
+@api_router.post("/debts/{debt_id}/attachments", response_model=Attachment)
+async def upload_attachment(
+    debt_id: str,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    """Upload the raw request body as an attachment
+
+    The body is the file itself (not multipart/form-data), so it can be
+    streamed to storage without spooling it to disk first.
+    """
+    if not await repos.debts.get(current_user.id, debt_id):
+        raise HTTPException(status_code=404, detail="Debt not found")
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if declared > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Attachment is too large")
+
+    attachment_id = str(uuid.uuid4())
+    storage_key = f"{current_user.id}/{debt_id}/{attachment_id}"
+
+    async def limited_body():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > ATTACHMENT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Attachment is too large")
+            yield chunk
+
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    size = await store.put_stream(storage_key, limited_body(), content_type)
+    attachment = Attachment(
+        id=attachment_id,
+        filename=os.path.basename(filename),
+        content_type=content_type,
+        size=size,
+        storage_key=storage_key,
+    )
+    if not await repos.debts.add_attachment(current_user.id, debt_id, attachment.dict()):
+        # The debt was deleted during the upload
+        await store.delete([storage_key])
+        raise HTTPException(status_code=404, detail="Debt not found")
+    audit.record(current_user.id, debt_id, AuditAction.ATTACHMENT_ADDED, {"attachments": [None, attachment.filename]})
+    schedule_thumbnail(store, repos, current_user.id, debt_id, attachment.dict())
+    return attachment
+
+@api_router.get("/debts/{debt_id}/attachments/{attachment_id}")
+async def download_attachment(
+    debt_id: str,
+    attachment_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store)
+):
+    """Stream an attachment; honours single byte ranges for resumable downloads"""
+    attachment = await get_attachment_or_404(repos, current_user.id, debt_id, attachment_id)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(attachment.filename),
+    }
+    if attachment.size == 0:
+        return Response(b"", media_type=attachment.content_type, headers=headers)
+    byte_range = parse_byte_range(request.headers.get("range"), attachment.size)
+    start, end = byte_range or (0, attachment.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{attachment.size}"
+    return StreamingResponse(
+        store.read_range(attachment.storage_key, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=attachment.content_type,
+        headers=headers,
+    )
+
+@api_router.get("/debts/{debt_id}/attachments/{attachment_id}/url", response_model=AttachmentLink)
+async def get_attachment_url(
+    debt_id: str,
+    attachment_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store)
+):
+    """A pre-signed URL for downloading directly from object storage"""
+    attachment = await get_attachment_or_404(repos, current_user.id, debt_id, attachment_id)
+    url = store.presigned_url(attachment.storage_key, attachment.filename, ATTACHMENT_URL_TTL_SECONDS)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Direct download URLs are not available; download the attachment instead")
+    return AttachmentLink(url=url, expires_in=ATTACHMENT_URL_TTL_SECONDS)
+
+@api_router.get("/debts/{debt_id}/attachments/{attachment_id}/thumbnail")
+async def get_attachment_thumbnail(
+    debt_id: str,
+    attachment_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store)
+):
+    attachment = await get_attachment_or_404(repos, current_user.id, debt_id, attachment_id)
+    if attachment.thumbnail_key is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return Response(await store.read_bytes(attachment.thumbnail_key), media_type="image/jpeg")
+
+@api_router.delete("/debts/{debt_id}/attachments/{attachment_id}")
+async def delete_attachment(
+    debt_id: str,
+    attachment_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    attachment = await repos.debts.remove_attachment(current_user.id, debt_id, attachment_id)
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    await delete_attachment_objects(store, [attachment])
+    audit.record(current_user.id, debt_id, AuditAction.ATTACHMENT_REMOVED, {"attachments": [attachment["filename"], None]})
+    return {"message": "Attachment deleted successfully"}
+
+# Recurring Debt Routes
+@api_router.post("/recurring", response_model=DebtTemplate)
+async def create_recurring_debt(
+    template_data: DebtTemplateCreate,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    now = datetime.utcnow()
+    start_date = to_utc_naive(template_data.start_date)
+    template = DebtTemplate(
+        user_id=current_user.id,
+        **template_data.dict(exclude={"start_date"}),
+        start_date=start_date,
+        next_due_date=start_date,
+        next_run_at=now
+    )
+    await repos.templates.create(template.dict())
+
+    # Generate the occurrences already inside the horizon right away
+    await materialize_templates(
+        repos, [template.dict()], now, timedelta(days=RECURRING_HORIZON_DAYS), RECURRING_BATCH_SIZE
+    )
+    return DebtTemplate(**await repos.templates.get(current_user.id, template.id))
+
+@api_router.get("/recurring", response_model=List[DebtTemplate])
+async def get_recurring_debts(current_user: User = Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
+    return [DebtTemplate(**template) for template in await repos.templates.list_for_user(current_user.id)]
+
+@api_router.delete("/recurring/{template_id}")
+async def delete_recurring_debt(
+    template_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Stop generating new occurrences; debts already generated are kept"""
+    if not await repos.templates.deactivate(current_user.id, template_id):
+        raise HTTPException(status_code=404, detail="Recurring debt not found")
+    return {"message": "Recurring debt stopped"}
+
 # Dashboard Routes
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
-    debts = await db.debts.find({"user_id": current_user.id}).to_list(1000)
-    
-    total_owed = 0.0
-    total_to_collect = 0.0
-    person_amounts = {}
-    overdue_debts = []
-    active_debts_count = 0
-    overdue_debts_count = 0
-    
+async def get_dashboard_stats(
+    currency: Optional[Currency] = None,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
     current_date = datetime.utcnow()
+    # Totals are summed exactly in integer minor units by the store, so
+    # only a handful of aggregate values cross the wire.
+    summary, subtotals, rates = await asyncio.gather(
+        repos.summaries.dashboard_summary(current_user.id, current_date),
+        repos.summaries.open_balances_by_currency(current_user.id),
+        get_exchange_rates()
+    )
+    reporting_currency = currency or current_user.reporting_currency
+    revalued = revalue_balances(subtotals, rates, reporting_currency.value)
     
-    for debt_data in debts:
-        debt = Debt(**debt_data)
-        
-        if debt.status == DebtStatus.ACTIVE:
-            active_debts_count += 1
-            
-            if debt.debt_type == DebtType.I_OWE:
-                total_owed += debt.amount_in_try
-                # Track person I owe most to
-                if debt.person_name not in person_amounts:
-                    person_amounts[debt.person_name] = 0.0
-                person_amounts[debt.person_name] += debt.amount_in_try
-            else:
-                total_to_collect += debt.amount_in_try
-            
-            # Check if overdue
-            if debt.due_date and debt.due_date < current_date:
-                overdue_debts_count += 1
-                days_overdue = (current_date - debt.due_date).days
-                overdue_debts.append({
-                    "description": debt.description,
-                    "person": debt.person_name,
-                    "days": days_overdue
-                })
+    owed_minor = summary["totals_minor"].get(DebtType.I_OWE.value, 0)
+    to_collect_minor = summary["totals_minor"].get(DebtType.THEY_OWE.value, 0)
     
     # Find person I owe most to
     person_owe_most = None
     person_owe_most_amount = 0.0
-    if person_amounts:
-        person_owe_most = max(person_amounts, key=person_amounts.get)
-        person_owe_most_amount = person_amounts[person_owe_most]
+    if summary["top_creditor"]:
+        person_owe_most = summary["top_creditor"]["person_name"]
+        person_owe_most_amount = from_minor(summary["top_creditor"]["total_minor"])
     
     # Find most overdue debt
     most_overdue_debt = None
     most_overdue_days = 0
-    if overdue_debts:
-        most_overdue = max(overdue_debts, key=lambda x: x["days"])
-        most_overdue_debt = f"{most_overdue['description']} - {most_overdue['person']}"
-        most_overdue_days = most_overdue["days"]
+    most_overdue = summary["most_overdue"]
+    if most_overdue:
+        most_overdue_debt = f"{most_overdue['description']} - {most_overdue['person_name']}"
+        most_overdue_days = (current_date - most_overdue["due_date"]).days
     
     return DashboardStats(
-        total_owed=total_owed,
-        total_to_collect=total_to_collect,
-        net_balance=total_to_collect - total_owed,
+        total_owed=from_minor(owed_minor),
+        total_to_collect=from_minor(to_collect_minor),
+        net_balance=from_minor(to_collect_minor - owed_minor),
         person_owe_most=person_owe_most,
         person_owe_most_amount=person_owe_most_amount,
         most_overdue_debt=most_overdue_debt,
         most_overdue_days=most_overdue_days,
-        active_debts_count=active_debts_count,
-        overdue_debts_count=overdue_debts_count
+        active_debts_count=sum(summary["counts"].values()),
+        overdue_debts_count=summary["overdue_count"],
+        reporting_currency=reporting_currency,
+        revalued_total_owed=float(revalued[DebtType.I_OWE.value]),
+        revalued_total_to_collect=float(revalued[DebtType.THEY_OWE.value]),
+        revalued_net_balance=float(revalued[DebtType.THEY_OWE.value] - revalued[DebtType.I_OWE.value])
     )
 
-# Include the router in the main app
-app.include_router(api_router)
+# Analytics Routes
+def get_analytics_cache(request: Request) -> TTLCache:
+    return request.app.state.analytics_cache
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def breakdown_buckets(rows: List[dict], labels: Dict[Any, str]) -> List[BreakdownBucket]:
+    """Label bucketed rows in boundary order, filling in the empty buckets"""
+    by_key = {row["key"]: row for row in rows}
+    return [
+        BreakdownBucket(
+            key=label,
+            count=by_key.get(key, {}).get("count", 0),
+            i_owe=from_minor(by_key.get(key, {}).get("i_owe_minor", 0)),
+            they_owe=from_minor(by_key.get(key, {}).get("they_owe_minor", 0))
+        )
+        for key, label in labels.items()
+    ]
+
+def boundary_labels(boundaries: List[int], scale: int = 1, inclusive: bool = False) -> Dict[Any, str]:
+    # Histogram ranges read "100-500" (upper bound exclusive); aging ranges
+    # read "31-60" (inclusive), matching how overdue days are usually quoted
+    labels = {}
+    for lower, upper in zip(boundaries, boundaries[1:]):
+        labels[lower * scale] = f"{lower}-{upper - 1 if inclusive else upper}"
+    labels["over"] = f"{boundaries[-1] - 1 if inclusive else boundaries[-1]}+"
+    return labels
+
+@api_router.get("/analytics/breakdown", response_model=AnalyticsBreakdown)
+async def get_analytics_breakdown(
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    cache: TTLCache = Depends(get_analytics_cache)
+):
+    """Balances by category and currency, amount histogram and overdue aging
+
+    All four views come from one aggregation and are cached per user data
+    version. Aging counts whole days overdue as of the start of the UTC day,
+    so it only changes at midnight and the date completes the cache key.
+    """
+    # The cached user may be up to USER_CACHE_TTL_SECONDS old; the version must not be
+    user = await repos.users.get_by_id(current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    version = (user.get("data_version", 0), today)
+    cached = cache.get(current_user.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    facets = await repos.summaries.breakdown(current_user.id, today)
+    breakdown = AnalyticsBreakdown(
+        by_category=breakdown_buckets(facets["by_category"], {category.value: category.value for category in DebtCategory}),
+        by_currency=breakdown_buckets(facets["by_currency"], {currency.value: currency.value for currency in Currency}),
+        amount_histogram=breakdown_buckets(
+            facets["histogram"], boundary_labels(ANALYTICS_HISTOGRAM_BOUNDARIES, scale=MINOR_UNITS)
+        ),
+        aging=breakdown_buckets(facets["aging"], boundary_labels(ANALYTICS_AGING_BOUNDARIES, inclusive=True)),
+        data_version=version[0],
+        generated_at=now
+    )
+    cache.set(current_user.id, (version, breakdown))
+    return breakdown
+
+# Forecast Routes
+@api_router.get("/forecast", response_model=CashFlowForecast)
+async def get_forecast(
+    days: int = Query(30, ge=1, le=366),
+    granularity: ForecastGranularity = ForecastGranularity.DAY,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Amounts coming due over the next days, in TRY, per day or week"""
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    until = start + timedelta(days=days)
+    stored, recurring = await asyncio.gather(
+        repos.summaries.due_totals_by_day(current_user.id, start, until),
+        recurring_due_rows(repos, current_user.id, start, until),
+    )
+    bin_days = FORECAST_GRANULARITY_DAYS[granularity]
+    flow = bin_cash_flow(stored + recurring, start, days, bin_days)
+    buckets = [
+        ForecastBucket(
+            start=start + timedelta(days=index * bin_days),
+            inflow=from_minor(inflow),
+            outflow=from_minor(outflow),
+            net=from_minor(inflow - outflow),
+            cumulative_net=from_minor(cumulative),
+        )
+        for index, (inflow, outflow, cumulative) in enumerate(zip(
+            flow["inflow"].tolist(), flow["outflow"].tolist(), flow["cumulative_net"].tolist()
+        ))
+    ]
+    return CashFlowForecast(
+        days=days,
+        granularity=granularity,
+        overdue_inflow=from_minor(flow["overdue_inflow"]),
+        overdue_outflow=from_minor(flow["overdue_outflow"]),
+        total_inflow=from_minor(int(flow["inflow"].sum())),
+        total_outflow=from_minor(int(flow["outflow"].sum())),
+        buckets=buckets,
+    )
+
+# User Routes
+@api_router.get("/users/me", response_model=UserProfile)
+async def get_profile(current_user: User = Depends(get_current_user)):
+    return UserProfile(**current_user.dict())
+
+@api_router.put("/users/me/preferences", response_model=UserProfile)
+async def update_preferences(
+    preferences: UserPreferencesUpdate,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    fields = preferences.dict(exclude_unset=True, exclude_none=True)
+    user = await repos.users.update(current_user.id, fields) if fields else current_user.dict()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    await request.app.state.invalidation_bus.publish("user", current_user.email)
+    return UserProfile(**user)
+
+@api_router.put("/users/me/password")
+async def change_password(
+    change: PasswordChange,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    await enforce_rate_limit(request, "password", current_user.email)
+    if not await run_password_hashing("verify", verify_password, change.current_password, current_user.hashed_password):
+        raise HTTPException(status_code=400, detail="Current password is incorrect")
+    hashed_password = await run_password_hashing("hash", get_password_hash, change.new_password)
+    await repos.users.update(current_user.id, {"hashed_password": hashed_password})
+    # Cached copies still hold the old hash
+    await request.app.state.invalidation_bus.publish("user", current_user.email)
+    return {"message": "Password changed"}
+
+@api_router.delete("/users/me", status_code=status.HTTP_202_ACCEPTED)
+async def delete_account(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    store: ObjectStore = Depends(get_object_store),
+    audit: AuditLog = Depends(get_audit_log)
+):
+    """Revoke access at once and delete the account's data in the background"""
+    await repos.users.update(current_user.id, {"deleted_at": datetime.utcnow()})
+    # Drop cached copies in every worker so existing tokens stop working now
+    await request.app.state.invalidation_bus.publish("user", current_user.email)
+    start_account_deletion(repos, store, audit, current_user.id)
+    return {"message": "Account deletion started"}
+
+# Group Expense Routes
+async def get_group_or_404(repos: Repositories, user_id: str, group_id: str) -> ExpenseGroup:
+    group = await repos.groups.get(user_id, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return ExpenseGroup(**group)
+
+@api_router.post("/groups", response_model=ExpenseGroup)
+async def create_group(
+    group_data: ExpenseGroupCreate,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    group = ExpenseGroup(
+        user_id=current_user.id,
+        name=group_data.name,
+        currency=group_data.currency,
+        members=[GroupMember(name=name) for name in group_data.members]
+    )
+    group.balances = {member.id: 0 for member in group.members}
+    await repos.groups.create(group.dict())
+    return group
+
+@api_router.get("/groups", response_model=List[ExpenseGroup])
+async def get_groups(current_user: User = Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
+    groups = await repos.groups.list_for_user(current_user.id)
+    return [ExpenseGroup(**group) for group in groups]
+
+@api_router.get("/groups/{group_id}", response_model=ExpenseGroup)
+async def get_group(group_id: str, current_user: User = Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
+    return await get_group_or_404(repos, current_user.id, group_id)
+
+@api_router.post("/groups/{group_id}/members", response_model=ExpenseGroup)
+async def add_group_member(
+    group_id: str,
+    member_data: GroupMemberCreate,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    group = await repos.groups.add_member(current_user.id, group_id, GroupMember(name=member_data.name).dict())
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return ExpenseGroup(**group)
+
+@api_router.post("/groups/{group_id}/expenses", response_model=GroupExpense)
+async def create_group_expense(
+    group_id: str,
+    expense_data: GroupExpenseCreate,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    group = await get_group_or_404(repos, current_user.id, group_id)
+    member_ids = [member.id for member in group.members]
+    if expense_data.paid_by not in member_ids:
+        raise HTTPException(status_code=400, detail="Payer is not a member of the group")
+
+    splits = split_expense(expense_data, member_ids)
+    expense = GroupExpense(
+        group_id=group_id,
+        user_id=current_user.id,
+        description=expense_data.description,
+        amount=expense_data.amount,
+        paid_by=expense_data.paid_by,
+        split_rule=expense_data.split_rule,
+        splits=splits
+    )
+    if not await repos.groups.add_expense(expense.dict(), expense_balance_deltas(expense.paid_by, splits)):
+        raise HTTPException(status_code=404, detail="Group not found")
+    return expense
+
+@api_router.get("/groups/{group_id}/expenses", response_model=List[GroupExpense])
+async def get_group_expenses(
+    group_id: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    await get_group_or_404(repos, current_user.id, group_id)
+    expenses = await repos.groups.list_expenses(current_user.id, group_id, (page - 1) * page_size, page_size)
+    return [GroupExpense(**expense) for expense in expenses]
+
+@api_router.delete("/groups/{group_id}/expenses/{expense_id}")
+async def delete_group_expense(
+    group_id: str,
+    expense_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    if not await repos.groups.delete_expense(current_user.id, group_id, expense_id):
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return {"message": "Expense deleted successfully"}
+
+@api_router.get("/groups/{group_id}/settlement", response_model=GroupSettlement)
+async def get_group_settlement(
+    group_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    # Balances are maintained incrementally, so settling never reads expenses
+    group = await get_group_or_404(repos, current_user.id, group_id)
+    return GroupSettlement(
+        group_id=group.id,
+        currency=group.currency,
+        balances={member_id: from_minor(amount) for member_id, amount in group.balances.items()},
+        transfers=[
+            Transfer(from_member=debtor, to_member=creditor, amount=from_minor(amount))
+            for debtor, creditor, amount in settle_balances(group.balances)
+        ]
+    )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds", "Seconds from process import until the app was ready", multiprocess_mode="max"
+)
+
+# Operational routes (no /api prefix)
+ops_router = APIRouter()
+
+@ops_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # serve.py workers share metric files; aggregate them on scrape
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@ops_router.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and the event loop is responsive"""
+    return {"status": "ok"}
+
+@ops_router.get("/readyz", include_in_schema=False)
+async def readyz(request: Request):
+    """Readiness: startup finished and MongoDB answers a ping"""
+    state = request.app.state
+    if not state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    if state.mongo_client is not None:
+        try:
+            await asyncio.wait_for(state.mongo_client.admin.command("ping"), timeout=1.0)
+        except Exception:
+            return JSONResponse({"status": "mongo_unavailable"}, status_code=503)
+    return {"status": "ready", "startup_seconds": state.startup_seconds}
+
+def warm_up(app: FastAPI):
+    """Build lazily-created schemas and serializers before the first request"""
+    app.openapi()
+    now = datetime.utcnow()
+    debt = Debt(
+        user_id="warmup", debt_type=DebtType.I_OWE, person_name="warmup", amount=1.0,
+        currency=Currency.TRY, description="warmup", category=DebtCategory.OTHER, due_date=now
+    )
+    Debt.model_validate_json(debt.model_dump_json())
+    DashboardStats(total_owed=0.0, total_to_collect=0.0, net_balance=0.0,
+                   active_debts_count=0, overdue_debts_count=0).model_dump_json()
+    fold_text("warmup")
+
+@asynccontextmanager
+async def app_services(app: FastAPI):
+    """Storage, caches and background jobs for one serving lifetime"""
+    started = time.perf_counter()
+    mongo_client = None
+    database = None
+    if "mongo" in (STORAGE_BACKEND, RATE_LIMIT_BACKEND, SHARED_STATE_BACKEND):
+        mongo_client = create_mongo_client()
+        database = mongo_client[DB_NAME]
+        # Fail fast if MongoDB is unreachable instead of on the first request
+        await mongo_client.admin.command("ping")
+
+    app.state.mongo_client = mongo_client
+    app.state.repositories = build_repositories(STORAGE_BACKEND, database)
+    app.state.rate_limiter = build_rate_limiter(RATE_LIMIT_BACKEND, database)
+    app.state.user_cache = TTLCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+    app.state.analytics_cache = TTLCache(ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_CACHE_MAX_ENTRIES)
+    app.state.invalidation_bus = build_invalidation_bus(SHARED_STATE_BACKEND, database)
+    app.state.invalidation_bus.subscribe("user", app.state.user_cache.invalidate)
+    app.state.revocation_filter = TokenRevocationFilter(app.state.repositories)
+    app.state.invalidation_bus.subscribe("token", app.state.revocation_filter.add)
+    app.state.audit_log = AuditLog(app.state.repositories)
+    app.state.object_store = build_object_store(ATTACHMENT_BACKEND)
+    await app.state.repositories.initialize()
+    await app.state.rate_limiter.initialize()
+    await app.state.invalidation_bus.start()
+    await app.state.audit_log.start()
+    await app.state.revocation_filter.start()
+    # Coordinates the FX refresh and the background job leases across workers
+    shared_state = None
+    if SHARED_STATE_BACKEND == "mongo" and database is not None:
+        shared_state = SharedStateStore(database)
+    fx_cache.shared = shared_state
+    await get_exchange_rates()
+    warm_up(app)
+
+    background_tasks = []
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_periodically(
+            ARCHIVE_JOB, ARCHIVE_INTERVAL_SECONDS, lambda: archive_settled_debts(app.state.repositories),
+            shared_state
+        )))
+    if ACCOUNT_DELETION_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_periodically(
+            ACCOUNT_DELETION_JOB, ACCOUNT_DELETION_INTERVAL_SECONDS,
+            lambda: resume_account_deletions(app.state.repositories, app.state.object_store, app.state.audit_log),
+            shared_state
+        )))
+    if RECURRING_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_periodically(
+            RECURRING_JOB, RECURRING_INTERVAL_SECONDS, lambda: materialize_recurring_debts(app.state.repositories),
+            shared_state
+        )))
+
+    app.state.startup_seconds = time.perf_counter() - PROCESS_STARTED
+    app.state.ready = True
+    STARTUP_SECONDS.set(app.state.startup_seconds)
+    logger.info(
+        f"Ready in {app.state.startup_seconds:.3f}s since import "
+        f"({time.perf_counter() - started:.3f}s in lifespan startup)"
+    )
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await app.state.revocation_filter.stop()
+        await app.state.audit_log.stop()
+        await app.state.invalidation_bus.stop()
+        fx_cache.shared = None
+        if mongo_client is not None:
+            mongo_client.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = configure_logging()
+    try:
+        async with app_services(app):
+            yield
+    finally:
+        # Last, so startup failures and shutdown messages are still written
+        log_listener.stop()
+
+def create_app() -> FastAPI:
+    # Create the main app without a prefix
+    app = FastAPI(lifespan=lifespan)
+    app.state.ready = False
+    app.state.mongo_client = None
+
+    # Include the routers in the main app
+    app.include_router(api_router)
+    app.include_router(ops_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(PrometheusMiddleware)
+    app.add_middleware(
+        ProfilingMiddleware,
+        admin_token=PROFILE_ADMIN_TOKEN,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        output_dir=PROFILE_OUTPUT_DIR
+    )
+    # Outermost, so every log line of the request carries its id
+    app.add_middleware(RequestContextMiddleware)
+    return app
+
+app = create_app()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Load-testing and Benchmark Suite for Debt Tracking App
+
+Runs against a locally started backend (uvicorn server:app --port 8001):
+- seed:    create benchmark users and bulk-insert 1k-1M synthetic debts per user
+- run:     asyncio/httpx load generator with a realistic operation mix
+- compare: diff two JSON result files and flag latency/throughput regressions
+- archive: dashboard/list latency before and after archiving settled debts
+- money:   float summation in Python vs exact integer $sum in MongoDB
+- forecast: /forecast latency over 30/60/90-day horizons per day and week
+
+Results are written as JSON so runs can be compared over time.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+# Configuration
+BASE_URL = os.environ.get("BENCH_BASE_URL", "http://localhost:8001/api")
+BENCH_PASSWORD = "BenchPass123!"
+BENCH_EMAIL_PATTERN = "bench_user_{}@example.com"
+
+# Weighted operation mix, roughly matching mobile client traffic
+DEFAULT_MIX = {
+    "login": 5,
+    "list": 35,
+    "create": 20,
+    "mark_paid": 10,
+    "dashboard": 30,
+}
+
+PEOPLE = ["Ahmet Yılmaz", "Ayşe Kaya", "Mehmet Demir", "Fatma Çelik", "Ali Şahin",
+          "Zeynep Öztürk", "Can Aydın", "Elif Arslan", "İbrahim Doğan", "Selin Koç"]
+DESCRIPTIONS = ["Dinner", "Rent share", "Concert tickets", "Taxi", "Groceries",
+                "Course fee", "Business trip", "Birthday gift", "Utilities", "Loan"]
+CATEGORIES = ["personal_loan", "rent", "shared_expense", "business_loan", "education", "other"]
+CURRENCIES = ["TRY", "USD", "EUR"]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_ms, errors, elapsed):
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(values) / len(values) if values else 0.0,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def random_debt_payload(rng):
+    return {
+        "debt_type": rng.choice(["i_owe", "they_owe"]),
+        "person_name": rng.choice(PEOPLE),
+        "amount": round(rng.uniform(10, 5000), 2),
+        "currency": rng.choice(CURRENCIES),
+        "description": rng.choice(DESCRIPTIONS),
+        "category": rng.choice(CATEGORIES),
+        "due_date": (datetime.utcnow() + timedelta(days=rng.randint(-120, 120))).isoformat(),
+    }
+
+
+# Seeding
+async def register_or_login(http, email):
+    response = await http.post("/register", json={
+        "email": email, "password": BENCH_PASSWORD, "full_name": "Bench User"
+    })
+    if response.status_code == 400:
+        response = await http.post("/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def seed(args):
+    """Register benchmark users through the API and bulk-insert debts directly into MongoDB"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server  # noqa: E402  (loads backend/.env and the storage models)
+    from pymongo import MongoClient
+
+    rng = random.Random(args.seed)
+    mongo = MongoClient(os.environ["MONGO_URL"])
+    database = mongo[os.environ["DB_NAME"]]
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as http:
+        for index in range(args.users):
+            email = BENCH_EMAIL_PATTERN.format(index)
+            await register_or_login(http, email)
+            user = database.users.find_one({"email": email}, {"id": 1})
+
+            if args.reset:
+                database.debts.delete_many({"user_id": user["id"]})
+
+            started = time.perf_counter()
+            inserted = 0
+            while inserted < args.debts:
+                batch = []
+                for _ in range(min(args.batch_size, args.debts - inserted)):
+                    payload = random_debt_payload(rng)
+                    amount_in_try = payload["amount"] * {"TRY": 1.0, "USD": 34.0, "EUR": 37.0}[payload["currency"]]
+                    debt = server.Debt(
+                        user_id=user["id"],
+                        amount_in_try=amount_in_try,
+                        status=server.DebtStatus.PAID if rng.random() < args.paid_ratio else server.DebtStatus.ACTIVE,
+                        **payload
+                    )
+                    if debt.status == server.DebtStatus.PAID:
+                        debt.paid_at = datetime.utcnow() - timedelta(days=rng.randint(0, 3 * 365))
+                    batch.append(server.debt_document(debt))
+                database.debts.insert_many(batch, ordered=False)
+                inserted += len(batch)
+            print(f"Seeded {inserted} debts for {email} in {time.perf_counter() - started:.1f}s")
+
+    mongo.close()
+
+
+# Load generation
+class VirtualUser:
+    def __init__(self, http, email, rng):
+        self.http = http
+        self.email = email
+        self.rng = rng
+        self.headers = {}
+        self.debt_ids = []
+
+    async def login(self):
+        response = await self.http.post("/login", json={"email": self.email, "password": BENCH_PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def list(self):
+        response = await self.http.get("/debts", headers=self.headers)
+        if response.status_code == 200:
+            debts = response.json()
+            self.debt_ids = [debt["id"] for debt in debts[:200]]
+        return response
+
+    async def create(self):
+        response = await self.http.post("/debts", json=random_debt_payload(self.rng), headers=self.headers)
+        if response.status_code == 200:
+            self.debt_ids.append(response.json()["id"])
+        return response
+
+    async def mark_paid(self):
+        if not self.debt_ids:
+            return await self.list()
+        debt_id = self.rng.choice(self.debt_ids)
+        return await self.http.post(f"/debts/{debt_id}/mark-paid", headers=self.headers)
+
+    async def dashboard(self):
+        return await self.http.get("/dashboard/stats", headers=self.headers)
+
+
+async def worker(user, mix, deadline, results, request_budget):
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    while time.perf_counter() < deadline and request_budget["remaining"] > 0:
+        request_budget["remaining"] -= 1
+        op = user.rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        status_code = None
+        try:
+            response = await getattr(user, op)()
+            status_code = response.status_code
+        except httpx.HTTPError:
+            pass
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        bucket = results.setdefault(op, {"latencies": [], "errors": 0, "rate_limited": 0})
+        if status_code is not None and status_code < 400:
+            bucket["latencies"].append(elapsed_ms)
+        else:
+            bucket["errors"] += 1
+            if status_code == 429:
+                bucket["rate_limited"] += 1
+
+
+async def run(args):
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as http:
+        users = []
+        # Virtual users sharing an account share its token; logging each one
+        # in separately would trip the server's per-email login limit
+        sessions = {}
+        for index in range(args.concurrency):
+            email = BENCH_EMAIL_PATTERN.format(index % args.users)
+            user = VirtualUser(http, email, random.Random(rng.random()))
+            if email in sessions:
+                user.headers = sessions[email]
+            else:
+                response = await user.login()
+                if response.status_code != 200:
+                    raise SystemExit(f"Login failed for {email}: run `seed` first ({response.status_code})")
+                sessions[email] = user.headers
+            await user.list()
+            users.append(user)
+
+        # Short warmup so connection setup and first-request costs are not measured
+        warmup_deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*[
+            worker(user, mix, warmup_deadline, {}, {"remaining": float("inf")}) for user in users
+        ])
+
+        results = {}
+        budget = {"remaining": args.requests or float("inf")}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[worker(user, mix, deadline, results, budget) for user in users])
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [value for bucket in results.values() for value in bucket["latencies"]]
+    all_errors = sum(bucket["errors"] for bucket in results.values())
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "users": args.users,
+            "mix": mix,
+            "seed": args.seed,
+            "label": args.label,
+        },
+        "elapsed_s": elapsed,
+        "overall": summarize(all_latencies, all_errors, elapsed),
+        "operations": {
+            op: summarize(bucket["latencies"], bucket["errors"], elapsed)
+            for op, bucket in sorted(results.items())
+        },
+    }
+
+    print_report(report)
+    rate_limited = sum(bucket["rate_limited"] for bucket in results.values())
+    if rate_limited:
+        print(f"Warning: {rate_limited} requests were rate limited (429); start the server with "
+              "RATE_LIMIT_PER_IP and RATE_LIMIT_PER_EMAIL raised (see README)", file=sys.stderr)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
+    return report
+
+
+def print_report(report):
+    print(f"{'operation':<12}{'count':>8}{'errors':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = list(report["operations"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(f"{name:<12}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+async def measure_endpoints(http, headers, paths, iterations):
+    results = {}
+    for path in paths:
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = await http.get(path, headers=headers)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[path] = summarize(latencies, 0, sum(latencies) / 1000)
+    return results
+
+
+async def archive_benchmark(args):
+    """Measure read latency, run the archival job against MongoDB, measure again"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server  # noqa: E402
+
+    paths = ["/dashboard/stats", "/debts", "/debts?include_archived=true"]
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as http:
+        token = await register_or_login(http, BENCH_EMAIL_PATTERN.format(0))
+        headers = {"Authorization": f"Bearer {token}"}
+        await measure_endpoints(http, headers, paths, 3)  # warm caches
+        before = await measure_endpoints(http, headers, paths, args.iterations)
+
+        mongo_client = server.create_mongo_client()
+        repos = server.MotorRepositories(mongo_client[os.environ["DB_NAME"]])
+        started = time.perf_counter()
+        moved = await server.archive_settled_debts(repos, older_than_days=args.older_than_days, pause=0)
+        archive_seconds = time.perf_counter() - started
+        mongo_client.close()
+
+        await measure_endpoints(http, headers, paths, 3)
+        after = await measure_endpoints(http, headers, paths, args.iterations)
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "config": {"base_url": args.base_url, "iterations": args.iterations, "older_than_days": args.older_than_days},
+        "archived": moved,
+        "archive_seconds": archive_seconds,
+        "before": before,
+        "after": after,
+    }
+    print(f"Archived {moved} debts in {archive_seconds:.1f}s")
+    print(f"{'endpoint':<32}{'p50 before':>12}{'p50 after':>12}{'p95 before':>12}{'p95 after':>12}")
+    for path in paths:
+        print(f"{path:<32}{before[path]['p50_ms']:>12.1f}{after[path]['p50_ms']:>12.1f}"
+              f"{before[path]['p95_ms']:>12.1f}{after[path]['p95_ms']:>12.1f}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
+
+
+async def money_benchmark(args):
+    """Compare the old float summation path with server-side integer sums"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server  # noqa: E402
+
+    mongo_client = server.create_mongo_client()
+    database = mongo_client[os.environ["DB_NAME"]]
+    user = await database.users.find_one({"email": BENCH_EMAIL_PATTERN.format(0)}, {"id": 1})
+    if user is None:
+        raise SystemExit("Run `seed` first")
+    match = {"user_id": user["id"], "status": "active"}
+
+    async def python_float_sum():
+        # The pre-aggregation dashboard path: fetch every debt, validate, sum floats
+        debts = await database.debts.find({"user_id": user["id"]}).to_list(None)
+        return sum(server.Debt(**debt).amount_in_try for debt in debts if debt["status"] == "active")
+
+    async def server_double_sum():
+        rows = await database.debts.aggregate([
+            {"$match": match}, {"$group": {"_id": None, "total": {"$sum": "$amount_in_try"}}}
+        ]).to_list(1)
+        return rows[0]["total"] if rows else 0.0
+
+    async def server_minor_sum():
+        rows = await database.debts.aggregate([
+            {"$match": match}, {"$group": {"_id": None, "total": {"$sum": "$amount_in_try_minor"}}}
+        ]).to_list(1)
+        return server.from_minor(rows[0]["total"]) if rows else 0.0
+
+    variants = {
+        "python_float_sum": python_float_sum,
+        "server_double_sum": server_double_sum,
+        "server_minor_sum": server_minor_sum,
+    }
+    results = {}
+    for name, variant in variants.items():
+        await variant()  # warm up
+        latencies = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            total = await variant()
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name] = {"total": repr(total), **summarize(latencies, 0, sum(latencies) / 1000)}
+    mongo_client.close()
+
+    print(f"{'variant':<20}{'p50 ms':>10}{'p95 ms':>10}  total")
+    for name, stats in results.items():
+        print(f"{name:<20}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}  {stats['total']}")
+    if args.out:
+        report = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "config": {"iterations": args.iterations},
+            "variants": results,
+        }
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
+
+
+async def forecast_benchmark(args):
+    """Measure /forecast for the seeded user across horizons and granularities"""
+    paths = [f"/forecast?days={days}&granularity={granularity}"
+             for days in (30, 60, 90) for granularity in ("day", "week")]
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as http:
+        token = await register_or_login(http, BENCH_EMAIL_PATTERN.format(0))
+        headers = {"Authorization": f"Bearer {token}"}
+        await measure_endpoints(http, headers, paths, 3)  # warm caches
+        results = await measure_endpoints(http, headers, paths, args.iterations)
+
+    print(f"{'endpoint':<40}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, stats in results.items():
+        print(f"{path:<40}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    if args.out:
+        report = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "config": {"base_url": args.base_url, "iterations": args.iterations},
+            "endpoints": results,
+        }
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
+
+
+def compare(args):
+    """Compare two result files; exit non-zero if any tracked metric regressed"""
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    threshold = args.threshold / 100.0
+    regressions = []
+
+    names = sorted(set(baseline["operations"]) | set(candidate["operations"])) + ["overall"]
+    print(f"{'operation':<12}{'metric':<8}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name in names:
+        before = baseline["overall"] if name == "overall" else baseline["operations"].get(name)
+        after = candidate["overall"] if name == "overall" else candidate["operations"].get(name)
+        if not before or not after:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            # Latency regresses when it grows, throughput when it shrinks
+            regressed = change > threshold if metric != "rps" else change < -threshold
+            marker = "  <-- regression" if regressed else ""
+            print(f"{name:<12}{metric:<8}{old:>12.2f}{new:>12.2f}{change * 100:>9.1f}%{marker}")
+            if regressed:
+                regressions.append((name, metric))
+
+    if regressions:
+        raise SystemExit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Create users and synthetic debts")
+    seed_parser.add_argument("--users", type=int, default=1)
+    seed_parser.add_argument("--debts", type=int, default=1000, help="Debts per user (1k-1M)")
+    seed_parser.add_argument("--batch-size", type=int, default=5000)
+    seed_parser.add_argument("--paid-ratio", type=float, default=0.5)
+    seed_parser.add_argument("--reset", action="store_true", help="Delete existing debts of bench users first")
+
+    run_parser = subparsers.add_parser("run", help="Run the load generator")
+    run_parser.add_argument("--users", type=int, default=1, help="Number of seeded users to spread load over")
+    run_parser.add_argument("--concurrency", type=int, default=20)
+    run_parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    run_parser.add_argument("--requests", type=int, default=0, help="Stop after N requests (0 = duration only)")
+    run_parser.add_argument("--warmup", type=float, default=3.0)
+    run_parser.add_argument("--mix", help='JSON weights, e.g. \'{"list": 1, "dashboard": 1}\'')
+    run_parser.add_argument("--label", default=None)
+    run_parser.add_argument("--out", help="Write JSON results to this file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+
+    archive_parser = subparsers.add_parser("archive", help="Benchmark reads before/after archiving paid debts")
+    archive_parser.add_argument("--iterations", type=int, default=50)
+    archive_parser.add_argument("--older-than-days", type=int, default=180)
+    archive_parser.add_argument("--out", help="Write JSON results to this file")
+
+    money_parser = subparsers.add_parser("money", help="Benchmark float vs integer minor-unit summation")
+    money_parser.add_argument("--iterations", type=int, default=30)
+    money_parser.add_argument("--out", help="Write JSON results to this file")
+
+    forecast_parser = subparsers.add_parser("forecast", help="Benchmark the cash-flow forecast endpoint")
+    forecast_parser.add_argument("--iterations", type=int, default=50)
+    forecast_parser.add_argument("--out", help="Write JSON results to this file")
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.command == "seed":
+        asyncio.run(seed(args))
+    elif args.command == "run":
+        asyncio.run(run(args))
+    elif args.command == "compare":
+        compare(args)
+    elif args.command == "archive":
+        asyncio.run(archive_benchmark(args))
+    elif args.command == "money":
+        asyncio.run(money_benchmark(args))
+    elif args.command == "forecast":
+        asyncio.run(forecast_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
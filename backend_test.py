@@ -11,17 +11,34 @@ Tests all high-priority backend functionality including:
 
 import requests
 import json
+import os
+import sys
 import uuid
 from datetime import datetime, timedelta
 import time
 
 # Configuration
-BASE_URL = "https://3465f712-36f2-4485-a14c-2279310f7ece.preview.emergentagent.com/api"
+BASE_URL = os.environ.get(
+    "BACKEND_TEST_URL",
+    "https://3465f712-36f2-4485-a14c-2279310f7ece.preview.emergentagent.com/api"
+)
 HEADERS = {"Content-Type": "application/json"}
 
+def in_process_client():
+    """Serve the app in-process on the in-memory storage backend (no MongoDB needed)"""
+    os.environ["STORAGE_BACKEND"] = "memory"
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from fastapi.testclient import TestClient
+    import server
+
+    client = TestClient(server.app)
+    client.__enter__()  # run startup handlers
+    return client, "http://testserver/api"
+
 class DebtTrackerTester:
-    def __init__(self):
-        self.base_url = BASE_URL
+    def __init__(self, http=requests, base_url=BASE_URL):
+        self.http = http
+        self.base_url = base_url
         self.headers = HEADERS.copy()
         self.auth_token = None
         self.test_user_email = f"testuser_{uuid.uuid4().hex[:8]}@example.com"
@@ -51,7 +68,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/register", 
+            response = self.http.post(f"{self.base_url}/register", 
                                    json=registration_data, 
                                    headers=self.headers)
             
@@ -74,7 +91,7 @@ class DebtTrackerTester:
             
         # Test duplicate email registration
         try:
-            response = requests.post(f"{self.base_url}/register", 
+            response = self.http.post(f"{self.base_url}/register", 
                                    json=registration_data, 
                                    headers=self.headers)
             
@@ -96,7 +113,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/register", 
+            response = self.http.post(f"{self.base_url}/register", 
                                    json=invalid_email_data, 
                                    headers=self.headers)
             
@@ -120,7 +137,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/login", 
+            response = self.http.post(f"{self.base_url}/login", 
                                    json=login_data, 
                                    headers=self.headers)
             
@@ -149,7 +166,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/login", 
+            response = self.http.post(f"{self.base_url}/login", 
                                    json=invalid_login_data, 
                                    headers=self.headers)
             
@@ -170,7 +187,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/login", 
+            response = self.http.post(f"{self.base_url}/login", 
                                    json=nonexistent_login_data, 
                                    headers=self.headers)
             
@@ -189,7 +206,7 @@ class DebtTrackerTester:
         
         # Test with valid token
         try:
-            response = requests.get(f"{self.base_url}/debts", headers=self.headers)
+            response = self.http.get(f"{self.base_url}/debts", headers=self.headers)
             
             if response.status_code == 200:
                 self.log_test("JWT Authentication (Valid Token)", True, 
@@ -206,7 +223,7 @@ class DebtTrackerTester:
         invalid_headers["Authorization"] = "Bearer invalid_token_here"
         
         try:
-            response = requests.get(f"{self.base_url}/debts", headers=invalid_headers)
+            response = self.http.get(f"{self.base_url}/debts", headers=invalid_headers)
             
             if response.status_code == 401:
                 self.log_test("JWT Authentication (Invalid Token)", True, 
@@ -222,7 +239,7 @@ class DebtTrackerTester:
         no_auth_headers = {"Content-Type": "application/json"}
         
         try:
-            response = requests.get(f"{self.base_url}/debts", headers=no_auth_headers)
+            response = self.http.get(f"{self.base_url}/debts", headers=no_auth_headers)
             
             if response.status_code == 401 or response.status_code == 403:
                 self.log_test("JWT Authentication (No Token)", True, 
@@ -250,7 +267,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/debts", 
+            response = self.http.post(f"{self.base_url}/debts", 
                                    json=debt_data_try, 
                                    headers=self.headers)
             
@@ -282,7 +299,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/debts", 
+            response = self.http.post(f"{self.base_url}/debts", 
                                    json=debt_data_usd, 
                                    headers=self.headers)
             
@@ -314,7 +331,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/debts", 
+            response = self.http.post(f"{self.base_url}/debts", 
                                    json=debt_data_eur, 
                                    headers=self.headers)
             
@@ -336,7 +353,7 @@ class DebtTrackerTester:
             
         # Test Read All Debts
         try:
-            response = requests.get(f"{self.base_url}/debts", headers=self.headers)
+            response = self.http.get(f"{self.base_url}/debts", headers=self.headers)
             
             if response.status_code == 200:
                 debts = response.json()
@@ -357,7 +374,7 @@ class DebtTrackerTester:
         if self.created_debt_ids:
             debt_id = self.created_debt_ids[0]
             try:
-                response = requests.get(f"{self.base_url}/debts/{debt_id}", headers=self.headers)
+                response = self.http.get(f"{self.base_url}/debts/{debt_id}", headers=self.headers)
                 
                 if response.status_code == 200:
                     debt = response.json()
@@ -384,7 +401,7 @@ class DebtTrackerTester:
             }
             
             try:
-                response = requests.put(f"{self.base_url}/debts/{debt_id}", 
+                response = self.http.put(f"{self.base_url}/debts/{debt_id}", 
                                       json=update_data, 
                                       headers=self.headers)
                 
@@ -408,12 +425,12 @@ class DebtTrackerTester:
         if len(self.created_debt_ids) > 1:
             debt_id = self.created_debt_ids[1]
             try:
-                response = requests.post(f"{self.base_url}/debts/{debt_id}/mark-paid", 
+                response = self.http.post(f"{self.base_url}/debts/{debt_id}/mark-paid", 
                                        headers=self.headers)
                 
                 if response.status_code == 200:
                     # Verify debt is marked as paid
-                    verify_response = requests.get(f"{self.base_url}/debts/{debt_id}", 
+                    verify_response = self.http.get(f"{self.base_url}/debts/{debt_id}", 
                                                  headers=self.headers)
                     if verify_response.status_code == 200:
                         debt = verify_response.json()
@@ -452,7 +469,7 @@ class DebtTrackerTester:
             }
             
             try:
-                response = requests.post(f"{self.base_url}/debts", 
+                response = self.http.post(f"{self.base_url}/debts", 
                                        json=debt_data, 
                                        headers=self.headers)
                 
@@ -509,7 +526,7 @@ class DebtTrackerTester:
         print("=== Testing Dashboard Analytics ===")
         
         try:
-            response = requests.get(f"{self.base_url}/dashboard/stats", headers=self.headers)
+            response = self.http.get(f"{self.base_url}/dashboard/stats", headers=self.headers)
             
             if response.status_code == 200:
                 stats = response.json()
@@ -594,7 +611,7 @@ class DebtTrackerTester:
         
         try:
             # Create debt
-            create_response = requests.post(f"{self.base_url}/debts", 
+            create_response = self.http.post(f"{self.base_url}/debts", 
                                           json=test_debt, 
                                           headers=self.headers)
             
@@ -604,7 +621,7 @@ class DebtTrackerTester:
                 self.created_debt_ids.append(debt_id)
                 
                 # Verify data persistence by reading back
-                read_response = requests.get(f"{self.base_url}/debts/{debt_id}", 
+                read_response = self.http.get(f"{self.base_url}/debts/{debt_id}", 
                                            headers=self.headers)
                 
                 if read_response.status_code == 200:
@@ -666,7 +683,7 @@ class DebtTrackerTester:
         }
         
         try:
-            response = requests.post(f"{self.base_url}/debts", 
+            response = self.http.post(f"{self.base_url}/debts", 
                                    json=invalid_debt, 
                                    headers=self.headers)
             
@@ -682,7 +699,7 @@ class DebtTrackerTester:
             
         # Test accessing non-existent debt
         try:
-            response = requests.get(f"{self.base_url}/debts/non-existent-id", 
+            response = self.http.get(f"{self.base_url}/debts/non-existent-id", 
                                   headers=self.headers)
             
             if response.status_code == 404:
@@ -702,7 +719,7 @@ class DebtTrackerTester:
         deleted_count = 0
         for debt_id in self.created_debt_ids:
             try:
-                response = requests.delete(f"{self.base_url}/debts/{debt_id}", 
+                response = self.http.delete(f"{self.base_url}/debts/{debt_id}", 
                                          headers=self.headers)
                 if response.status_code == 200:
                     deleted_count += 1
@@ -744,5 +761,9 @@ class DebtTrackerTester:
         print("✅ Backend testing completed!")
 
 if __name__ == "__main__":
-    tester = DebtTrackerTester()
+    if "--in-process" in sys.argv:
+        http, base_url = in_process_client()
+        tester = DebtTrackerTester(http=http, base_url=base_url)
+    else:
+        tester = DebtTrackerTester()
     tester.run_all_tests()
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+Shared fixtures: the app runs in-process on the in-memory storage backend,
+so the suite needs neither MongoDB nor network access.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+# Configuration is read when server is imported, so it is set first
+_SCRATCH = Path(tempfile.mkdtemp(prefix="debt-tracker-tests-"))
+os.environ.update({
+    "STORAGE_BACKEND": "memory",
+    "RATE_LIMIT_BACKEND": "memory",
+    "SHARED_STATE_BACKEND": "local",
+    # Nothing listens here, so exchange rates fall back immediately
+    "FX_API_URL": "http://127.0.0.1:9/latest",
+    "FX_FETCH_TIMEOUT_SECONDS": "0.2",
+    "ARCHIVE_INTERVAL_SECONDS": "0",
+    "ACCOUNT_DELETION_INTERVAL_SECONDS": "0",
+    "RECURRING_INTERVAL_SECONDS": "0",
+    "ATTACHMENT_BACKEND": "filesystem",
+    "ATTACHMENT_DIR": str(_SCRATCH / "attachments"),
+    "AUDIT_SPILL_DIR": str(_SCRATCH / "audit_spill"),
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+PASSWORD = "SecurePass123!"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def client():
+    """A fresh app: lifespan builds new in-memory repositories on every entry"""
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def repos(client):
+    return client.app.state.repositories
+
+
+def register(client, email=None):
+    """Register a user and return their Authorization headers"""
+    email = email or f"user_{uuid.uuid4().hex[:8]}@example.com"
+    response = client.post("/api/register", json={"email": email, "password": PASSWORD, "full_name": "Test User"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    return register(client)
+
+
+def create_debt(client, headers, **fields):
+    payload = {
+        "debt_type": "i_owe",
+        "person_name": "Ayşe Kaya",
+        "amount": 100.0,
+        "currency": "TRY",
+        "description": "Dinner",
+        "category": "personal_loan",
+        **fields,
+    }
+    response = client.post("/api/debts", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class Interrupted(Exception):
+    """Stands in for a crash or deploy in the middle of a resumable job"""
+
+
+@contextmanager
+def interrupt_after(target, name, calls=0):
+    """Let `calls` calls of the coroutine method target.name through, then raise Interrupted
+
+    The method is restored on exit, so the job can be resumed from its checkpoint.
+    """
+    original = getattr(target, name)
+    passed = 0
+
+    async def interrupted(*args, **kwargs):
+        nonlocal passed
+        if passed >= calls:
+            raise Interrupted
+        passed += 1
+        return await original(*args, **kwargs)
+
+    setattr(target, name, interrupted)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+import server
+
+from .conftest import Interrupted, create_debt, interrupt_after
+
+
+@pytest.fixture
+def store(client):
+    return client.app.state.object_store
+
+
+@pytest.fixture
+def audit(client):
+    return client.app.state.audit_log
+
+
+def populate(client, headers):
+    """A user with debts, an attachment, a recurring template and audit events
+
+    The creation events are stored; the attachment event is still buffered.
+    """
+    debts = [create_debt(client, headers, description=f"Debt {i}") for i in range(3)]
+    client.portal.call(client.app.state.audit_log.flush)
+    attachment = client.post(
+        f"/api/debts/{debts[0]['id']}/attachments",
+        params={"filename": "receipt.txt"},
+        content=b"receipt",
+        headers={**headers, "Content-Type": "text/plain"},
+    ).json()
+    response = client.post("/api/recurring", headers=headers, json={
+        "debt_type": "i_owe",
+        "person_name": "Landlord",
+        "amount": 500.0,
+        "currency": "TRY",
+        "description": "Rent",
+        "category": "rent",
+        "frequency": "monthly",
+        "start_date": debts[0]["created_at"],
+        "installments": 1,
+    })
+    assert response.status_code == 200, response.text
+    return debts[0]["user_id"], [debt["id"] for debt in debts], server.ATTACHMENT_DIR / attachment["storage_key"]
+
+
+def delete(client, repos, store, audit, user_id):
+    return client.portal.call(server.delete_account_data, repos, store, audit, user_id, 1, 0)
+
+
+def audit_events(client, repos, audit, user_id, debt_ids):
+    # Anything still buffered would reach the store on the next flush
+    client.portal.call(audit.flush)
+    return [event for debt_id in debt_ids for event in client.portal.call(repos.audit.history, user_id, debt_id, 0, 100)]
+
+
+def test_delete_account_data_removes_everything(client, repos, store, audit, auth_headers):
+    user_id, debt_ids, attachment_path = populate(client, auth_headers)
+    state = delete(client, repos, store, audit, user_id)
+
+    assert state["state"] == "completed"
+    assert state["deleted"]["debts"] == 4
+    assert state["deleted"]["recurring"] == 1
+    assert state["deleted"]["attachments"] == 1
+    assert not attachment_path.exists()
+    assert client.portal.call(repos.users.get_by_id, user_id) is None
+    assert client.portal.call(repos.debts.list_for_user, user_id) == []
+    assert audit_events(client, repos, audit, user_id, debt_ids) == []
+
+
+def test_delete_account_data_resumes_after_an_interruption(client, repos, store, audit, auth_headers):
+    user_id, debt_ids, attachment_path = populate(client, auth_headers)
+    with interrupt_after(repos.groups, "delete_for_user"), pytest.raises(Interrupted):
+        delete(client, repos, store, audit, user_id)
+    checkpoint = client.portal.call(repos.jobs.get, f"delete_account:{user_id}")
+    assert checkpoint["state"] == "running"
+    assert checkpoint["step"] == "groups"
+    assert checkpoint["deleted"] == {"recurring": 1, "debts": 4}
+    assert client.portal.call(repos.users.get_by_id, user_id) is not None
+
+    state = delete(client, repos, store, audit, user_id)
+    assert state["state"] == "completed"
+    # Counts from before the interruption are carried over
+    assert state["deleted"]["debts"] == 4
+    assert state["deleted"]["attachments"] == 1
+    assert not attachment_path.exists()
+    assert client.portal.call(repos.users.get_by_id, user_id) is None
+    assert audit_events(client, repos, audit, user_id, debt_ids) == []
+
+    # A completed deletion is not run again
+    completed = client.portal.call(repos.jobs.get, f"delete_account:{user_id}")
+    assert delete(client, repos, store, audit, user_id) == completed
+
+
+def test_account_deletion_request_revokes_access(client, auth_headers):
+    assert client.delete("/api/users/me", headers=auth_headers).status_code == 202
+    assert client.get("/api/users/me", headers=auth_headers).status_code == 401
+
+
+def test_spilled_events_of_deleted_accounts_are_not_replayed(client, repos, audit, auth_headers):
+    user_id, debt_ids, _ = populate(client, auth_headers)
+    event = server.AuditEvent(user_id=user_id, debt_id=debt_ids[0], action=server.AuditAction.UPDATED).dict()
+    audit._spill([event])
+    client.portal.call(repos.users.update, user_id, {"deleted_at": datetime.utcnow()})
+
+    client.portal.call(audit.replay_spilled)
+    history = client.portal.call(repos.audit.history, user_id, debt_ids[0], 0, 100)
+    assert event["id"] not in {stored["id"] for stored in history}
+    assert not list(audit.spill_dir.glob("audit-*"))
@@ -0,0 +1,126 @@
+import os
+from datetime import datetime, timedelta
+
+import server
+
+from .conftest import PASSWORD, create_debt, register
+
+
+def test_register_login_and_profile(client):
+    headers = register(client, "ayse@example.com")
+    assert client.get("/api/users/me", headers=headers).json()["email"] == "ayse@example.com"
+
+    response = client.post("/api/login", json={"email": "ayse@example.com", "password": PASSWORD})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+
+def test_login_rejects_wrong_password(client):
+    register(client, "ayse@example.com")
+    response = client.post("/api/login", json={"email": "ayse@example.com", "password": "wrong-password"})
+    assert response.status_code == 401
+
+
+def test_duplicate_registration_is_rejected(client):
+    register(client, "ayse@example.com")
+    response = client.post("/api/register", json={"email": "ayse@example.com", "password": PASSWORD, "full_name": "Again"})
+    assert response.status_code == 400
+
+
+def test_routes_require_authentication(client):
+    assert client.get("/api/debts").status_code in (401, 403)
+    assert client.get("/api/debts", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
+
+
+def test_debt_crud(client, auth_headers):
+    debt = create_debt(client, auth_headers, amount=250.0)
+    assert debt["amount_in_try"] == 250.0
+
+    response = client.put(f"/api/debts/{debt['id']}", json={"amount": 300.0}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["amount"] == 300.0
+
+    assert client.post(f"/api/debts/{debt['id']}/mark-paid", headers=auth_headers).status_code == 200
+    assert client.get(f"/api/debts/{debt['id']}", headers=auth_headers).json()["status"] == "paid"
+    assert client.post(f"/api/debts/{debt['id']}/mark-unpaid", headers=auth_headers).status_code == 200
+
+    assert client.delete(f"/api/debts/{debt['id']}", headers=auth_headers).status_code == 200
+    assert client.get(f"/api/debts/{debt['id']}", headers=auth_headers).status_code == 404
+
+
+def test_debts_are_scoped_to_their_owner(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    other = register(client)
+    assert client.get(f"/api/debts/{debt['id']}", headers=other).status_code == 404
+    assert client.get("/api/debts", headers=other).json() == []
+
+
+def test_fx_api_url_comes_from_the_environment():
+    # Otherwise the suite would reach the real FX API
+    assert server.FX_API_URL == os.environ["FX_API_URL"]
+
+
+def test_foreign_currency_is_converted_to_try(client, auth_headers):
+    # The FX API is unreachable in tests, so the fallback rate applies
+    debt = create_debt(client, auth_headers, amount=10.0, currency="USD")
+    assert debt["amount_in_try"] == 10.0 * server.FALLBACK_RATES["USD"]
+
+
+def test_search_and_autocomplete_fold_turkish_letters(client, auth_headers):
+    create_debt(client, auth_headers, person_name="İbrahim Doğan", description="Kira payı")
+    create_debt(client, auth_headers, person_name="Ayşe Kaya")
+
+    result = client.get("/api/debts/search", params={"q": "ibrahim"}, headers=auth_headers).json()
+    assert [debt["person_name"] for debt in result["items"]] == ["İbrahim Doğan"]
+
+    suggestions = client.get("/api/debts/autocomplete", params={"prefix": "ay"}, headers=auth_headers).json()
+    assert suggestions == [{"person_name": "Ayşe Kaya", "debt_count": 1}]
+
+
+def test_dashboard_stats(client, auth_headers):
+    create_debt(client, auth_headers, debt_type="i_owe", amount=100.0, person_name="Ali")
+    create_debt(client, auth_headers, debt_type="i_owe", amount=50.0, person_name="Ali")
+    create_debt(client, auth_headers, debt_type="they_owe", amount=30.0,
+                due_date=(datetime.utcnow() - timedelta(days=3)).isoformat())
+
+    stats = client.get("/api/dashboard/stats", headers=auth_headers).json()
+    assert stats["total_owed"] == 150.0
+    assert stats["total_to_collect"] == 30.0
+    assert stats["net_balance"] == -120.0
+    assert stats["person_owe_most"] == "Ali"
+    assert stats["active_debts_count"] == 3
+    assert stats["overdue_debts_count"] == 1
+    assert stats["most_overdue_days"] == 3
+
+
+def test_analytics_breakdown_tracks_changes(client, auth_headers):
+    debt = create_debt(client, auth_headers, amount=700.0, category="rent")
+    first = client.get("/api/analytics/breakdown", headers=auth_headers).json()
+    rent = next(bucket for bucket in first["by_category"] if bucket["key"] == "rent")
+    assert rent == {"key": "rent", "count": 1, "i_owe": 700.0, "they_owe": 0.0}
+
+    client.delete(f"/api/debts/{debt['id']}", headers=auth_headers)
+    second = client.get("/api/analytics/breakdown", headers=auth_headers).json()
+    assert second["data_version"] != first["data_version"]
+    assert sum(bucket["count"] for bucket in second["by_category"]) == 0
+
+
+def test_analytics_breakdown_is_cached_until_a_debt_changes(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    first = client.get("/api/analytics/breakdown", headers=auth_headers).json()
+    assert client.get("/api/analytics/breakdown", headers=auth_headers).json() == first
+
+    client.post(f"/api/debts/{debt['id']}/mark-paid", headers=auth_headers)
+    second = client.get("/api/analytics/breakdown", headers=auth_headers).json()
+    assert second["data_version"] > first["data_version"]
+    assert sum(bucket["count"] for bucket in second["by_category"]) == 0
+
+
+def test_analytics_aging_counts_days_from_the_start_of_today(client, auth_headers):
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    # Due today: not overdue until the day is over, whatever the time now
+    create_debt(client, auth_headers, due_date=today.isoformat())
+    create_debt(client, auth_headers, due_date=(today - timedelta(seconds=1)).isoformat())
+    create_debt(client, auth_headers, due_date=(today - timedelta(days=31)).isoformat())
+    aging = client.get("/api/analytics/breakdown", headers=auth_headers).json()["aging"]
+    assert [bucket["count"] for bucket in aging] == [1, 1, 0, 0]
@@ -0,0 +1,51 @@
+import pytest
+
+import server
+
+from .conftest import Interrupted, create_debt, interrupt_after
+
+
+def paid_debts(client, headers, count):
+    debts = [create_debt(client, headers, description=f"Debt {i}") for i in range(count)]
+    for debt in debts:
+        assert client.post(f"/api/debts/{debt['id']}/mark-paid", headers=headers).status_code == 200
+    return sorted(debt["id"] for debt in debts)
+
+
+def archive(client, repos, older_than_days, batch_size=2):
+    return client.portal.call(server.archive_settled_debts, repos, older_than_days, batch_size, 0)
+
+
+def archived_ids(client, repos, user_id):
+    debts = client.portal.call(repos.debts.list_for_user, user_id, 1000, True)
+    live = {debt["id"] for debt in client.portal.call(repos.debts.list_for_user, user_id)}
+    return sorted(debt["id"] for debt in debts if debt["id"] not in live)
+
+
+def test_archive_moves_paid_debts_only(client, repos, auth_headers):
+    ids = paid_debts(client, auth_headers, 3)
+    unpaid = create_debt(client, auth_headers)
+    assert archive(client, repos, -1) == 3
+    assert archived_ids(client, repos, unpaid["user_id"]) == ids
+    assert [debt["id"] for debt in client.get("/api/debts", headers=auth_headers).json()] == [unpaid["id"]]
+
+
+def test_recent_paid_debts_are_kept(client, repos, auth_headers):
+    paid_debts(client, auth_headers, 2)
+    assert archive(client, repos, 30) == 0
+
+
+def test_interrupted_archive_resumes_from_its_checkpoint(client, repos, auth_headers):
+    ids = paid_debts(client, auth_headers, 5)
+    with interrupt_after(repos.debts, "archive_batch", calls=1), pytest.raises(Interrupted):
+        archive(client, repos, -1)
+    checkpoint = client.portal.call(repos.jobs.get, server.ARCHIVE_JOB)
+    assert checkpoint["state"] == "running"
+    assert checkpoint["last_id"] == ids[1]
+
+    # The resumed run keeps the original cutoff, which these settings alone
+    # would not have reached
+    assert archive(client, repos, 3650) == 3
+    checkpoint = client.portal.call(repos.jobs.get, server.ARCHIVE_JOB)
+    assert checkpoint["state"] == "completed"
+    assert archived_ids(client, repos, client.get("/api/users/me", headers=auth_headers).json()["id"]) == ids
@@ -0,0 +1,88 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+from .conftest import create_debt
+
+CONTENT = bytes(range(256)) * 4
+
+
+def upload(client, headers, debt_id, content=CONTENT, filename="receipt.bin"):
+    response = client.post(
+        f"/api/debts/{debt_id}/attachments",
+        params={"filename": filename},
+        content=content,
+        headers={**headers, "Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+])
+def test_parse_byte_range(header, expected):
+    assert server.parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1200", "bytes=50-10", "bytes=-0"])
+def test_unsatisfiable_range_is_416(header):
+    with pytest.raises(HTTPException) as raised:
+        server.parse_byte_range(header, 1000)
+    assert raised.value.status_code == 416
+    assert raised.value.headers["Content-Range"] == "bytes */1000"
+
+
+def test_download_honours_range(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    attachment = upload(client, auth_headers, debt["id"])
+    url = f"/api/debts/{debt['id']}/attachments/{attachment['id']}"
+
+    full = client.get(url, headers=auth_headers)
+    assert full.status_code == 200
+    assert full.content == CONTENT
+
+    partial = client.get(url, headers={**auth_headers, "Range": "bytes=-16"})
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes {len(CONTENT) - 16}-{len(CONTENT) - 1}/{len(CONTENT)}"
+    assert partial.content == CONTENT[-16:]
+
+
+def test_invalid_content_length_is_400(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    response = client.post(
+        f"/api/debts/{debt['id']}/attachments",
+        params={"filename": "receipt.bin"},
+        content=b"abc",
+        headers={**auth_headers, "Content-Length": "abc"},
+    )
+    assert response.status_code == 400
+
+
+def test_deleting_a_debt_removes_its_stored_objects(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    attachment = upload(client, auth_headers, debt["id"])
+    path = server.ATTACHMENT_DIR / attachment["storage_key"]
+    assert path.exists()
+
+    assert client.delete(f"/api/debts/{debt['id']}", headers=auth_headers).status_code == 200
+    assert not path.exists()
+
+
+def test_archived_debt_attachments_stay_downloadable(client, repos, auth_headers):
+    debt = create_debt(client, auth_headers)
+    attachment = upload(client, auth_headers, debt["id"])
+    assert client.post(f"/api/debts/{debt['id']}/mark-paid", headers=auth_headers).status_code == 200
+    assert client.portal.call(server.archive_settled_debts, repos, -1, 100, 0) == 1
+
+    response = client.get(f"/api/debts/{debt['id']}/attachments/{attachment['id']}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content == CONTENT
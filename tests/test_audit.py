@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import server
+
+from .conftest import create_debt, register
+
+pytestmark = pytest.mark.anyio
+
+CREATED = server.AuditAction.CREATED
+
+
+class FailingStore(Exception):
+    pass
+
+
+@pytest.fixture
+async def repos():
+    repos = server.MemoryRepositories()
+    await repos.users.create(server.User(id="u1", email="u1@example.com", full_name="U", hashed_password="x").dict())
+    return repos
+
+
+def audit_log(repos, tmp_path, **options):
+    return server.AuditLog(repos, spill_dir=tmp_path, **{"flush_interval": 3600, **options})
+
+
+async def stored(repos, debt_id="d1"):
+    return await repos.audit.history("u1", debt_id, 0, 100)
+
+
+def fail_inserts(repos, monkeypatch):
+    async def insert_many(events):
+        raise FailingStore("store is down")
+    monkeypatch.setattr(repos.audit, "insert_many", insert_many)
+
+
+def spill_lines(tmp_path):
+    return [line for path in tmp_path.glob("audit-*") for line in path.read_text().splitlines()]
+
+
+async def test_events_are_written_behind_the_request(repos, tmp_path):
+    audit = audit_log(repos, tmp_path)
+    audit.record("u1", "d1", CREATED)
+    assert audit.has_pending("u1", "d1")
+    assert await stored(repos) == []
+
+    await audit.flush()
+    assert not audit.has_pending("u1", "d1")
+    assert [event["action"] for event in await stored(repos)] == [CREATED]
+
+
+async def test_full_batch_wakes_the_flusher(repos, tmp_path):
+    audit = audit_log(repos, tmp_path, batch_size=3)
+    await audit.start()
+    try:
+        for _ in range(2):
+            audit.record("u1", "d1", CREATED)
+        await asyncio.sleep(0.05)
+        assert await stored(repos) == []
+
+        audit.record("u1", "d1", CREATED)
+        await asyncio.sleep(0.05)
+        assert len(await stored(repos)) == 3
+    finally:
+        await audit.stop()
+
+
+async def test_flush_writes_in_batches(repos, tmp_path, monkeypatch):
+    audit = audit_log(repos, tmp_path, batch_size=2)
+    insert_many = repos.audit.insert_many
+    batches = []
+
+    async def recording_insert_many(events):
+        batches.append(len(events))
+        await insert_many(events)
+
+    monkeypatch.setattr(repos.audit, "insert_many", recording_insert_many)
+    for _ in range(5):
+        audit.record("u1", "d1", CREATED)
+    await audit.flush()
+    assert batches == [2, 2, 1]
+
+
+async def test_failed_flush_keeps_events_buffered(repos, tmp_path, monkeypatch):
+    audit = audit_log(repos, tmp_path)
+    audit.record("u1", "d1", CREATED)
+    insert_many = repos.audit.insert_many
+    fail_inserts(repos, monkeypatch)
+    await audit.flush()
+    assert len(audit.buffer) == 1
+
+    monkeypatch.setattr(repos.audit, "insert_many", insert_many)
+    await audit.flush()
+    assert audit.buffer == []
+    assert len(await stored(repos)) == 1
+
+
+async def test_overflow_is_spilled_to_disk(repos, tmp_path):
+    audit = audit_log(repos, tmp_path, max_buffered=2)
+    for _ in range(3):
+        audit.record("u1", "d1", CREATED)
+    await asyncio.get_running_loop().run_in_executor(server.audit_spill_executor, lambda: None)
+    assert len(audit.buffer) == 2
+    assert len(spill_lines(tmp_path)) == 1
+
+
+async def test_events_unwritten_at_shutdown_are_spilled_then_replayed(repos, tmp_path, monkeypatch):
+    audit = audit_log(repos, tmp_path)
+    await audit.start()
+    insert_many = repos.audit.insert_many
+    fail_inserts(repos, monkeypatch)
+    audit.record("u1", "d1", CREATED)
+    audit.record("u1", "d2", CREATED)
+    await audit.stop()
+    assert len(spill_lines(tmp_path)) == 2
+
+    monkeypatch.setattr(repos.audit, "insert_many", insert_many)
+    restarted = audit_log(repos, tmp_path)
+    await restarted.start()
+    await restarted.stop()
+    assert len(await stored(repos, "d1")) == len(await stored(repos, "d2")) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_failed_replay_is_kept_for_the_next_start(repos, tmp_path, monkeypatch):
+    audit = audit_log(repos, tmp_path)
+    audit._spill([server.AuditEvent(user_id="u1", debt_id="d1", action=CREATED).dict()])
+    insert_many = repos.audit.insert_many
+    fail_inserts(repos, monkeypatch)
+    await audit.replay_spilled()
+    assert [path.name.startswith("audit-retry-") for path in tmp_path.iterdir()] == [True]
+
+    monkeypatch.setattr(repos.audit, "insert_many", insert_many)
+    await audit.replay_spilled()
+    assert len(await stored(repos)) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_truncated_spill_lines_are_skipped(repos, tmp_path):
+    event = server.AuditEvent(user_id="u1", debt_id="d1", action=CREATED).dict()
+    line = json.dumps(server.jsonable_encoder(event))
+    (tmp_path / "audit-1.jsonl").write_text(line + "\n" + line[:20])
+    await audit_log(repos, tmp_path).replay_spilled()
+    assert [stored_event["id"] for stored_event in await stored(repos)] == [event["id"]]
+
+
+def claim(tmp_path, owner, event):
+    path = tmp_path / f"audit-x.jsonl.{owner}.replaying"
+    path.write_text(json.dumps(server.jsonable_encoder(event)) + "\n")
+    return path
+
+
+async def test_claims_left_by_an_earlier_incarnation_are_replayed(repos, tmp_path):
+    # A restarted container's worker gets the same pid but a new start time
+    own_pid = os.getpid()
+    events = [server.AuditEvent(user_id="u1", debt_id="d1", action=CREATED).dict() for _ in range(4)]
+    claim(tmp_path, f"{own_pid}-{server._BOOT_ID or 'boot'}-0", events[0])
+    claim(tmp_path, str(own_pid), events[1])
+    claim(tmp_path, "999999999", events[2])
+    # A live pid that now belongs to a different process
+    claim(tmp_path, f"{os.getppid()}-{server._BOOT_ID or 'boot'}-0", events[3])
+    await audit_log(repos, tmp_path).replay_spilled()
+    assert len(await stored(repos)) == 4
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_claims_held_by_a_live_process_are_left_alone(repos, tmp_path):
+    live_owner = server._process_token(os.getppid())
+    path = claim(tmp_path, live_owner, server.AuditEvent(user_id="u1", debt_id="d1", action=CREATED).dict())
+    await audit_log(repos, tmp_path).replay_spilled()
+    assert await stored(repos) == []
+    assert path.exists()
+
+
+def test_history_lists_events_newest_first_and_survives_deletion(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    assert client.put(f"/api/debts/{debt['id']}", json={"amount": 150.0}, headers=auth_headers).status_code == 200
+    # Read-your-writes: the events are still buffered here
+    history = client.get(f"/api/debts/{debt['id']}/history", headers=auth_headers).json()
+    assert [event["action"] for event in history] == ["updated", "created"]
+    assert history[0]["changes"]["amount"] == [100.0, 150.0]
+
+    assert client.delete(f"/api/debts/{debt['id']}", headers=auth_headers).status_code == 200
+    history = client.get(f"/api/debts/{debt['id']}/history", headers=auth_headers).json()
+    assert [event["action"] for event in history] == ["deleted", "updated", "created"]
+
+
+def test_history_is_scoped_to_the_owner(client, auth_headers):
+    debt = create_debt(client, auth_headers)
+    other_headers = register(client)
+    assert client.get(f"/api/debts/{debt['id']}/history", headers=other_headers).json() == []
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+START = datetime(2025, 3, 10, 12, 0)
+
+
+def row(day, total_minor, debt_type="they_owe"):
+    return {"debt_type": debt_type, "day": day, "total_minor": total_minor}
+
+
+def template(**fields):
+    values = {
+        "user_id": "u1",
+        "debt_type": "i_owe",
+        "person_name": "Landlord",
+        "amount": 1000.0,
+        "currency": "TRY",
+        "description": "Rent",
+        "category": "rent",
+        "frequency": "weekly",
+        "start_date": START,
+        **fields,
+    }
+    return server.DebtTemplate(**values).dict()
+
+
+def test_bin_cash_flow_daily_bins():
+    rows = [row("2025-03-10", 500), row("2025-03-12", 200, "i_owe"), row("2025-03-12", 100)]
+    flow = server.bin_cash_flow(rows, START, days=3, bin_days=1)
+    assert flow["inflow"].tolist() == [500, 0, 100]
+    assert flow["outflow"].tolist() == [0, 0, 200]
+    assert flow["cumulative_net"].tolist() == [500, 500, 400]
+
+
+def test_bin_cash_flow_weekly_bins_round_up_the_last_partial_week():
+    rows = [row("2025-03-10", 100), row("2025-03-16", 200), row("2025-03-17", 300), row("2025-03-26", 400)]
+    flow = server.bin_cash_flow(rows, START, days=17, bin_days=7)
+    assert flow["inflow"].tolist() == [300, 300, 400]
+
+
+def test_bin_cash_flow_overdue_rows_seed_the_running_total():
+    rows = [row("2025-03-01", 1000), row("2025-03-09", 300, "i_owe"), row("2025-03-11", 50, "i_owe")]
+    flow = server.bin_cash_flow(rows, START, days=2, bin_days=1)
+    assert flow["overdue_inflow"] == 1000
+    assert flow["overdue_outflow"] == 300
+    assert flow["outflow"].tolist() == [0, 50]
+    assert flow["cumulative_net"].tolist() == [700, 650]
+
+
+def test_bin_cash_flow_ignores_rows_past_the_horizon():
+    flow = server.bin_cash_flow([row("2025-04-30", 999)], START, days=7, bin_days=1)
+    assert flow["inflow"].sum() == 0
+    assert flow["cumulative_net"].tolist() == [0] * 7
+
+
+def test_bin_cash_flow_with_no_rows():
+    flow = server.bin_cash_flow([], START, days=14, bin_days=7)
+    assert flow["inflow"].tolist() == [0, 0]
+    assert flow["overdue_inflow"] == 0
+
+
+@pytest.mark.anyio
+async def test_recurring_due_rows_lists_occurrences_not_generated_yet():
+    repos = server.MemoryRepositories()
+    await repos.templates.create(template(generated_count=1))
+    rows = await server.recurring_due_rows(repos, "u1", START, START + timedelta(days=21))
+    # Occurrence 0 (Mar 10) was already generated as a debt
+    assert [r["day"] for r in rows] == ["2025-03-17", "2025-03-24"]
+    assert {(r["debt_type"], r["total_minor"]) for r in rows} == {("i_owe", 100000)}
+
+
+@pytest.mark.anyio
+async def test_recurring_due_rows_clamps_overdue_occurrences_to_the_day_before_start():
+    repos = server.MemoryRepositories()
+    await repos.templates.create(template(start_date=START - timedelta(days=14)))
+    rows = await server.recurring_due_rows(repos, "u1", START, START + timedelta(days=1))
+    assert [r["day"] for r in rows] == ["2025-03-09", "2025-03-09", "2025-03-10"]
+
+
+@pytest.mark.anyio
+async def test_recurring_due_rows_respects_installments_and_inactive_templates():
+    repos = server.MemoryRepositories()
+    await repos.templates.create(template(installments=2))
+    await repos.templates.create(template(active=False))
+    rows = await server.recurring_due_rows(repos, "u1", START, START + timedelta(days=60))
+    assert len(rows) == 2
+
+
+@pytest.mark.anyio
+async def test_recurring_due_rows_converts_to_try():
+    repos = server.MemoryRepositories()
+    await repos.templates.create(template(amount=10.0, currency="USD"))
+    rows = await server.recurring_due_rows(repos, "u1", START, START + timedelta(days=1))
+    assert rows[0]["total_minor"] == server.to_minor(10.0 * server.FALLBACK_RATES["USD"])
@@ -0,0 +1,95 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+MEMBERS = ["a", "b", "c"]
+
+
+def expense(**fields):
+    return server.GroupExpenseCreate(description="Dinner", paid_by="a", **fields)
+
+
+def test_distribute_gives_leftover_units_to_largest_remainders():
+    # 100 / 3 = 33 r1 each; the tie on remainders is broken by member id
+    assert server._distribute(100, {"a": 1, "b": 1, "c": 1}) == {"a": 33, "b": 33, "c": 34}
+    # 1000 * 1/6 = 166.67, 1000 * 2/6 = 333.33, 1000 * 3/6 = 500
+    assert server._distribute(1000, {"a": 1, "b": 2, "c": 3}) == {"a": 167, "b": 333, "c": 500}
+
+
+def test_distribute_always_adds_up_to_the_total():
+    for total in range(1, 200):
+        assert sum(server._distribute(total, {"a": 3, "b": 5, "c": 7}).values()) == total
+
+
+def test_equal_split_over_all_members_or_participants():
+    assert server.split_expense(expense(amount=10.0), MEMBERS) == {"a": 333, "b": 333, "c": 334}
+    assert server.split_expense(expense(amount=10.0, participants=["a", "b"]), MEMBERS) == {"a": 500, "b": 500}
+
+
+def test_shares_split_skips_zero_weights():
+    splits = server.split_expense(expense(amount=90.0, split_rule="shares", shares={"a": 1, "b": 2, "c": 0}), MEMBERS)
+    assert splits == {"a": 3000, "b": 6000}
+
+
+def test_exact_split_is_taken_as_given():
+    splits = server.split_expense(
+        expense(amount=100.0, split_rule="exact", exact_amounts={"b": 60.0, "c": 40.0}), MEMBERS
+    )
+    assert splits == {"b": 6000, "c": 4000}
+
+
+@pytest.mark.parametrize("fields, detail", [
+    ({"split_rule": "exact", "exact_amounts": {"b": 150.0, "c": -50.0}}, "Exact amounts must be non-negative"),
+    ({"split_rule": "exact", "exact_amounts": {"b": 60.0, "c": 30.0}}, "Exact amounts must add up to the expense amount"),
+    ({"split_rule": "exact", "exact_amounts": {"b": 60.0, "x": 40.0}}, "Split references an unknown member"),
+    ({"split_rule": "exact"}, "Exact amounts are required for an exact split"),
+    ({"split_rule": "shares", "shares": {"a": 0, "b": 0}}, "Shares must be non-negative and not all zero"),
+    ({"split_rule": "shares", "shares": {"a": 2, "b": -1}}, "Shares must be non-negative and not all zero"),
+    ({"split_rule": "shares", "shares": {"a": 1, "x": 1}}, "Split references an unknown member"),
+    ({"participants": ["a", "x"]}, "Split references an unknown member"),
+])
+def test_invalid_splits_are_rejected(fields, detail):
+    with pytest.raises(HTTPException) as error:
+        server.split_expense(expense(amount=100.0, **fields), MEMBERS)
+    assert error.value.status_code == 400
+    assert error.value.detail == detail
+
+
+def test_settle_balances_nets_debtors_against_creditors():
+    balances = {"a": 5000, "b": -3000, "c": -2000, "d": 0}
+    transfers = server.settle_balances(balances)
+    assert sorted(transfers) == [("b", "a", 3000), ("c", "a", 2000)]
+
+
+def test_settle_balances_clears_every_balance_in_at_most_n_minus_one_transfers():
+    balances = {"a": 7000, "b": 2500, "c": -4000, "d": -3500, "e": -2000}
+    transfers = server.settle_balances(balances)
+    assert len(transfers) <= len(balances) - 1
+    remaining = dict(balances)
+    for debtor, creditor, amount in transfers:
+        remaining[debtor] += amount
+        remaining[creditor] -= amount
+    assert all(amount == 0 for amount in remaining.values())
+
+
+def test_settle_balances_with_nothing_owed():
+    assert server.settle_balances({"a": 0, "b": 0}) == []
+
+
+def test_expenses_update_and_reverse_group_balances(client, auth_headers):
+    group = client.post("/api/groups", json={"name": "Trip", "currency": "TRY", "members": ["Ali", "Ayşe"]},
+                        headers=auth_headers).json()
+    ali, ayse = (member["id"] for member in group["members"])
+    created = client.post(f"/api/groups/{group['id']}/expenses",
+                          json={"description": "Hotel", "amount": 300.0, "paid_by": ali}, headers=auth_headers)
+    assert created.status_code == 200
+
+    settlement = client.get(f"/api/groups/{group['id']}/settlement", headers=auth_headers).json()
+    assert settlement["balances"] == {ali: 150.0, ayse: -150.0}
+    assert settlement["transfers"] == [{"from_member": ayse, "to_member": ali, "amount": 150.0}]
+
+    client.delete(f"/api/groups/{group['id']}/expenses/{created.json()['id']}", headers=auth_headers)
+    settlement = client.get(f"/api/groups/{group['id']}/settlement", headers=auth_headers).json()
+    assert all(amount == 0 for amount in settlement["balances"].values())
+    assert settlement["transfers"] == []
@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+
+import server
+
+
+def test_not_ready_until_lifespan_startup_finishes(monkeypatch):
+    app = server.create_app()
+    warm_up = server.warm_up
+    ready_during_warm_up = []
+
+    def recording_warm_up(app):
+        ready_during_warm_up.append(app.state.ready)
+        warm_up(app)
+
+    monkeypatch.setattr(server, "warm_up", recording_warm_up)
+
+    # Without the lifespan (TestClient outside "with") nothing has started
+    idle = TestClient(app)
+    response = idle.get("/readyz")
+    assert response.status_code == 503
+    assert response.json() == {"status": "starting"}
+    assert idle.get("/healthz").json() == {"status": "ok"}
+
+    with TestClient(app) as client:
+        assert ready_during_warm_up == [False]
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ready"
+        assert body["startup_seconds"] > 0
+        assert client.get("/healthz").status_code == 200
+
+    # Shutting down takes the instance out of rotation again
+    assert idle.get("/readyz").status_code == 503
+    assert idle.get("/healthz").status_code == 200
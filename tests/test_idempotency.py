@@ -0,0 +1,88 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import server
+
+from .conftest import register
+
+DEBT = {
+    "debt_type": "they_owe",
+    "person_name": "Mehmet Demir",
+    "amount": 250.0,
+    "currency": "TRY",
+    "description": "Concert tickets",
+    "category": "personal_loan",
+}
+
+
+def post_debt(client, headers, key, payload=DEBT):
+    return client.post("/api/debts", json=payload, headers={**headers, "Idempotency-Key": key})
+
+
+def debt_count(client, headers):
+    return len(client.get("/api/debts", headers=headers).json())
+
+
+def test_retry_replays_the_first_response(client, auth_headers):
+    first = post_debt(client, auth_headers, "create-1")
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    retry = post_debt(client, auth_headers, "create-1")
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert debt_count(client, auth_headers) == 1
+
+
+def test_key_reused_with_a_different_body_is_422(client, auth_headers):
+    assert post_debt(client, auth_headers, "create-1").status_code == 200
+    response = post_debt(client, auth_headers, "create-1", {**DEBT, "amount": 300.0})
+    assert response.status_code == 422
+    assert debt_count(client, auth_headers) == 1
+
+
+def test_requests_without_a_key_are_not_deduplicated(client, auth_headers):
+    for _ in range(2):
+        assert client.post("/api/debts", json=DEBT, headers=auth_headers).status_code == 200
+    assert debt_count(client, auth_headers) == 2
+
+
+def test_keys_are_scoped_per_user(client, auth_headers):
+    other_headers = register(client)
+    first = post_debt(client, auth_headers, "shared-key")
+    second = post_debt(client, other_headers, "shared-key")
+    assert second.status_code == 200
+    assert "Idempotent-Replayed" not in second.headers
+    assert second.json()["id"] != first.json()["id"]
+
+
+def test_retry_while_first_request_is_pending_is_409(client, repos, auth_headers):
+    debt = post_debt(client, auth_headers, "create-1").json()
+    path = f"/api/debts/{debt['id']}/mark-paid"
+    now = datetime.utcnow()
+    # What the first request stores before its handler runs
+    client.portal.call(repos.idempotency.acquire, {
+        "_id": f"{debt['user_id']}:pay-1",
+        "state": "pending",
+        "fingerprint": hashlib.sha256(f"POST {path}\n".encode()).hexdigest(),
+        "locked_until": now + timedelta(seconds=server.IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=server.IDEMPOTENCY_TTL_SECONDS),
+    }, now)
+
+    response = client.post(path, headers={**auth_headers, "Idempotency-Key": "pay-1"})
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert client.get(f"/api/debts/{debt['id']}", headers=auth_headers).json()["status"] != "paid"
+
+
+def test_failed_request_releases_its_key(client, auth_headers):
+    headers = {**auth_headers, "Idempotency-Key": "pay-missing"}
+    assert client.post("/api/debts/missing/mark-paid", headers=headers).status_code == 404
+    # Not replayed and not reported as in progress
+    assert client.post("/api/debts/missing/mark-paid", headers=headers).status_code == 404
+
+
+def test_overlong_key_is_400(client, auth_headers):
+    response = post_debt(client, auth_headers, "k" * (server.IDEMPOTENCY_KEY_MAX_LENGTH + 1))
+    assert response.status_code == 400
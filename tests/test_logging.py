@@ -0,0 +1,67 @@
+import json
+import logging
+import queue
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def log_records():
+    """Records the server logger emits, as the queue handler prepares them"""
+    records = queue.Queue()
+    handler = server.ContextQueueHandler(records)
+    level = server.logger.level
+    server.logger.addHandler(handler)
+    server.logger.setLevel(logging.INFO)
+    yield records
+    server.logger.setLevel(level)
+    server.logger.removeHandler(handler)
+
+
+def access_log(records):
+    entries = [json.loads(server.JsonFormatter().format(records.get_nowait())) for _ in range(records.qsize())]
+    return [entry for entry in entries if entry["message"] == "request"]
+
+
+def test_request_id_is_generated_and_echoed(client):
+    first = client.get("/healthz").headers["X-Request-ID"]
+    second = client.get("/healthz").headers["X-Request-ID"]
+    assert len(first) == 32 and first != second
+
+
+def test_incoming_request_id_is_reused_if_sane(client):
+    assert client.get("/healthz", headers={"X-Request-ID": "edge-1234.a:b"}).headers["X-Request-ID"] == "edge-1234.a:b"
+    replaced = client.get("/healthz", headers={"X-Request-ID": "bad id\"}"}).headers["X-Request-ID"]
+    assert replaced != "bad id\"}" and len(replaced) == 32
+
+
+def test_json_log_lines_carry_the_request_id(client, log_records):
+    response = client.get("/api/debts", headers={"X-Request-ID": "trace-42"})
+    [entry] = access_log(log_records)
+    assert entry["request_id"] == "trace-42"
+    assert entry["route"] == "/api/debts"
+    assert entry["status"] == response.status_code
+    assert {"ts", "level", "logger", "duration_ms"} <= set(entry)
+
+
+def test_request_id_is_not_leaked_outside_the_request(client, log_records):
+    client.get("/healthz")
+    server.logger.info("background work")
+    entry = json.loads(server.JsonFormatter().format(log_records.queue[-1]))
+    assert entry["message"] == "background work"
+    assert "request_id" not in entry
+
+
+def test_importing_the_server_leaves_logging_alone():
+    # Configured by the lifespan only, so scripts and tools keep their own
+    check = (
+        "import logging, threading, server\n"
+        "assert not any(isinstance(h, server.ContextQueueHandler) for h in logging.getLogger().handlers)\n"
+        "assert threading.active_count() == 1, threading.enumerate()\n"
+    )
+    subprocess.run([sys.executable, "-c", check], cwd=Path(server.__file__).parent, check=True)
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from prometheus_client.parser import text_string_to_metric_families
+from pymongo import monitoring
+
+import server
+
+from .conftest import create_debt
+
+
+def scrape(client):
+    """Samples from /metrics as {(name, labels): value}"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def requests_total(samples, route, status):
+    key = ("http_requests_total", (("method", "GET"), ("route", route), ("status", status)))
+    return samples.get(key, 0)
+
+
+def test_http_metrics_are_labelled_by_route_template(client, auth_headers):
+    before = scrape(client)
+    debts = [create_debt(client, auth_headers) for _ in range(2)]
+    for debt in debts:
+        assert client.get(f"/api/debts/{debt['id']}", headers=auth_headers).status_code == 200
+    assert client.get("/api/debts/missing", headers=auth_headers).status_code == 404
+    assert client.get("/no/such/path").status_code == 404
+
+    after = scrape(client)
+    route = "/api/debts/{debt_id}"
+    assert requests_total(after, route, "200") - requests_total(before, route, "200") == 2
+    assert requests_total(after, route, "404") - requests_total(before, route, "404") == 1
+    assert requests_total(after, "unmatched", "404") - requests_total(before, "unmatched", "404") == 1
+    # Neither ids nor unknown paths become label values
+    routes = {dict(labels).get("route") for name, labels in after if name.startswith("http_request")}
+    assert not any(debt["id"] in (route or "") for debt in debts for route in routes)
+    assert "/no/such/path" not in routes
+
+
+def mongo_samples(samples, collection, command):
+    labels = (("collection", collection), ("command", command))
+    count = samples.get(("mongodb_command_duration_seconds_count", labels), 0)
+    failures = samples.get(("mongodb_command_failures_total", labels), 0)
+    return count, failures
+
+
+def run_command(listener, command, request_id, duration_ms=2, failure=None):
+    connection = ("localhost", 27017)
+    name = next(iter(command))
+    listener.started(monitoring.CommandStartedEvent(command, "debt_tracker", request_id, connection, request_id))
+    if failure is None:
+        listener.succeeded(monitoring.CommandSucceededEvent(
+            timedelta(milliseconds=duration_ms), {"ok": 1}, name, request_id, connection, request_id
+        ))
+    else:
+        listener.failed(monitoring.CommandFailedEvent(
+            timedelta(milliseconds=duration_ms), {"ok": 0, "errmsg": failure}, name, request_id, connection, request_id
+        ))
+
+
+def test_mongo_command_histograms_are_populated(client):
+    # The suite runs on the memory backend, so feed the listener Motor would
+    # be given the same command events pymongo publishes
+    listener = server.MongoCommandMetrics()
+    before = scrape(client)
+    run_command(listener, {"find": "debts", "filter": {}}, 1)
+    run_command(listener, {"getMore": 12345, "collection": "debts"}, 2)
+    run_command(listener, {"insert": "audit_events", "documents": []}, 3, failure="duplicate key")
+    run_command(listener, {"hello": 1}, 4)
+    after = scrape(client)
+
+    def delta(collection, command):
+        new, old = mongo_samples(after, collection, command), mongo_samples(before, collection, command)
+        return new[0] - old[0], new[1] - old[1]
+
+    assert delta("debts", "find") == (1, 0)
+    assert delta("debts", "getMore") == (1, 0)
+    assert delta("audit_events", "insert") == (1, 1)
+    # Unlisted commands share one label
+    assert delta("none", "other") == (1, 0)
+    # Every started command was matched with its outcome
+    assert listener._collections == {}
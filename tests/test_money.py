@@ -0,0 +1,130 @@
+import pytest
+
+import backfill
+import migrate_money
+import migrate_search
+import server
+
+from .conftest import create_debt
+
+pytestmark = pytest.mark.anyio
+
+
+def test_minor_units_round_half_up_without_float_error():
+    assert server.to_minor(0.1) + server.to_minor(0.2) == server.to_minor(0.3) == 30
+    assert server.to_minor(2.675) == 268
+    assert server.to_minor(-1.005) == -101
+    assert server.from_minor(12345) == 123.45
+
+
+def test_dashboard_totals_are_exact(client, auth_headers):
+    for _ in range(10):
+        create_debt(client, auth_headers, amount=0.1)
+    for _ in range(3):
+        create_debt(client, auth_headers, debt_type="they_owe", amount=0.7)
+    stats = client.get("/api/dashboard/stats", headers=auth_headers).json()
+    # Summing the floats would give 0.9999999999999999 and 2.0999999999999996
+    assert stats["total_owed"] == 1.0
+    assert stats["total_to_collect"] == 2.1
+    assert stats["net_balance"] == 1.1
+
+
+def test_unmigrated_debts_fall_back_to_their_float_amounts(client, repos, auth_headers):
+    debt = create_debt(client, auth_headers, amount=10.0)
+    legacy = {**debt, "id": "legacy", "amount": 0.29, "amount_in_try": 0.29, "person_name_folded": "legacy"}
+    client.portal.call(repos.debts.create, legacy)
+
+    stats = client.get("/api/dashboard/stats", headers=auth_headers).json()
+    assert stats["total_owed"] == 10.29
+    breakdown = client.get("/api/analytics/breakdown", headers=auth_headers).json()
+    by_currency = next(bucket for bucket in breakdown["by_currency"] if bucket["key"] == "TRY")
+    assert by_currency["i_owe"] == 10.29
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the backfill driver"""
+
+    name = "debts"
+
+    def __init__(self, documents):
+        self.documents = {doc["_id"]: doc for doc in documents}
+        self.bulk_writes = 0
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, condition in query.items():
+            if field == "$or":
+                if not any(FakeCollection._matches(doc, clause) for clause in condition):
+                    return False
+            elif "$exists" in condition:
+                if (field in doc) != condition["$exists"]:
+                    return False
+            elif "$gt" in condition:
+                if not doc[field] > condition["$gt"]:
+                    return False
+        return True
+
+    def find(self, query, projection):
+        return FakeCursor([
+            {field: doc[field] for field in projection if field in doc}
+            for doc in self.documents.values() if self._matches(doc, query)
+        ])
+
+    async def bulk_write(self, requests, ordered):
+        self.bulk_writes += 1
+        for request in requests:
+            self.documents[request._filter["_id"]].update(request._doc["$set"])
+
+
+def legacy_debts(count):
+    return [{"_id": i, "person_name": "İpek Şahin", "amount": i + 0.105, "amount_in_try": 2 * i + 0.105}
+            for i in range(count)]
+
+
+async def test_money_backfill_adds_exact_minor_units_in_batches():
+    collection = FakeCollection(legacy_debts(5) + [
+        {"_id": 10, "amount": 3.0, "amount_in_try": 3.0, "amount_minor": 300, "amount_in_try_minor": 300}
+    ])
+    processed = await backfill.backfill_collection(
+        collection, migrate_money.UNMIGRATED, {"amount": 1, "amount_in_try": 1}, migrate_money.money_fields, 2, False
+    )
+    assert processed == 5
+    assert collection.bulk_writes == 3
+    assert [(doc["amount_minor"], doc["amount_in_try_minor"]) for doc in collection.documents.values()] == [
+        (11, 11), (111, 211), (211, 411), (311, 611), (411, 811), (300, 300)
+    ]
+
+    # Migrated documents no longer match, so a re-run has nothing to do
+    assert await backfill.backfill_collection(
+        collection, migrate_money.UNMIGRATED, {}, migrate_money.money_fields, 2, False
+    ) == 0
+
+
+async def test_search_backfill_dry_run_writes_nothing():
+    collection = FakeCollection(legacy_debts(3))
+    processed = await backfill.backfill_collection(
+        collection, migrate_search.UNMIGRATED, {"person_name": 1}, migrate_search.search_fields, 10, True
+    )
+    assert processed == 3
+    assert collection.bulk_writes == 0
+
+    await backfill.backfill_collection(
+        collection, migrate_search.UNMIGRATED, {"person_name": 1}, migrate_search.search_fields, 10, False
+    )
+    assert {doc["person_name_folded"] for doc in collection.documents.values()} == {"ipek sahin"}
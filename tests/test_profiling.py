@@ -0,0 +1,82 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+from .conftest import register
+
+TOKEN = "profile-admin-token"
+
+
+@pytest.fixture
+def profiled_app(monkeypatch, tmp_path):
+    """An app with the profiler enabled by admin token, writing into tmp_path"""
+    monkeypatch.setattr(server, "PROFILE_ADMIN_TOKEN", TOKEN)
+    monkeypatch.setattr(server, "PROFILE_OUTPUT_DIR", tmp_path)
+    with TestClient(server.create_app()) as client:
+        yield client
+
+
+@pytest.fixture
+def no_sampling(monkeypatch):
+    """Fail the test if any request starts a stack sampler"""
+    def forbidden(*args, **kwargs):
+        raise AssertionError("request was profiled")
+
+    monkeypatch.setattr(server, "StackSampler", forbidden)
+
+
+def written_profiles(output_dir, profile_id, timeout=5.0):
+    # Profiles are written on an executor after the response is sent
+    paths = [output_dir / f"{profile_id}.folded", output_dir / f"{profile_id}.speedscope.json"]
+    deadline = time.monotonic() + timeout
+    while not all(path.exists() for path in paths) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return paths
+
+
+def test_wrong_token_is_not_profiled(profiled_app, tmp_path, no_sampling):
+    headers = register(profiled_app)
+    response = profiled_app.get("/api/debts", headers={**headers, "X-Profile": "not-the-token"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_admin_token_writes_folded_and_speedscope_profiles(profiled_app, tmp_path):
+    headers = register(profiled_app)
+    response = profiled_app.get("/api/debts/missing", headers={**headers, "X-Profile": TOKEN})
+    assert response.status_code == 404
+    profile_id = response.headers["x-profile-id"]
+
+    folded, speedscope = written_profiles(tmp_path, profile_id)
+    for line in folded.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+    document = json.loads(speedscope.read_text())
+    assert document["metadata"]["route"] == "/api/debts/{debt_id}"
+    assert document["metadata"]["status"] == 404
+    assert document["metadata"]["trigger"] == "header"
+    profile = document["profiles"][0]
+    assert len(profile["samples"]) == len(profile["weights"])
+    # Nothing lands in the default directory next to the code
+    assert not (server.ROOT_DIR / "profiles" / f"{profile_id}.folded").exists()
+
+
+def test_disabled_profiler_adds_no_work(monkeypatch, tmp_path, no_sampling):
+    monkeypatch.setattr(server, "PROFILE_ADMIN_TOKEN", None)
+    monkeypatch.setattr(server, "PROFILE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(server, "PROFILE_OUTPUT_DIR", tmp_path)
+    calls = []
+    monkeypatch.setattr(server.ProfilingMiddleware, "_should_profile", lambda self, scope: calls.append(scope))
+
+    with TestClient(server.create_app()) as client:
+        response = client.get("/healthz", headers={"X-Profile": TOKEN})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    # A straight pass-through: the headers are not even looked at
+    assert calls == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,103 @@
+import pytest
+from starlette.requests import Request
+
+import server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+async def hits(limiter, key, rate, count):
+    return [await limiter.hit(key, rate) for _ in range(count)]
+
+
+def request_from(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 12345)})
+
+
+def test_parse_rate_limit():
+    rate = server.RateLimit.parse("20/60")
+    assert (rate.limit, rate.period) == (20, 60.0)
+
+
+@pytest.mark.anyio
+async def test_bucket_allows_burst_then_reports_retry_after(clock):
+    limiter = server.MemoryRateLimiter(clock=clock)
+    rate = server.RateLimit.parse("3/60")
+    assert await hits(limiter, "k", rate, 3) == [None, None, None]
+    assert await limiter.hit("k", rate) == pytest.approx(20.0)
+
+
+@pytest.mark.anyio
+async def test_bucket_refills_over_time(clock):
+    limiter = server.MemoryRateLimiter(clock=clock)
+    rate = server.RateLimit.parse("3/60")
+    await hits(limiter, "k", rate, 3)
+
+    clock.now += 20
+    assert await limiter.hit("k", rate) is None
+    assert await limiter.hit("k", rate) is not None
+
+    clock.now += 60
+    assert await hits(limiter, "k", rate, 3) == [None, None, None]
+
+
+@pytest.mark.anyio
+async def test_keys_have_independent_buckets(clock):
+    limiter = server.MemoryRateLimiter(clock=clock)
+    rate = server.RateLimit.parse("1/60")
+    assert await limiter.hit("a", rate) is None
+    assert await limiter.hit("a", rate) is not None
+    assert await limiter.hit("b", rate) is None
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_keys_are_evicted_past_max_keys(clock):
+    limiter = server.MemoryRateLimiter(max_keys=2, clock=clock)
+    rate = server.RateLimit.parse("1/60")
+    for key in ("a", "b", "c"):
+        await limiter.hit(key, rate)
+    assert list(limiter.buckets) == ["b", "c"]
+
+
+@pytest.mark.anyio
+async def test_idle_keys_are_evicted_after_a_full_period(clock):
+    limiter = server.MemoryRateLimiter(clock=clock)
+    rate = server.RateLimit.parse("1/60")
+    await limiter.hit("a", rate)
+    clock.now += 61
+    await limiter.hit("b", rate)
+    assert list(limiter.buckets) == ["b"]
+
+
+def test_client_ip_ignores_forwarded_for_without_trusted_proxies():
+    request = request_from("10.0.0.5", "203.0.113.9")
+    assert server.client_ip(request, trusted_proxies=0) == "10.0.0.5"
+
+
+def test_client_ip_uses_hop_appended_by_trusted_proxy():
+    request = request_from("10.0.0.5", "1.2.3.4, 203.0.113.9")
+    assert server.client_ip(request, trusted_proxies=1) == "203.0.113.9"
+    assert server.client_ip(request, trusted_proxies=2) == "1.2.3.4"
+    assert server.client_ip(request, trusted_proxies=5) == "1.2.3.4"
+
+
+def test_login_returns_429_with_retry_after(client):
+    payload = {"email": "limited@example.com", "password": "wrong-password"}
+    statuses = [client.post("/api/login", json=payload).status_code for _ in range(server.RATE_LIMIT_PER_EMAIL.limit)]
+    assert 429 not in statuses
+
+    response = client.post("/api/login", json=payload)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
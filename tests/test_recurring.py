@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+MONTHLY = server.RecurrenceFrequency.MONTHLY
+WEEKLY = server.RecurrenceFrequency.WEEKLY
+
+
+@pytest.mark.parametrize("start, index, expected", [
+    (datetime(2025, 1, 31), 1, datetime(2025, 2, 28)),
+    (datetime(2024, 1, 31), 1, datetime(2024, 2, 29)),
+    (datetime(2025, 1, 31), 2, datetime(2025, 3, 31)),
+    (datetime(2025, 1, 31), 3, datetime(2025, 4, 30)),
+    (datetime(2025, 11, 30), 3, datetime(2026, 2, 28)),
+    (datetime(2025, 1, 15, 9, 30), 12, datetime(2026, 1, 15, 9, 30)),
+])
+def test_monthly_occurrences_clamp_to_month_end(start, index, expected):
+    assert server.occurrence_due_date(start, MONTHLY, 1, index) == expected
+
+
+def test_monthly_interval_skips_months():
+    assert server.occurrence_due_date(datetime(2025, 8, 31), MONTHLY, 3, 2) == datetime(2026, 2, 28)
+
+
+def test_weekly_occurrences():
+    assert server.occurrence_due_date(datetime(2025, 1, 1), WEEKLY, 2, 3) == datetime(2025, 2, 12)
+
+
+def test_recurring_debt_ids_are_deterministic():
+    assert server.recurring_debt_id("template", 3) == server.recurring_debt_id("template", 3)
+    assert server.recurring_debt_id("template", 3) != server.recurring_debt_id("template", 4)
+
+
+def create_template(client, headers, **fields):
+    payload = {
+        "debt_type": "i_owe",
+        "person_name": "Landlord",
+        "amount": 500.0,
+        "currency": "TRY",
+        "description": "Rent",
+        "category": "rent",
+        "frequency": "weekly",
+        "start_date": (datetime.utcnow() - timedelta(days=14)).isoformat(),
+        **fields,
+    }
+    response = client.post("/api/recurring", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def recurring_debts(client, repos, user_id):
+    debts = client.portal.call(repos.debts.list_for_user, user_id)
+    return sorted(debt["id"] for debt in debts if debt.get("template_id"))
+
+
+def test_materializer_is_idempotent(client, repos, auth_headers):
+    template = create_template(client, auth_headers)
+    generated = recurring_debts(client, repos, template["user_id"])
+    assert len(generated) == template["generated_count"] > 0
+
+    # Re-running with the template as it was before advancing (a crash
+    # between insert and advance) re-plans the same occurrences
+    stale = client.portal.call(repos.templates.get, template["user_id"], template["id"])
+    stale["generated_count"] = 0
+    created = client.portal.call(
+        server.materialize_templates, repos, [stale], datetime.utcnow(),
+        timedelta(days=server.RECURRING_HORIZON_DAYS), server.RECURRING_BATCH_SIZE
+    )
+    assert created == 0
+    assert client.portal.call(server.materialize_recurring_debts, repos) == 0
+    assert recurring_debts(client, repos, template["user_id"]) == generated
+
+
+def test_installments_cap_generated_occurrences(client, repos, auth_headers):
+    template = create_template(client, auth_headers, installments=2)
+    assert template["generated_count"] == 2
+    assert len(recurring_debts(client, repos, template["user_id"])) == 2
@@ -0,0 +1,117 @@
+from decimal import Decimal
+
+import pytest
+
+import server
+
+from .conftest import create_debt, register
+
+I_OWE = server.DebtType.I_OWE.value
+THEY_OWE = server.DebtType.THEY_OWE.value
+
+
+@pytest.fixture
+def rates(monkeypatch):
+    """TRY per unit of each currency; tests may change them between requests"""
+    rates = {"TRY": 1.0, "USD": 32.0, "EUR": 35.0}
+
+    async def get_exchange_rates():
+        return rates
+
+    monkeypatch.setattr(server, "get_exchange_rates", get_exchange_rates)
+    return rates
+
+
+def subtotal(debt_type, currency, total_minor):
+    return {"debt_type": debt_type, "currency": currency, "total_minor": total_minor}
+
+
+def test_revalue_converts_every_currency_into_the_target():
+    rates = {"TRY": 1.0, "USD": 32.0, "EUR": 40.0}
+    subtotals = [
+        subtotal(I_OWE, "TRY", 6400),
+        subtotal(I_OWE, "USD", 1000),
+        subtotal(THEY_OWE, "EUR", 500),
+    ]
+    assert server.revalue_balances(subtotals, rates, "USD") == {
+        I_OWE: Decimal("12.00"),
+        THEY_OWE: Decimal("6.25"),
+    }
+    assert server.revalue_balances(subtotals, rates, "TRY") == {
+        I_OWE: Decimal("384.00"),
+        THEY_OWE: Decimal("200.00"),
+    }
+
+
+def test_revalue_rounds_once_half_up():
+    rates = {"TRY": 1.0, "USD": 200.0}
+    # Each row alone is 0.005 USD; rounding per row would give 0.02, not 0.01
+    subtotals = [subtotal(I_OWE, "TRY", 100), subtotal(I_OWE, "TRY", 100), subtotal(THEY_OWE, "TRY", 200)]
+    revalued = server.revalue_balances(subtotals, rates, "USD")
+    assert revalued == {I_OWE: Decimal("0.01"), THEY_OWE: Decimal("0.01")}
+
+
+def test_revalue_avoids_binary_rounding_error():
+    rates = {"TRY": 1.0, "USD": 0.1, "EUR": 0.3}
+    revalued = server.revalue_balances([subtotal(I_OWE, "USD", 30)], rates, "EUR")
+    assert revalued[I_OWE] == Decimal("0.10")
+
+
+def test_revalue_without_balances_is_zero():
+    assert server.revalue_balances([], {"TRY": 1.0}, "TRY") == {I_OWE: Decimal(0), THEY_OWE: Decimal(0)}
+
+
+def stats(client, headers, **params):
+    response = client.get("/api/dashboard/stats", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_dashboard_revalues_at_current_rates(client, auth_headers, rates):
+    create_debt(client, auth_headers, amount=100.0, currency="USD")
+    create_debt(client, auth_headers, debt_type="they_owe", amount=350.0, currency="TRY")
+    rates["USD"] = 40.0
+
+    result = stats(client, auth_headers)
+    # Booked at the rate on the day the debt was created
+    assert result["total_owed"] == 3200.0
+    # Revalued at today's rate in the default reporting currency
+    assert result["reporting_currency"] == "TRY"
+    assert result["revalued_total_owed"] == 4000.0
+    assert result["revalued_total_to_collect"] == 350.0
+    assert result["revalued_net_balance"] == -3650.0
+
+
+def test_currency_parameter_overrides_the_reporting_currency(client, auth_headers, rates):
+    create_debt(client, auth_headers, amount=100.0, currency="USD")
+    create_debt(client, auth_headers, debt_type="they_owe", amount=70.0, currency="EUR")
+
+    result = stats(client, auth_headers, currency="EUR")
+    assert result["reporting_currency"] == "EUR"
+    assert result["revalued_total_owed"] == 91.43
+    assert result["revalued_total_to_collect"] == 70.0
+    assert result["revalued_net_balance"] == -21.43
+    assert client.get("/api/dashboard/stats", params={"currency": "GBP"}, headers=auth_headers).status_code == 422
+
+
+def test_reporting_currency_preference_is_persisted(client, auth_headers, rates):
+    create_debt(client, auth_headers, amount=64.0, currency="TRY")
+    response = client.put("/api/users/me/preferences", json={"reporting_currency": "USD"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["reporting_currency"] == "USD"
+    assert client.get("/api/users/me", headers=auth_headers).json()["reporting_currency"] == "USD"
+
+    result = stats(client, auth_headers)
+    assert result["reporting_currency"] == "USD"
+    assert result["revalued_total_owed"] == 2.0
+    # An explicit currency still wins over the preference
+    assert stats(client, auth_headers, currency="TRY")["revalued_total_owed"] == 64.0
+
+
+def test_empty_preferences_leave_the_profile_unchanged(client, rates):
+    headers = register(client)
+    client.put("/api/users/me/preferences", json={"reporting_currency": "EUR"}, headers=headers)
+    response = client.put("/api/users/me/preferences", json={}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["reporting_currency"] == "EUR"
+    assert client.put("/api/users/me/preferences", json={"reporting_currency": "XYZ"}, headers=headers).status_code == 422
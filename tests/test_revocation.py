@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+import server
+
+from .conftest import register
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = server.BloomFilter(capacity=5000, error_rate=0.01)
+    keys = [f"token-{i}" for i in range(5000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate_stays_near_target():
+    bloom = server.BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"token-{i}")
+    false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_empty_bloom_filter_contains_nothing():
+    assert "anything" not in server.BloomFilter(capacity=100, error_rate=0.001)
+
+
+def test_tokens_carry_a_unique_jti():
+    first = jwt.decode(server.create_access_token({"sub": "a@example.com"}), options={"verify_signature": False})
+    second = jwt.decode(server.create_access_token({"sub": "a@example.com"}), options={"verify_signature": False})
+    assert first["jti"] != second["jti"]
+
+
+def test_logout_revokes_only_the_presented_token(client):
+    headers = register(client, "ayse@example.com")
+    other = client.post("/api/login", json={"email": "ayse@example.com", "password": "SecurePass123!"}).json()
+    other_headers = {"Authorization": f"Bearer {other['access_token']}"}
+
+    assert client.post("/api/logout", headers=headers).json() == {"message": "Logged out"}
+    assert client.get("/api/debts", headers=headers).status_code == 401
+    assert client.post("/api/logout", headers=headers).status_code == 401
+    assert client.get("/api/debts", headers=other_headers).status_code == 200
+
+
+def test_tokens_without_jti_cannot_be_revoked(client):
+    register(client, "ayse@example.com")
+    legacy = jwt.encode({"sub": "ayse@example.com", "exp": datetime.utcnow() + timedelta(minutes=5)},
+                        server.SECRET_KEY, algorithm=server.ALGORITHM)
+    headers = {"Authorization": f"Bearer {legacy}"}
+    assert client.get("/api/debts", headers=headers).status_code == 200
+    assert client.post("/api/logout", headers=headers).status_code == 400
+
+
+def test_revocation_survives_a_filter_rebuild(client):
+    headers = register(client)
+    client.post("/api/logout", headers=headers)
+    revocation_filter = client.app.state.revocation_filter
+    revocation_filter.built_at = None
+    client.portal.call(revocation_filter.refresh)
+    assert client.get("/api/debts", headers=headers).status_code == 401
+
+
+@pytest.mark.anyio
+async def test_refresh_picks_up_revocations_from_other_workers():
+    repos = server.MemoryRepositories()
+    revocation_filter = server.TokenRevocationFilter(repos)
+    await revocation_filter.refresh()
+    # Written by another worker: no invalidation bus event reaches this filter
+    await repos.revocations.revoke("jti-1", "u1", datetime.utcnow() + timedelta(minutes=5))
+    assert not revocation_filter.might_be_revoked("jti-1")
+    await revocation_filter.refresh()
+    assert revocation_filter.might_be_revoked("jti-1")
+
+
+@pytest.mark.anyio
+async def test_rebuild_drops_expired_revocations():
+    repos = server.MemoryRepositories()
+    await repos.revocations.revoke("expired", "u1", datetime.utcnow() - timedelta(seconds=1))
+    await repos.revocations.revoke("live", "u1", datetime.utcnow() + timedelta(minutes=5))
+    revocation_filter = server.TokenRevocationFilter(repos)
+    await revocation_filter.refresh()
+    assert revocation_filter.might_be_revoked("live")
+    assert not revocation_filter.might_be_revoked("expired")
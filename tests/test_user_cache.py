@@ -0,0 +1,70 @@
+import pytest
+
+from .conftest import PASSWORD, register
+
+
+@pytest.fixture
+def published(client):
+    """Keys published on the "user" topic, in order"""
+    keys = []
+    client.app.state.invalidation_bus.subscribe("user", keys.append)
+    return keys
+
+
+def cached(client, email):
+    return client.app.state.user_cache.get(email)
+
+
+def signed_in(client):
+    headers = register(client)
+    email = client.get("/api/users/me", headers=headers).json()["email"]
+    assert cached(client, email) is not None
+    return headers, email
+
+
+def test_preference_change_evicts_the_cached_user(client, published):
+    headers, email = signed_in(client)
+    response = client.put("/api/users/me/preferences", json={"reporting_currency": "USD"}, headers=headers)
+    assert response.status_code == 200
+    assert published == [email]
+    assert cached(client, email) is None
+    # The next request reloads the user rather than serving the stale copy
+    assert client.get("/api/users/me", headers=headers).json()["reporting_currency"] == "USD"
+    assert cached(client, email).reporting_currency == "USD"
+
+
+def test_password_change_evicts_the_cached_user(client, published):
+    headers, email = signed_in(client)
+    response = client.put(
+        "/api/users/me/password", json={"current_password": PASSWORD, "new_password": "N3w-Secret!"}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert published == [email]
+    assert cached(client, email) is None
+
+    # A second change is checked against the new hash, not a cached old one
+    response = client.put(
+        "/api/users/me/password", json={"current_password": "N3w-Secret!", "new_password": PASSWORD}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert client.post("/api/login", json={"email": email, "password": PASSWORD}).status_code == 200
+
+
+def test_wrong_current_password_changes_nothing(client, published):
+    headers, email = signed_in(client)
+    response = client.put(
+        "/api/users/me/password", json={"current_password": "wrong", "new_password": "N3w-Secret!"}, headers=headers
+    )
+    assert response.status_code == 400
+    assert published == []
+    assert cached(client, email) is not None
+    assert client.post("/api/login", json={"email": email, "password": PASSWORD}).status_code == 200
+
+
+def test_account_deletion_evicts_the_cached_user(client, published):
+    headers, email = signed_in(client)
+    assert client.delete("/api/users/me", headers=headers).status_code == 202
+    assert published == [email]
+    assert cached(client, email) is None
+    # The same token stops working at once instead of after the cache TTL
+    assert client.get("/api/users/me", headers=headers).status_code == 401